@@ -1,36 +1,79 @@
 import streamlit as st
 from datetime import datetime
-import pandas as pd
 
-# Importa i moduli
-from modules.auth import check_password
-from modules.backend import GitHubBackend
-from modules.activities import get_all_activities
-from modules.intelligence import SuggestionEngine
-from modules.analytics import AnalyticsEngine
+# Solo quello che serve alla pagina di login: il resto si importa dopo l'autenticazione
+from modules.auth import check_password, get_cipher, logout, change_password_form
+from modules import telemetry, warmup
 
 # --- CONFIGURAZIONE ---
 st.set_page_config(page_title="Life Logger", page_icon="📓", layout="centered")
 
+# Misura dei tempi del rerun: per gli admin (pannello) o se c'è un exporter configurato
+exporter = telemetry.get_exporter()
+show_timings = telemetry.is_admin(st.session_state.get("username"))
+telemetry.begin_run(show_timings or exporter is not None, exporter)
+
 # 1. Sicurezza
 # MODIFICA FONDAMENTALE 1: Catturiamo l'utente che ha fatto login
 current_user = check_password()
 
 if not current_user:
+    # Mentre l'utente inserisce le credenziali, gli import pesanti partono in background
+    warmup.start()
     st.stop()
 
+# Moduli dell'app (pandas, PyGithub, crittografia): già in memoria dopo il primo login del processo
+import pandas as pd
+from modules.storage import get_storage, get_write_queue
+from modules.activities import get_all_activities
+from modules.entry_ids import new_id
+from modules.intelligence import SuggestionEngine
+from modules.analytics import AnalyticsEngine
+from modules import schema, transfer
+from modules.session_data import RECENT_DAYS, load_session_data, set_snapshot, with_queued
+
+cipher = get_cipher()
+if cipher is None:
+    # Sessione senza chiave (es. cache svuotata): serve un nuovo login
+    logout()
+    st.rerun()
+
 # 2. Inizializzazione Backend
 # MODIFICA FONDAMENTALE 2: Passiamo l'utente al backend per aprire il file giusto
-backend = GitHubBackend(username=current_user)
+# (GitHub o SQLite locale, secondo STORAGE nei secrets)
+backend = get_storage().backend(current_user, cipher)
+write_queue = get_write_queue()
 
-# Cache dei dati per velocità (si ricarica solo se svuoti la cache o ricarichi pagina)
+with st.sidebar:
+    pending = write_queue.pending_count(current_user)
+    if pending:
+        st.caption(f"⏳ {pending} attività in sincronizzazione con GitHub")
+    sync_error = write_queue.last_error(current_user)
+    if sync_error:
+        st.warning(f"Sincronizzazione in ritardo, riprovo a breve ({sync_error})")
+    with st.expander("🔑 Cambia password"):
+        change_password_form(current_user)
+    if st.button("Esci 🔒"):
+        with st.spinner("Sincronizzazione in corso..."):
+            write_queue.flush(current_user)
+        logout()
+        st.rerun()
+
+# Dati per il Diario: di solito li ha già caricati il login (vedi auth.authenticate_user)
 if 'data_snapshot' not in st.session_state:
     with st.spinner(f"Decriptazione dati di {current_user}..."):
-        st.session_state['data_snapshot'] = backend.load_data()
+        try:
+            load_session_data(backend, current_user)
+        except Exception as e:
+            # Meglio fermarsi che mostrare una storia vuota (e salvarci sopra)
+            st.error(f"Impossibile leggere i tuoi dati: {e}")
+            st.stop()
 
 df = st.session_state['data_snapshot']
 
 st.title(f"📓 Life Logger ({current_user})")
+if 'flash' in st.session_state:
+    st.toast(st.session_state.pop('flash'))
 
 # --- UI TABS ---
 tab_log, tab_stats, tab_raw = st.tabs(["⚡ Diario", "📈 Statistiche", "💾 Dati"])
@@ -74,7 +117,8 @@ with tab_log:
     
     with st.form("main_log_form", clear_on_submit=True):
         # Renderizza UI specifica
-        data_collected = selected_activity.render_ui(df)
+        with telemetry.span("activity.render_ui"):
+            data_collected = selected_activity.render_ui(df)
         
         # Sovrascrivi dettaglio se suggerito (hack rapido per prefill)
         if 'prefill_detail' in st.session_state and st.session_state.get('prefill_activity') == selected_name:
@@ -95,36 +139,139 @@ with tab_log:
                 # Combina la data scelta con l'ora attuale (per mantenere l'ordine cronologico preciso)
                 chosen_date = data_collected["custom_date"]
                 current_time = datetime.now().time()
-                final_timestamp = datetime.combine(chosen_date, current_time).strftime("%Y-%m-%d %H:%M:%S")
+                final_timestamp = datetime.combine(chosen_date, current_time).strftime(schema.TS_FORMAT)
                 
                 # Rimuovi la chiave temporanea 'custom_date' per non salvarla sporca nel DB
                 del data_collected["custom_date"]
             else:
-                final_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                final_timestamp = datetime.now().strftime(schema.TS_FORMAT)
 
             # 2. Costruisci l'entry
+            # Stesso contenuto inviato di nuovo a pochi secondi (doppio click): stesso id,
+            # così il backend lo riconosce e non lo duplica
+            content_key = (selected_name, notes, repr(sorted(data_collected.items(), key=str)))
+            last_submit = st.session_state.get('last_submit')
+            if last_submit and last_submit[0] == content_key and (datetime.now() - last_submit[1]).total_seconds() < 5:
+                entry_id = last_submit[2]
+            else:
+                entry_id = new_id()
+            st.session_state['last_submit'] = (content_key, datetime.now(), entry_id)
+
             entry = {
+                "id": entry_id,
                 "timestamp": final_timestamp,
                 "activity_type": selected_name,
                 "note": notes,
                 **data_collected # Qui dentro ora c'è anche 'pagine_totali'
             }
             
-            with st.spinner("Salvataggio in corso..."):
-                # ... resto del codice di salvataggio uguale a prima ...
-                if backend.save_entry(entry):
-                    st.success("Salvato!")
-                    del st.session_state['data_snapshot'] # Invalida cache locale
-                    st.rerun() # Ricarica pagina per vedere dati aggiornati
+            # Salvataggio write-behind: la coda scrive su GitHub in background
+            # (più entry ravvicinate finiscono nello stesso commit)
+            write_queue.enqueue(current_user, cipher, entry)
+
+            # Aggiornamento ottimistico dello snapshot locale, senza ricaricare da GitHub
+            if 'id' not in df.columns or entry_id not in df['id'].values:
+                new_row = schema.from_records([entry])
+                set_snapshot(schema.concat([df, new_row]))
+                if 'full_snapshot' in st.session_state:
+                    st.session_state['full_snapshot'] = schema.concat([st.session_state['full_snapshot'], new_row])
+                st.session_state['aggregates'].add(entry)
+            st.session_state['flash'] = "Salvato! ✅"
+            st.rerun()
 
 # TAB 2: ANALYTICS
 with tab_stats:
-    analytics = AnalyticsEngine(df)
+    analytics = AnalyticsEngine(st.session_state['aggregates'])
     analytics.render_summary()
 
 # TAB 3: RAW DATA
 with tab_raw:
-    st.dataframe(df.sort_values(by="timestamp", ascending=False) if not df.empty else pd.DataFrame())
+    # Lo storico completo si scarica solo quando serve davvero
+    if 'full_snapshot' in st.session_state:
+        raw_df = st.session_state['full_snapshot']
+    else:
+        raw_df = df
+        st.caption(f"Ultimi {RECENT_DAYS} giorni e storico delle letture.")
+        if st.button("📂 Carica tutto lo storico"):
+            with st.spinner("Caricamento storico completo..."):
+                st.session_state['full_snapshot'] = with_queued(backend.load_data(), write_queue.pending_entries(current_user))
+            st.rerun()
+    st.dataframe(raw_df.sort_values(by="timestamp", ascending=False) if not raw_df.empty else pd.DataFrame())
+
+    # Eliminazione puntuale: l'indice id (ids.enc) individua l'unico chunk da riscrivere
+    if not raw_df.empty:
+        with st.expander("🗑️ Elimina una voce"):
+            recent = raw_df.sort_values(by="timestamp", ascending=False).head(50)
+            # Anche le entry storiche senza id salvato: il loro id è quello di contenuto
+            recent_ids = schema.row_ids(recent)
+            labels = {eid: f"{row['timestamp']} · {row['activity_type']} · {row.get('dettaglio', '')}"
+                      for eid, (_, row) in zip(recent_ids, recent.iterrows())}
+            to_delete = st.selectbox("Voce", list(labels), format_func=labels.get)
+            if st.button("Elimina", type="secondary"):
+                with st.spinner("Eliminazione in corso..."):
+                    # Prima le entry in coda: quella da eliminare potrebbe essere ancora lì
+                    write_queue.flush(current_user)
+                    deleted = backend.delete_entry(to_delete)
+                if deleted:
+                    removed = recent[recent_ids == to_delete].iloc[0].to_dict()
+                    st.session_state['aggregates'].remove(removed)
+                    set_snapshot(df[schema.row_ids(df) != to_delete] if not df.empty else df)
+                    if 'full_snapshot' in st.session_state:
+                        full = st.session_state['full_snapshot']
+                        st.session_state['full_snapshot'] = full[schema.row_ids(full) != to_delete]
+                    st.session_state['flash'] = "Voce eliminata 🗑️"
+                else:
+                    st.session_state['flash'] = "Voce non trovata."
+                st.rerun()
+
+    # Export/import: lo storico passa un chunk alla volta, mai tutto in memoria due volte
+    with st.expander("⇅ Esporta / Importa"):
+        col_csv, col_parquet = st.columns(2)
+        with col_csv:
+            st.download_button("⬇️ CSV", data=lambda: transfer.export_csv(backend.iter_frames()),
+                               file_name="life_logger.csv", mime="text/csv", on_click="ignore")
+        with col_parquet:
+            if transfer.parquet_available():
+                st.download_button("⬇️ Parquet", data=lambda: transfer.export_parquet(backend.iter_frames()),
+                                   file_name="life_logger.parquet", mime="application/octet-stream", on_click="ignore")
+
+        uploaded = st.file_uploader("Importa CSV", type="csv")
+        if uploaded is not None and st.button("Importa"):
+            with st.spinner("Importazione in corso..."):
+                write_queue.flush(current_user)
+                report = transfer.import_csv(uploaded, backend)
+            st.session_state['import_report'] = report
+            st.session_state.pop('data_snapshot', None)
+            st.session_state.pop('full_snapshot', None)
+            st.rerun()
+
+        report = st.session_state.pop('import_report', None)
+        if report:
+            st.success(f"Importate {report['imported']} righe su {report['rows']} "
+                       f"({report['rows_per_second']:.0f} righe/s), già presenti {report['duplicates']}, "
+                       f"scartate {report['rejected']}.")
+            for line, error in report['errors']:
+                st.caption(f"Riga {line}: {error}")
+
     if st.button("Forza Ricaricamento Dati"):
         del st.session_state['data_snapshot']
-        st.rerun()
\ No newline at end of file
+        st.session_state.pop('full_snapshot', None)
+        st.rerun()
+
+# Pannello tempi (solo admin): dove è andato il tempo di questo rerun
+if show_timings:
+    with st.sidebar.expander("⏱️ Tempi e memoria"):
+        st.caption(f"Totale: {telemetry.elapsed_ms():.0f} ms (gli span annidati si sommano anche al padre)")
+        st.dataframe(
+            pd.DataFrame(telemetry.breakdown(), columns=["span", "chiamate", "ms"]).round({"ms": 1}),
+            hide_index=True,
+        )
+        cache = get_storage().cache_stats()
+        if cache:
+            st.caption(f"Cache chunk decodificati: {cache['bytes'] / 2**20:.1f} / {cache['max_bytes'] / 2**20:.0f} MB, "
+                       f"{cache['entries']} chunk, hit {cache['hit_ratio']:.0%}, {cache['evictions']} sfratti")
+            st.dataframe(
+                pd.DataFrame([(u, b / 2**20) for u, b in cache['bytes_per_user'].items()], columns=["utente", "MB"]).round(2),
+                hide_index=True,
+            )
+telemetry.finish_run()
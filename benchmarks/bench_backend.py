@@ -0,0 +1,58 @@
+"""
+Backend su FakeRepo: caricamento (cache a freddo, blob in cache, chunk già
+decodificati, solo ultimi giorni) e salvataggio di una entry in coda a uno
+storico di N entry.
+
+Uso:  python -m pytest benchmarks/bench_backend.py
+"""
+import tempfile
+from datetime import datetime, timedelta
+
+from modules.entry_ids import new_id
+from modules.schema import TS_FORMAT
+from modules.snapshot_cache import SnapshotCache
+
+
+def test_load_data_cold_cache(history, run):
+    # Ogni giro parte da cache vuote: tutti i blob vanno "scaricati" e decodificati
+    state = {}
+
+    def setup():
+        state["backend"] = history.backend(tempfile.mkdtemp(prefix="bench-cold-"), SnapshotCache())
+
+    run(lambda: state["backend"].load_data(), n=history.n, setup=setup)
+
+
+def test_load_data_warm_cache(history, run):
+    # Blob su disco, ma da decriptare e decodificare (es. dopo un riavvio)
+    history.backend().load_data()
+    state = {}
+
+    def setup():
+        state["backend"] = history.backend(snapshot_cache=SnapshotCache())
+
+    run(lambda: state["backend"].load_data(), n=history.n, setup=setup)
+
+
+def test_load_data_snapshot_cache(history, run):
+    # Chunk già decodificati da un'altra sessione dello stesso utente
+    history.backend().load_data()
+    run(lambda: history.backend().load_data(), n=history.n)
+
+
+def test_load_recent_days(history, run):
+    # Solo gli ultimi 30 giorni: i chunk sigillati più vecchi vengono saltati
+    since = datetime.now() - timedelta(days=30)
+    run(lambda: history.backend().load_data(since=since), n=history.n)
+
+
+def test_save_entry(history, run):
+    backend = history.backend()
+
+    def save():
+        entry = {"id": new_id(), "timestamp": datetime.now().strftime(TS_FORMAT),
+                 "activity_type": "💪 Sport", "note": "", "dettaglio": "Corsa",
+                 "metrica": 30, "unita": "minuti"}
+        assert backend.save_entry(entry)
+
+    run(save, n=history.n)
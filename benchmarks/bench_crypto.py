@@ -0,0 +1,39 @@
+"""
+Cifratura, decifratura (formato a frame) e compressione di uno storico
+serializzato di N entry.
+Il test di compressione riporta in extra_info il rapporto ottenuto e i MB
+salvati nel repo per tutto lo storico.
+
+Uso:  python -m pytest benchmarks/bench_crypto.py
+"""
+import json
+
+import pytest
+
+from modules import crypto_utils
+from modules.crypto_utils import encrypt_bytes, open_decrypted
+
+
+@pytest.fixture
+def payload(history):
+    return json.dumps(history.entries, ensure_ascii=False).encode()
+
+
+def test_encrypt_bytes(history, payload, run):
+    run(encrypt_bytes, payload, history.cipher, n=history.n)
+
+
+def test_open_decrypted(history, payload, run):
+    # Come lo legge il backend: decifratura e decompressione un frame alla volta
+    blob = encrypt_bytes(payload, history.cipher)
+    run(lambda: open_decrypted(blob, history.cipher).read(), n=history.n)
+
+
+def test_compress_payload(history, benchmark, run):
+    raw = json.dumps(history.entries, ensure_ascii=False).encode()
+    packed = crypto_utils.compress_payload(raw)
+    benchmark.extra_info["ratio"] = round(len(raw) / len(packed), 2)
+    # Storico salvato dal vero append_entries: byte nel repo (chunk + manifest + aggregati)
+    benchmark.extra_info["stored_mb"] = round(history.repo.stored_bytes() / 2**20, 2)
+    run(crypto_utils.compress_payload, raw, n=history.n)
+    assert crypto_utils.decompress_payload(packed) == raw
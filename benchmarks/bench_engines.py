@@ -0,0 +1,33 @@
+"""
+Motori dell'interfaccia sulla storia completa di N entry: libreria delle
+letture, suggerimenti, aggregati e statistiche.
+
+Uso:  python -m pytest benchmarks/bench_engines.py
+"""
+import streamlit as st
+
+from modules.activities import ReadingActivity
+from modules.aggregates import AggregateStore
+from modules.analytics import AnalyticsEngine
+from modules.intelligence import SuggestionEngine
+
+
+def test_analyze_library(history, run):
+    df = history.frame
+    activity = ReadingActivity()
+    # Senza la memoizzazione di sessione: misuriamo il calcolo vero
+    run(activity._analyze_library, df, n=history.n, setup=lambda: st.session_state.pop('_library_cache', None))
+
+
+def test_get_prompts(history, run):
+    df = history.frame
+    run(lambda: SuggestionEngine(df).get_prompts(), n=history.n)
+
+
+def test_aggregates_rebuild(history, run):
+    run(AggregateStore.from_frame, history.frame, n=history.n)
+
+
+def test_render_summary(history, run):
+    aggregates = AggregateStore.from_frame(history.frame)
+    run(lambda: AnalyticsEngine(aggregates).render_summary(), n=history.n)
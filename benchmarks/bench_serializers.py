@@ -0,0 +1,35 @@
+"""
+Confronto YAML vs formato colonnare: tempo di dump/parse di uno storico di N
+entry. La dimensione del blob serializzato è in extra_info (`blob_mb`).
+
+Uso:  python -m pytest benchmarks/bench_serializers.py
+"""
+import io
+
+import pytest
+
+from modules import serializers
+
+SERIALIZERS = [serializers.YAML, serializers.COLUMNAR]
+# YAML costa ~0.3 s ogni 1000 entry: oltre la soglia il confronto si vede già
+YAML_MAX_ENTRIES = 10_000
+
+
+@pytest.fixture(params=SERIALIZERS, ids=lambda s: s.name)
+def serializer(request, history):
+    if request.param is serializers.YAML and history.n > YAML_MAX_ENTRIES:
+        pytest.skip(f"YAML oltre {YAML_MAX_ENTRIES} entry")
+    return request.param
+
+
+def test_dumps(history, serializer, benchmark, run):
+    benchmark.extra_info["blob_mb"] = round(len(serializer.dumps(history.entries)) / 2**20, 2)
+    run(serializer.dumps, history.entries, n=history.n)
+
+
+def test_read_columns(history, serializer, run):
+    raw = serializer.dumps(history.entries)
+    columns, detected = serializers.read_columns(io.BufferedReader(io.BytesIO(raw)))
+    assert detected is serializer
+    assert len(serializers.columns_to_records(columns)) == history.n
+    run(lambda: serializers.read_columns(io.BufferedReader(io.BytesIO(raw))), n=history.n)
@@ -0,0 +1,17 @@
+"""
+Avvio a freddo: import e primo render della pagina di login, ognuno in un
+processo nuovo (vedi benchmarks.startup). Il tempo misurato è quello dei due
+processi; le singole misure sono in extra_info.
+
+Uso:  python -m pytest benchmarks/bench_startup.py
+"""
+from benchmarks import startup
+
+
+def test_cold_start(benchmark):
+    rounds = []
+    benchmark.pedantic(lambda: rounds.append(startup.measure()), rounds=3, iterations=1)
+    result = startup.summarize(rounds)
+    benchmark.extra_info.update({k: round(v, 1) for k, v in result.items() if isinstance(v, float)})
+    # La pagina di login non deve tirarsi dietro pandas né PyGithub
+    assert result["login_heavy_modules"] == []
@@ -0,0 +1,133 @@
+"""
+Fixture comuni dei benchmark.
+
+Gli storici sintetici (uno per dimensione in BENCH_SIZES) vengono scritti una
+volta sola per sessione in un FakeRepo, passando dal vero append_entries:
+chunk, manifest e cifratura sono quelli di produzione, manca solo la rete.
+Oltre ai tempi di pytest-benchmark ogni test registra il picco di memoria
+(tracemalloc, su un'esecuzione a parte), riassunto in fondo al report.
+"""
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+from unittest import mock
+
+import pytest
+from cryptography.fernet import Fernet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import backend as backend_module  # noqa: E402
+from modules.blob_cache import BlobCache  # noqa: E402
+from modules.crypto_utils import DataCipher  # noqa: E402
+from modules.snapshot_cache import SnapshotCache  # noqa: E402
+from benchmarks.fake_github import FakeRepo  # noqa: E402
+from benchmarks.synthetic import generate  # noqa: E402
+
+SIZES = [int(s) for s in os.environ.get("BENCH_SIZES", "1000,10000,100000,1000000").split(",") if s]
+USERNAME = "bench"
+
+# Streamlit fuori da `streamlit run` avvisa a ogni widget: nei benchmark è solo rumore
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+_peaks = []
+
+
+class History:
+    """Storico sintetico di `n` entry già salvato in un FakeRepo."""
+
+    def __init__(self, n: int):
+        self.n = n
+        self.repo = FakeRepo()
+        self.cipher = DataCipher([Fernet.generate_key()])
+        self.entries = generate(n)
+        self.cache_dir = tempfile.mkdtemp(prefix=f"bench-{n}-")
+        self.snapshot_cache = SnapshotCache(4 * 1024 ** 3)
+        self.backend().append_entries(self.entries)
+        self._frame = None
+
+    def backend(self, cache_dir: str = None, snapshot_cache: SnapshotCache = None):
+        """
+        Backend reale sul FakeRepo. Con una `cache_dir` nuova si simula la cache
+        dei blob a freddo, con una `snapshot_cache` nuova quella dei chunk decodificati.
+        """
+        blobs = BlobCache(cache_dir or self.cache_dir)
+        snapshots = snapshot_cache or self.snapshot_cache
+        with mock.patch.object(backend_module, "get_blob_cache", lambda: blobs), \
+                mock.patch.object(backend_module, "get_snapshot_cache", lambda: snapshots), \
+                mock.patch.object(backend_module, "load_compression_dictionaries", lambda: 0):
+            backend = backend_module.GitHubBackend(USERNAME, self.cipher)
+        backend._repo = self.repo
+        return backend
+
+    @property
+    def frame(self):
+        """Storia completa come la carica l'app (calcolata una volta sola)."""
+        if self._frame is None:
+            self._frame = self.backend().load_data()
+        return self._frame
+
+
+_histories = {}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _offline():
+    # Nessuna chiamata a GitHub per il rate limit
+    with mock.patch.object(backend_module, "has_headroom", lambda *a, **k: True):
+        yield
+
+
+@pytest.fixture(params=SIZES, ids=lambda n: f"{n}")
+def history(request) -> History:
+    n = request.param
+    if n not in _histories:
+        _histories.clear()  # uno storico alla volta: quello da 1M pesa
+        _histories[n] = History(n)
+    return _histories[n]
+
+
+def rounds_for(n: int) -> int:
+    return max(1, min(10, 100_000 // n))
+
+
+@pytest.fixture
+def run(benchmark, request):
+    """
+    run(fn, *args, n=..., setup=None): picco di memoria su un'esecuzione
+    tracciata, poi i tempi con benchmark.pedantic. `setup` viene chiamato
+    prima di ogni esecuzione, fuori dalla misura.
+    """
+    def runner(fn, *args, n, setup=None):
+        if rounds_for(n) > 1:
+            # Giro di riscaldamento (import pigri, cache): fuori dal picco di memoria
+            if setup:
+                setup()
+            fn(*args)
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            fn(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_mb"] = round(peak / 2**20, 2)
+        _peaks.append((request.node.nodeid.split("::")[-1], peak))
+
+        def pedantic_setup():
+            if setup:
+                setup()
+            return args, {}
+        return benchmark.pedantic(fn, setup=pedantic_setup, rounds=rounds_for(n), iterations=1)
+    return runner
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _peaks:
+        return
+    terminalreporter.section("picco di memoria (tracemalloc)")
+    width = max(len(name) for name, _ in _peaks)
+    for name, peak in _peaks:
+        terminalreporter.write_line(f"{name:<{width}}  {peak / 2**20:>10.1f} MB")
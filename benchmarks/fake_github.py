@@ -0,0 +1,106 @@
+"""
+Finto repository PyGithub in memoria, per benchmark senza rete.
+
+Implementa solo i metodi usati da backend e auth, con la stessa semantica
+degli SHA di GitHub: update_file con uno SHA vecchio dà 409, create_file su
+un file esistente dà 422, gli SHA sono quelli dei blob git (quindi la cache
+su disco li verifica come quelli veri), il listing di una cartella si ferma
+a listing_limit file come la contents API. Conta le chiamate per metodo.
+"""
+import base64
+from collections import Counter
+from types import SimpleNamespace
+
+from github import GithubException, UnknownObjectException
+from modules.blob_cache import git_blob_sha
+
+
+class FakeContentFile:
+    def __init__(self, repo, path, sha):
+        self._repo = repo
+        self.path = path
+        self.sha = sha
+        self.type = "file"
+
+    @property
+    def decoded_content(self) -> bytes:
+        return self._repo._blobs[self.sha]
+
+    @property
+    def size(self) -> int:
+        return len(self.decoded_content)
+
+    def update(self) -> bool:
+        """Come ContentFile.update(): True se il file è cambiato (GET condizionale)."""
+        self._repo.calls["get_contents"] += 1
+        current = self._repo._files.get(self.path)
+        if current is None:
+            raise UnknownObjectException(404, {"message": "Not Found"}, {})
+        changed = current != self.sha
+        self.sha = current
+        return changed
+
+
+class FakeRepo:
+    # Massimo di file nel listing di una cartella (contents API di GitHub)
+    listing_limit = 1000
+
+    def __init__(self):
+        self._files = {}  # path -> sha
+        self._blobs = {}  # sha -> contenuto
+        self.calls = Counter()
+
+    # --- LETTURA ---
+    def get_contents(self, path, ref=None):
+        self.calls["get_contents"] += 1
+        path = path.rstrip("/")
+        if path in self._files:
+            return FakeContentFile(self, path, self._files[path])
+        prefix = path + "/"
+        listing = [FakeContentFile(self, p, sha) for p, sha in sorted(self._files.items())
+                   if p.startswith(prefix) and "/" not in p[len(prefix):]][:self.listing_limit]
+        if not listing:
+            raise UnknownObjectException(404, {"message": "Not Found"}, {})
+        return listing
+
+    def get_git_blob(self, sha):
+        self.calls["get_git_blob"] += 1
+        if sha not in self._blobs:
+            raise UnknownObjectException(404, {"message": "Not Found"}, {})
+        return SimpleNamespace(sha=sha, content=base64.b64encode(self._blobs[sha]).decode(), encoding="base64")
+
+    # --- SCRITTURA ---
+    def create_file(self, path, message, content, branch=None):
+        self.calls["create_file"] += 1
+        if path in self._files:
+            raise GithubException(422, {"message": "sha wasn't supplied"}, {})
+        return self._put(path, content)
+
+    def update_file(self, path, message, content, sha, branch=None):
+        self.calls["update_file"] += 1
+        if self._files.get(path) != sha:
+            raise GithubException(409, {"message": f"{path} does not match {sha}"}, {})
+        return self._put(path, content)
+
+    def delete_file(self, path, message, sha, branch=None):
+        self.calls["delete_file"] += 1
+        if self._files.get(path) != sha:
+            raise GithubException(409, {"message": f"{path} does not match {sha}"}, {})
+        del self._files[path]
+        return {"commit": SimpleNamespace(sha=None)}
+
+    def _put(self, path, content):
+        if isinstance(content, str):
+            content = content.encode()
+        sha = git_blob_sha(content)
+        self._blobs[sha] = content
+        self._files[path] = sha
+        return {"content": FakeContentFile(self, path, sha), "commit": SimpleNamespace(sha=None)}
+
+    # --- UTILITÀ PER I BENCHMARK ---
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def stored_bytes(self, prefix: str = "") -> int:
+        return sum(len(self._blobs[sha]) for p, sha in self._files.items() if p.startswith(prefix))
@@ -0,0 +1,284 @@
+"""
+Finta API GitHub via HTTP locale, per i test di carico.
+
+A differenza di FakeRepo (chiamato direttamente) qui passa tutto dal vero
+client PyGithub: sessione requests, pool di connessioni, GithubRetry, ETag e
+304. Implementa solo gli endpoint usati dall'app:
+
+    GET    /repos/{owner}/{repo}/contents/{path}   file o listing (ETag, 304)
+    PUT    /repos/{owner}/{repo}/contents/{path}   create/update (422/409)
+    DELETE /repos/{owner}/{repo}/contents/{path}
+    GET    /repos/{owner}/{repo}/git/blobs/{sha}
+    GET    /rate_limit
+
+Lo stato sta in un FakeRepo (stessa semantica degli SHA). Configurabili:
+- latenza per richiesta (più un jitter casuale);
+- limite primario: richieste per finestra (5000/ora come GitHub); oltre si
+  risponde 403 "API rate limit exceeded" e PyGithub aspetta il reset;
+- limite secondario sulle scritture (80/minuto come GitHub): 403 con Retry-After.
+Le risposte 304 non consumano quota, come su GitHub.
+"""
+import base64
+import json
+import random
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from github import GithubException, UnknownObjectException
+from benchmarks.fake_github import FakeRepo
+
+PRIMARY_MESSAGE = "API rate limit exceeded for user ID 1."
+SECONDARY_MESSAGE = "You have exceeded a secondary rate limit. Please wait a few minutes before you try again."
+
+
+def file_kind(path: str) -> str:
+    """Tipo di file per le statistiche dei conflitti (users.yaml, manifest, chunk...)."""
+    name = path.rsplit("/", 1)[-1]
+    return "chunk_*.enc" if name.startswith("chunk_") else name
+
+
+class _Window:
+    """Contatore a finestra fissa (come X-RateLimit-Reset di GitHub)."""
+
+    def __init__(self, limit: int, seconds: float):
+        self.limit = limit
+        self.seconds = seconds
+        self.used = 0
+        self.reset = time.time() + seconds
+
+    def _roll(self, now):
+        if now >= self.reset:
+            self.used = 0
+            self.reset = now + self.seconds
+
+    def take(self) -> bool:
+        """Consuma una richiesta; False se la finestra è esaurita (limit 0 = illimitato)."""
+        now = time.time()
+        self._roll(now)
+        if self.limit and self.used >= self.limit:
+            return False
+        self.used += 1
+        return True
+
+    def remaining(self) -> int:
+        self._roll(time.time())
+        return max(0, self.limit - self.used) if self.limit else 1_000_000
+
+
+class GitHubAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, repo: FakeRepo = None, latency_ms: float = 0, jitter_ms: float = 0,
+                 rate_limit: int = 5000, rate_window: float = 3600,
+                 write_limit: int = 80, write_window: float = 60, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.repo = repo or FakeRepo()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._lock = threading.Lock()
+        self._thread = None
+        self.set_limits(rate_limit, rate_window, write_limit, write_window)
+        self.reset_stats()
+
+    def set_limits(self, rate_limit: int, rate_window: float, write_limit: int, write_window: float):
+        """Limite primario (tutte le richieste) e secondario (scritture); 0 = illimitato."""
+        with self._lock:
+            self.primary = _Window(rate_limit, rate_window)
+            self.secondary = _Window(write_limit, write_window)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # --- CICLO DI VITA ---
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="github-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- STATISTICHE ---
+    def reset_stats(self):
+        with self._lock:
+            self.requests = Counter()   # "GET contents" -> richieste
+            self.statuses = Counter()   # 200/201/304/403/404/409/422 -> risposte
+            self.writes = Counter()     # tipo di file -> PUT/DELETE
+            self.conflicts = Counter()  # tipo di file -> 409/422
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "statuses": dict(self.statuses),
+                "writes": dict(self.writes),
+                "conflicts": dict(self.conflicts),
+                "total": sum(self.requests.values()),
+                "rate_limited": self.statuses[403],
+                "rate_remaining": self.primary.remaining(),
+            }
+
+    def _record(self, route, status, path=None, write=False):
+        with self._lock:
+            self.requests[route] += 1
+            self.statuses[status] += 1
+            if write:
+                self.writes[file_kind(path)] += 1
+                if status in (409, 422):
+                    self.conflicts[file_kind(path)] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, come api.github.com
+    # Header e corpo partono in due write: con Nagle ogni risposta aspetterebbe l'ACK ritardato
+    disable_nagle_algorithm = True
+    server: GitHubAPIServer
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    # --- INSTRADAMENTO ---
+    def _dispatch(self, method):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        parsed = urllib.parse.urlsplit(self.path)
+        parts = parsed.path.strip("/").split("/")
+
+        delay = server.latency_ms + random.uniform(0, server.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+
+        if parts == ["rate_limit"]:
+            return self._rate_limit()
+        if len(parts) < 4 or parts[0] != "repos":
+            return self._send(404, {"message": "Not Found"}, route=f"{method} ?")
+        self.base = f"{server.url}/repos/{parts[1]}/{parts[2]}"
+        endpoint, rest = parts[3], urllib.parse.unquote("/".join(parts[4:]))
+        route = f"{method} {endpoint}" + ("/blobs" if endpoint == "git" else "")
+        write = method in ("PUT", "DELETE")
+
+        if endpoint == "contents" and method == "GET" and self._not_modified(rest):
+            # Le richieste condizionali con 304 non consumano quota
+            return self._send(304, None, route=route)
+        with server._lock:
+            allowed = server.primary.take()
+            throttled = allowed and write and not server.secondary.take()
+        if not allowed:
+            return self._send(403, {"message": PRIMARY_MESSAGE}, route=route)
+        if throttled:
+            return self._send(403, {"message": SECONDARY_MESSAGE}, route=route,
+                              headers={"Retry-After": str(max(1, int(server.secondary.reset - time.time())))})
+
+        try:
+            if endpoint == "contents" and method == "GET":
+                return self._get_contents(rest, route)
+            if endpoint == "contents" and method == "PUT":
+                return self._put_contents(rest, body, route)
+            if endpoint == "contents" and method == "DELETE":
+                with server._lock:
+                    server.repo.delete_file(rest, body.get("message"), body.get("sha"))
+                return self._send(200, {"content": None, "commit": self._commit()}, route=route, path=rest, write=True)
+            if endpoint == "git" and rest.startswith("blobs/") and method == "GET":
+                with server._lock:
+                    blob = server.repo.get_git_blob(rest[len("blobs/"):])
+                return self._send(200, {"sha": blob.sha, "content": blob.content, "encoding": "base64",
+                                        "size": len(base64.b64decode(blob.content)),
+                                        "url": f"{self.base}/git/blobs/{blob.sha}"}, route=route)
+        except UnknownObjectException:
+            return self._send(404, {"message": "Not Found"}, route=route, path=rest, write=write)
+        except GithubException as e:
+            return self._send(e.status, e.data, route=route, path=rest, write=write)
+        return self._send(404, {"message": "Not Found"}, route=route)
+
+    def _not_modified(self, path) -> bool:
+        etag = self.headers.get("If-None-Match")
+        if not etag:
+            return False
+        with self.server._lock:
+            sha = self.server.repo._files.get(path)
+        return sha is not None and etag == f'"{sha}"'
+
+    def _get_contents(self, path, route):
+        with self.server._lock:
+            result = self.server.repo.get_contents(path)
+            if isinstance(result, list):
+                listing = [self._content(item.path, item.sha) for item in result]
+            else:
+                data = self._content(path, result.sha, result.decoded_content)
+        if isinstance(result, list):
+            return self._send(200, listing, route=route)
+        return self._send(200, data, route=route, headers={"ETag": f'"{result.sha}"'})
+
+    def _put_contents(self, path, body, route):
+        content = base64.b64decode(body.get("content", ""))
+        with self.server._lock:
+            if body.get("sha"):
+                result = self.server.repo.update_file(path, body.get("message"), content, body["sha"])
+                status = 200
+            else:
+                result = self.server.repo.create_file(path, body.get("message"), content)
+                status = 201
+        sha = result["content"].sha
+        return self._send(status, {"content": self._content(path, sha), "commit": self._commit()},
+                          route=route, path=path, write=True)
+
+    def _rate_limit(self):
+        window = self.server.primary
+        core = {"limit": window.limit, "remaining": window.remaining(), "reset": int(window.reset),
+                "used": window.used, "resource": "core"}
+        self._send(200, {"resources": {"core": core}, "rate": core}, route="GET rate_limit")
+
+    # --- RISPOSTE ---
+    def _content(self, path, sha, content: bytes = None) -> dict:
+        data = {
+            "type": "file", "name": path.rsplit("/", 1)[-1], "path": path, "sha": sha,
+            "size": len(self.server.repo._blobs.get(sha, b"")),
+            "url": f"{self.base}/contents/{urllib.parse.quote(path)}",
+            "git_url": f"{self.base}/git/blobs/{sha}",
+        }
+        if content is not None:
+            data.update(content=base64.b64encode(content).decode(), encoding="base64")
+        return data
+
+    def _commit(self) -> dict:
+        sha = "%040x" % random.getrandbits(160)
+        return {"sha": sha, "url": f"{self.base}/git/commits/{sha}"}
+
+    def _send(self, status, data, route, path=None, write=False, headers=None):
+        self.server._record(route, status, path, write)
+        window = self.server.primary
+        payload = b"" if data is None else json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-RateLimit-Limit", str(window.limit))
+        self.send_header("X-RateLimit-Remaining", str(window.remaining()))
+        self.send_header("X-RateLimit-Reset", str(int(window.reset)))
+        self.send_header("X-RateLimit-Resource", "core")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if payload:
+            self.wfile.write(payload)
@@ -0,0 +1,380 @@
+"""
+Test di carico: N utenti simulati con più sessioni contemporanee sullo stesso
+repo e lo stesso token, contro la finta API HTTP di github_server.
+
+    python -m benchmarks.loadtest --users 20 --sessions 2 --ops 20 --latency-ms 80
+
+Fasi:
+1. registrazione di tutti gli utenti in parallelo (register_user): tutti
+   scrivono users.yaml, quindi è qui che si vedono i conflitti sullo SHA;
+2. storico iniziale di --history entry per utente (non misurato, senza latenza);
+3. per ogni sessione: login (authenticate_user: bcrypt, KDF e primo caricamento
+   dei dati in sessione, cioè il tempo fino alla dashboard) e poi --ops
+   operazioni, load_data o save_entry (in proporzione --save-ratio).
+
+Il codice misurato è quello dell'app: auth, keystore, GitHubStorage e
+GitHubBackend con il client PyGithub di produzione (pool, retry sui rate
+limit). Di Streamlit si sostituisce solo `st` dentro auth e session_data, per
+avere un session_state per sessione simulata.
+
+Il report dà throughput, latenze (p50/p95/p99/max), chiamate API per
+operazione, conflitti per file, risposte di rate limit, CPU del processo e
+il tempo medio per span (crypto.bcrypt, crypto.kdf, github.*) di ogni operazione.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, nullcontext
+from datetime import datetime
+from unittest import mock
+
+import requests
+from github import Auth, Github
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import auth, backend as backend_module, github_client, session_data, telemetry  # noqa: E402
+from modules.backend import GitHubStorage  # noqa: E402
+from modules.blob_cache import BlobCache  # noqa: E402
+from modules.entry_ids import new_id  # noqa: E402
+from modules.schema import TS_FORMAT  # noqa: E402
+from modules.snapshot_cache import SnapshotCache  # noqa: E402
+from modules.write_queue import WriteBehindQueue  # noqa: E402
+from benchmarks.github_server import GitHubAPIServer  # noqa: E402
+from benchmarks.synthetic import generate  # noqa: E402
+
+INVITE_CODE = "loadtest"
+OPERATIONS = ("register", "login", "load", "save")
+# Span mostrati nel dettaglio per operazione (i più lenti, fino a questo numero)
+TOP_SPANS = 4
+
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+
+class _Rerun(BaseException):
+    """Come RerunException di Streamlit: non la intercettano gli `except Exception`."""
+
+
+class SessionStreamlit:
+    """
+    Sostituto di `st` per auth: session_state separato per ogni thread
+    (= sessione simulata) e messaggi registrati invece che mostrati.
+    """
+
+    def __init__(self, secrets: dict):
+        self.secrets = secrets
+        self._local = threading.local()
+
+    @property
+    def session_state(self) -> dict:
+        if not hasattr(self._local, "state"):
+            self._local.state = {}
+        return self._local.state
+
+    @property
+    def messages(self) -> list:
+        if not hasattr(self._local, "messages"):
+            self._local.messages = []
+        return self._local.messages
+
+    def _message(kind):
+        def show(self, body, *args, **kwargs):
+            self.messages.append((kind, str(body)))
+        return show
+
+    success = _message("success")
+    error = _message("error")
+    warning = _message("warning")
+    info = _message("info")
+    del _message
+
+    def spinner(self, *args, **kwargs):
+        return nullcontext()
+
+    def rerun(self):
+        raise _Rerun()
+
+
+class Recorder:
+    """Latenze, esiti, chiamate HTTP e span per operazione (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.calls = defaultdict(int)
+        self.spans = defaultdict(lambda: defaultdict(float))
+
+    def count_call(self):
+        # [n] condiviso con i thread del pool che lavorano per la stessa operazione (vedi bind)
+        cell = getattr(self._local, "calls", None)
+        if cell is not None:
+            with self._lock:
+                cell[0] += 1
+
+    def bind(self, fn):
+        """fn per un altro thread: le sue chiamate HTTP contano per l'operazione in corso in questo."""
+        cell = getattr(self._local, "calls", None)
+
+        def bound(*args, **kwargs):
+            self._local.calls = cell
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._local.calls = None
+        return bound
+
+    def measure(self, op, fn, *args):
+        """Esegue fn(*args): ritorna il suo risultato; un'eccezione o False conta come errore."""
+        self._local.calls = [0]
+        telemetry.begin_run(True)
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+            ok = result is not False
+        except Exception as e:
+            result, ok = e, False
+        elapsed = time.perf_counter() - start
+        spans = telemetry.breakdown()
+        telemetry.finish_run()
+        with self._lock:
+            self.latencies[op].append(elapsed)
+            self.calls[op] += self._local.calls[0]
+            if not ok:
+                self.errors[op] += 1
+            for name, _, ms in spans:
+                self.spans[op][name] += ms
+        self._local.calls = None
+        return result
+
+    def report(self, op) -> dict:
+        values = sorted(self.latencies[op])
+        if not values:
+            return None
+        n = len(values)
+
+        def q(p):
+            return values[min(int(p * n), n - 1)] * 1000
+
+        top = sorted(self.spans[op].items(), key=lambda kv: -kv[1])[:TOP_SPANS]
+        return {
+            "n": n, "errors": self.errors[op],
+            "p50_ms": q(0.50), "p95_ms": q(0.95), "p99_ms": q(0.99), "max_ms": values[-1] * 1000,
+            "calls_per_op": self.calls[op] / n,
+            "spans_ms": {name: ms / n for name, ms in top},
+        }
+
+
+# --- SCENARIO ---
+def _password(user: str) -> str:
+    return f"pw-{user}"
+
+
+def register(st, user):
+    auth.register_user(user, _password(user), _password(user), INVITE_CODE)
+    kind, message = st.messages[-1] if st.messages else ("error", "nessun messaggio")
+    st.messages.clear()
+    if kind != "success":
+        raise RuntimeError(message)
+
+
+def login(st, user):
+    """authenticate_user come dal form: riuscito se termina con st.rerun() e la sessione è autenticata."""
+    try:
+        auth.authenticate_user(user, _password(user))
+    except _Rerun:
+        pass
+    if not st.session_state.get("authenticated"):
+        raise RuntimeError(st.messages[-1][1] if st.messages else "login fallito")
+    return auth.get_cipher()
+
+
+def random_entry(rnd: random.Random) -> dict:
+    return {
+        "id": new_id(),
+        "timestamp": datetime.now().strftime(TS_FORMAT),
+        "activity_type": "💪 Sport", "note": "",
+        "dettaglio": rnd.choice(["Corsa", "Palestra", "Nuoto"]),
+        "metrica": float(rnd.randint(20, 90)), "unita": "min",
+    }
+
+
+def session(storage, st, recorder, user, ops, save_ratio, seed):
+    rnd = random.Random(seed)
+    cipher = recorder.measure("login", login, st, user)
+    if isinstance(cipher, BaseException) or cipher is None:
+        return
+    backend = storage.backend(user, cipher)
+    for _ in range(ops):
+        if rnd.random() < save_ratio:
+            recorder.measure("save", backend.save_entry, random_entry(rnd))
+        else:
+            recorder.measure("load", backend.load_data)
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=fn, args=args) for fn, args in targets]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+
+def run(args) -> dict:
+    users = [f"user{i:03d}" for i in range(args.users)]
+    server = GitHubAPIServer(latency_ms=0, rate_limit=0, write_limit=0).start()
+    recorder = Recorder()
+    st = SessionStreamlit({"INVITE_CODE": INVITE_CODE})
+    # Stesso client della produzione (github_client.get_github), verso il server locale
+    github = Github(auth=Auth.Token("loadtest"), base_url=server.url,
+                    pool_size=github_client.POOL_SIZE, lazy=True,
+                    seconds_between_requests=github_client.SECONDS_BETWEEN_REQUESTS,
+                    seconds_between_writes=github_client.SECONDS_BETWEEN_WRITES)
+    repo = github.get_repo("loadtest/life-logger")
+    storage = GitHubStorage(repo)
+    blobs = BlobCache(tempfile.mkdtemp(prefix="loadtest-"))
+    snapshots = SnapshotCache(args.snapshot_cache_mb * 1024 * 1024)
+    write_queue = WriteBehindQueue(storage.backend, tempfile.mkdtemp(prefix="loadtest-spool-"))
+    send = requests.adapters.HTTPAdapter.send
+
+    def counted_send(adapter, *a, **kw):
+        recorder.count_call()
+        return send(adapter, *a, **kw)
+
+    submit = ThreadPoolExecutor.submit
+
+    def counted_submit(pool, fn, *a, **kw):
+        # Il login lavora anche nel pool (prefetch, keyring): le chiamate sono sue
+        return submit(pool, recorder.bind(fn), *a, **kw)
+
+    with ExitStack() as stack:
+        for target, name, value in [
+            (auth, "st", st), (auth, "get_storage", lambda: storage),
+            (session_data, "st", st), (session_data, "get_write_queue", lambda: write_queue),
+            (github_client, "get_github", lambda: github), (github_client, "get_repo", lambda: repo),
+            (backend_module, "get_blob_cache", lambda: blobs),
+            (backend_module, "get_snapshot_cache", lambda: snapshots),
+            (backend_module, "load_compression_dictionaries", lambda: 0),
+            (requests.adapters.HTTPAdapter, "send", counted_send),
+            (ThreadPoolExecutor, "submit", counted_submit),
+        ]:
+            stack.enter_context(mock.patch.object(target, name, value))
+        auth.invalidate_users_index()
+
+        # 1. Registrazioni concorrenti (conflitti su users.yaml)
+        server.latency_ms, server.jitter_ms = args.latency_ms, args.jitter_ms
+        run_threads([(recorder.measure, ("register", register, st, user)) for user in users])
+        registration = server.stats()
+
+        # 2. Storico iniziale, fuori misura: niente latenza né limiti
+        server.latency_ms = server.jitter_ms = 0
+        if args.history:
+            def seed_history(user, seed):
+                cipher = login(st, user)
+                storage.backend(user, cipher).append_entries(generate(args.history, seed=seed))
+            run_threads([(seed_history, (user, i)) for i, user in enumerate(users)])
+            auth.invalidate_users_index()
+
+        # 3. Sessioni concorrenti
+        server.latency_ms, server.jitter_ms = args.latency_ms, args.jitter_ms
+        server.set_limits(args.rate_limit, args.rate_window, args.write_limit, args.write_window)
+        server.reset_stats()
+        cpu = time.process_time()
+        wall = run_threads([(session, (storage, st, recorder, user, args.ops, args.save_ratio, i * 1000 + s))
+                            for i, user in enumerate(users) for s in range(args.sessions)])
+        cpu = time.process_time() - cpu
+        traffic = server.stats()
+    server.stop()
+    write_queue.close()
+
+    operations = {op: recorder.report(op) for op in OPERATIONS if recorder.report(op)}
+    done = sum(r["n"] for op, r in operations.items() if op != "register")
+    return {
+        "config": vars(args),
+        "wall_s": wall,
+        "throughput_ops_s": done / wall if wall else 0.0,
+        "cpu_utilization": cpu / wall if wall else 0.0,
+        "operations": operations,
+        "registration": registration,
+        "api": traffic,
+    }
+
+
+# --- REPORT ---
+def conflict_rates(stats: dict) -> dict:
+    """File -> (scritture, conflitti, tasso)."""
+    return {kind: (writes, stats["conflicts"].get(kind, 0), stats["conflicts"].get(kind, 0) / writes)
+            for kind, writes in sorted(stats["writes"].items())}
+
+
+def print_report(result: dict):
+    cfg = result["config"]
+    print(f"\n{cfg['users']} utenti x {cfg['sessions']} sessioni, {cfg['ops']} operazioni a sessione, "
+          f"latenza {cfg['latency_ms']:.0f}±{cfg['jitter_ms']:.0f} ms, storico {cfg['history']} entry")
+    print(f"durata {result['wall_s']:.2f} s, throughput {result['throughput_ops_s']:.1f} op/s "
+          f"(login+load+save), CPU {result['cpu_utilization']:.0%} di un core\n")
+
+    header = f"{'operazione':<10} {'n':>6} {'errori':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'API/op':>7}"
+    print(header)
+    print("-" * len(header))
+    for op, r in result["operations"].items():
+        print(f"{op:<10} {r['n']:>6} {r['errors']:>6} {r['p50_ms']:>7.0f}ms {r['p95_ms']:>7.0f}ms "
+              f"{r['p99_ms']:>7.0f}ms {r['max_ms']:>7.0f}ms {r['calls_per_op']:>7.1f}")
+
+    print("\ntempo medio per span (ms/op)")
+    for op, r in result["operations"].items():
+        spans = ", ".join(f"{name} {ms:.0f}" for name, ms in r["spans_ms"].items())
+        print(f"  {op:<10} {spans or '-'}")
+
+    for title, stats in (("registrazione", result["registration"]), ("sessioni", result["api"])):
+        print(f"\nconflitti ({title})")
+        for kind, (writes, conflicts, rate) in conflict_rates(stats).items():
+            print(f"  {kind:<16} {writes:>6} scritture {conflicts:>5} conflitti ({rate:.1%})")
+
+    api = result["api"]
+    print(f"\nAPI (sessioni): {api['total']} richieste, {api['rate_limited']} rifiutate per rate limit, "
+          f"{api['rate_remaining']} residue")
+    for route, count in sorted(api["requests"].items(), key=lambda kv: -kv[1]):
+        print(f"  {route:<16} {count:>7}")
+    print("  risposte: " + ", ".join(f"{status}: {n}" for status, n in sorted(api["statuses"].items())))
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Test di carico multiutente contro una finta API GitHub locale.")
+    p.add_argument("--users", type=int, default=10, help="utenti simulati")
+    p.add_argument("--sessions", type=int, default=1, help="sessioni contemporanee per utente")
+    p.add_argument("--ops", type=int, default=10, help="operazioni per sessione dopo il login")
+    p.add_argument("--save-ratio", type=float, default=0.3, help="quota di save_entry sul totale")
+    p.add_argument("--history", type=int, default=500, help="entry già salvate per utente")
+    p.add_argument("--latency-ms", type=float, default=50, help="latenza per richiesta della finta API")
+    p.add_argument("--jitter-ms", type=float, default=20, help="latenza aggiuntiva casuale (0..jitter)")
+    p.add_argument("--rate-limit", type=int, default=5000, help="richieste per finestra (0 = illimitate)")
+    p.add_argument("--rate-window", type=float, default=3600, help="durata della finestra del rate limit (s)")
+    p.add_argument("--write-limit", type=int, default=80, help="scritture per finestra secondaria (0 = illimitate)")
+    p.add_argument("--write-window", type=float, default=60, help="durata della finestra secondaria (s)")
+    p.add_argument("--snapshot-cache-mb", type=int, default=256, help="SNAPSHOT_CACHE_MB del processo")
+    p.add_argument("--json", help="salva anche il risultato completo in questo file")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Avvio a freddo dell'app: tempi di import e del primo render della pagina di login.
+
+    python -m benchmarks.startup [--rounds 3]
+
+Ogni misura gira in un processo Python nuovo (come un container appena
+avviato), in due fasi separate:
+- imports: streamlit, moduli della pagina di login (auth, telemetry, warmup) e
+  poi quelli che servono dopo l'accesso (warmup.MODULES: pandas, PyGithub...);
+- render: primo run di app.py con streamlit.testing (pagina di login, import
+  compresi), quando il warm-up finisce gli import e i rerun successivi.
+Il report riporta la mediana dei round.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+RERUNS = 5
+
+
+def _ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def phase_imports() -> dict:
+    start = time.perf_counter()
+    import streamlit  # noqa: F401
+    result = {"import_streamlit_ms": _ms(start)}
+
+    start = time.perf_counter()
+    from modules import auth, telemetry, warmup  # noqa: F401
+    result["import_login_ms"] = _ms(start)
+    result["login_heavy_modules"] = [m for m in ("pandas", "numpy", "github") if m in sys.modules]
+
+    start = time.perf_counter()
+    for name in warmup.MODULES:
+        __import__(name)
+    result["import_app_ms"] = _ms(start)
+    return result
+
+
+def phase_render() -> dict:
+    import threading
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP, default_timeout=120)
+    app.secrets["INVITE_CODE"] = "startup"
+    start = time.perf_counter()
+    app.run()
+    result = {"first_render_ms": _ms(start)}
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    # Fine del warm-up, contata dall'inizio del primo render
+    for thread in threading.enumerate():
+        if thread.name == "warm-up":
+            thread.join()
+    result["warmup_done_ms"] = _ms(start)
+
+    # Reruns a regime (dopo il warm-up): il costo di ogni interazione con la pagina
+    reruns = []
+    for _ in range(RERUNS):
+        rerun = time.perf_counter()
+        app.run()
+        reruns.append(_ms(rerun))
+    result["rerun_ms"] = statistics.median(reruns)
+    return result
+
+
+def run_phase(phase: str) -> dict:
+    """Una fase in un interprete nuovo; ritorna le misure (più il tempo totale del processo)."""
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--phase", phase],
+                         cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result[f"{phase}_process_ms"] = _ms(start)
+    return result
+
+
+def measure() -> dict:
+    """Entrambe le fasi, ognuna in un processo nuovo."""
+    return {**run_phase("imports"), **run_phase("render")}
+
+
+def summarize(rounds: list) -> dict:
+    result = {}
+    for key, value in rounds[0].items():
+        if isinstance(value, (int, float)):
+            result[key] = statistics.median(r[key] for r in rounds)
+        else:
+            result[key] = value
+    return result
+
+
+def print_report(result: dict, rounds: int):
+    print(f"\navvio a freddo, mediana di {rounds} round\n")
+    for key in ("import_streamlit_ms", "import_login_ms", "import_app_ms",
+                "first_render_ms", "warmup_done_ms", "rerun_ms", "render_process_ms"):
+        print(f"{key:<22} {result[key]:>8.0f} ms")
+    heavy = ", ".join(result["login_heavy_modules"]) or "nessuno"
+    print(f"\nmoduli pesanti importati dalla pagina di login: {heavy}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--phase", choices=("imports", "render"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.phase:
+        sys.path.insert(0, ROOT)
+        result = phase_imports() if args.phase == "imports" else phase_render()
+        print(json.dumps(result))
+        return
+    result = summarize([measure() for _ in range(args.rounds)])
+    print_report(result, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Generatore di storici sintetici per i benchmark.
+
+Le entry hanno la stessa forma di quelle salvate dal form (id ULID, timestamp,
+dettaglio, metrica, unità) con un mix realistico delle quattro attività:
+i libri vengono letti a puntate fino alla fine, lo sport ha pochi tipi
+ricorrenti, film e "altro" sono sparsi. Con lo stesso seed l'output è identico.
+"""
+import random
+from datetime import datetime, timedelta
+
+from modules.entry_ids import _CROCKFORD
+from modules.schema import TS_FORMAT
+
+BOOKS = [
+    "Il nome della rosa", "Dune", "Le città invisibili", "Sapiens", "Il Gattopardo",
+    "Cent'anni di solitudine", "1984", "Il barone rampante", "La coscienza di Zeno",
+    "Guerra e pace", "Il piccolo principe", "Se questo è un uomo", "Fondazione",
+    "La storia", "Lessico famigliare", "Il deserto dei Tartari",
+]
+SPORTS = ["Palestra", "Corsa", "Nuoto", "Yoga", "Bici"]
+MOVIES = [
+    "La dolce vita", "Nuovo Cinema Paradiso", "Il sorpasso", "Interstellar", "Breaking Bad",
+    "The Office", "Dark", "La grande bellezza", "Parasite", "Chernobyl",
+]
+OTHERS = ["Meditazione", "Cucina", "Chitarra", "Giardinaggio", "Volontariato"]
+
+# Peso delle attività nello storico (somma 1)
+MIX = (("📚 Lettura", 0.45), ("💪 Sport", 0.30), ("🎬 Film/Serie", 0.15), ("📝 Altro", 0.10))
+
+
+def _ulid(ms: int, rnd: random.Random) -> str:
+    value = (ms << 80) | rnd.getrandbits(80)
+    chars = []
+    for _ in range(26):
+        chars.append(_CROCKFORD[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def generate(n: int, seed: int = 42, end: datetime = None) -> list:
+    """`n` entry in ordine cronologico, circa 4 al giorno, che finiscono a `end` (default: ora)."""
+    rnd = random.Random(seed)
+    end = end or datetime.now().replace(microsecond=0)
+    step = timedelta(hours=6)
+    ts = end - step * n
+    names = [name for name, _ in MIX]
+    weights = [w for _, w in MIX]
+    book = None  # [titolo, pagine lette, pagine totali]
+    entries = []
+    for _ in range(n):
+        ts += step + timedelta(minutes=rnd.randint(-90, 90))
+        stamp = ts.strftime(TS_FORMAT)
+        activity = rnd.choices(names, weights)[0]
+        entry = {"id": _ulid(int(ts.timestamp() * 1000), rnd), "timestamp": stamp,
+                 "activity_type": activity, "note": ""}
+        if activity == "📚 Lettura":
+            if book is None or book[1] >= book[2]:
+                book = [rnd.choice(BOOKS), 0, rnd.randint(150, 900)]
+            pages = min(rnd.randint(5, 60), book[2] - book[1])
+            book[1] += pages
+            entry.update({"dettaglio": book[0], "metrica": pages, "unita": "pagine",
+                          "pagine_totali": book[2], "is_valid": True})
+        elif activity == "💪 Sport":
+            entry.update({"dettaglio": rnd.choice(SPORTS), "metrica": rnd.choice([30, 45, 60, 90]),
+                          "unita": "minuti"})
+        elif activity == "🎬 Film/Serie":
+            entry.update({"dettaglio": rnd.choice(MOVIES), "metrica": rnd.randint(1, 10), "unita": "voto"})
+        else:
+            entry.update({"dettaglio": rnd.choice(OTHERS), "metrica": 0.0, "unita": "generic"})
+            if rnd.random() < 0.3:
+                entry["note"] = "Con amici"
+        entries.append(entry)
+    return entries
@@ -2,26 +2,106 @@ import streamlit as st
 from abc import ABC, abstractmethod
 import pandas as pd
 from datetime import datetime, date
+from modules.telemetry import timed
 
 
 class BaseActivity(ABC):
+    # True se render_ui ha bisogno di tutta la storia dell'attività, non solo dei giorni recenti
+    full_history = False
+
+    # Schema dell'entry salvata (usato per validare gli import)
+    unit = None
+    metric_required = True
+    metric_range = (None, None)
+    detail_required = False
+    extra_fields = {}  # campi specifici dell'attività: nome -> tipo
+
     @property
     @abstractmethod
     def name(self): pass
     @abstractmethod
     def render_ui(self, history_df: pd.DataFrame) -> dict: pass
 
+    def coerce(self, row: dict):
+        """
+        Porta una riga esterna (es. CSV) nella forma salvata dal form.
+        Ritorna (entry, errori): se ci sono errori l'entry va scartata.
+        """
+        errors = []
+        entry = {"activity_type": self.name}
+        for key in ("id", "timestamp", "note", "dettaglio", "unita"):
+            if row.get(key) not in (None, ""):
+                entry[key] = str(row[key])
+        entry.setdefault("unita", self.unit)
+        entry.setdefault("note", "")
+
+        if not entry.get("timestamp"):
+            errors.append("timestamp mancante o non valido")
+        if self.detail_required and not entry.get("dettaglio"):
+            errors.append("dettaglio mancante")
+
+        metric = row.get("metrica")
+        if metric in (None, ""):
+            if self.metric_required:
+                errors.append("metrica mancante")
+        else:
+            try:
+                metric = float(metric)
+                entry["metrica"] = int(metric) if metric.is_integer() else metric
+                low, high = self.metric_range
+                if (low is not None and metric < low) or (high is not None and metric > high):
+                    errors.append(f"metrica fuori range ({metric})")
+            except (TypeError, ValueError):
+                errors.append(f"metrica non numerica ({metric})")
+
+        for field, kind in self.extra_fields.items():
+            if row.get(field) in (None, ""):
+                continue
+            try:
+                if kind is int:
+                    # "300" o "300.0" dal CSV vanno bene, 300.5 no (non lo tronchiamo)
+                    number = float(row[field])
+                    if not number.is_integer():
+                        errors.append(f"{field} non intero ({row[field]})")
+                        continue
+                    entry[field] = int(number)
+                else:
+                    entry[field] = kind(row[field])
+            except (TypeError, ValueError):
+                errors.append(f"{field} non valido ({row[field]})")
+        return entry, errors
+
 # --- NUOVA VERSIONE LETTURA ---
 # --- NUOVA VERSIONE LETTURA (CON GESTIONE STATO) ---
 class ReadingActivity(BaseActivity):
     name = "📚 Lettura"
+    # Pagine lette e libri finiti si calcolano su tutta la storia
+    full_history = True
+    unit = "pagine"
+    metric_range = (1, None)
+    detail_required = True
+    extra_fields = {"pagine_totali": int}
 
     def _analyze_library(self, df: pd.DataFrame):
         """
         Analizza il DataFrame e restituisce:
         1. active_books: Dizionario {titolo: {'letti': X, 'totali': Y}} per i libri in corso.
         2. finished_books: Lista di titoli completati.
+
+        Il risultato è memorizzato in sessione per (snapshot, versione dati):
+        si ricalcola solo quando i dati cambiano, non a ogni interazione col form.
         """
+        cache_key = (id(df), st.session_state.get('data_version', 0))
+        cached = st.session_state.get('_library_cache')
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+
+        result = self._compute_library(df)
+        st.session_state['_library_cache'] = (cache_key, result)
+        return result
+
+    @timed("activity.library")
+    def _compute_library(self, df: pd.DataFrame):
         active_books = {}
         finished_books = []
 
@@ -29,30 +109,29 @@ class ReadingActivity(BaseActivity):
             return active_books, finished_books
 
         # Filtra solo attività di lettura
-        reading_df = df[df['activity_type'] == self.name]
-        unique_titles = reading_df['dettaglio'].dropna().unique()
+        reading_df = df.loc[df['activity_type'] == self.name]
+        reading_df = reading_df[reading_df['dettaglio'].notna()]
+        if reading_df.empty:
+            return active_books, finished_books
+
+        # Un solo passaggio: pagine lette (somma) e pagine totali (massimo dichiarato) per titolo
+        totals = reading_df['pagine_totali'] if 'pagine_totali' in reading_df.columns else 0
+        library = pd.DataFrame({
+            'dettaglio': reading_df['dettaglio'],
+            'metrica': pd.to_numeric(reading_df['metrica'], errors='coerce'),
+            'pagine_totali': pd.to_numeric(totals, errors='coerce'),
+        }).groupby('dettaglio', sort=False, observed=True).agg(metrica=('metrica', 'sum'), pagine_totali=('pagine_totali', 'max'))
+        library['pagine_totali'] = library['pagine_totali'].fillna(0)
+
+        # Logica di Smistamento
+        finished = (library['pagine_totali'] > 0) & (library['metrica'] >= library['pagine_totali'])
+        finished_books = library.index[finished].tolist()
+        active = library[~finished]
+        active_books = {
+            title: {'letti': int(letti), 'totali': int(totali)}
+            for title, letti, totali in zip(active.index, active['metrica'], active['pagine_totali'])
+        }
 
-        for title in unique_titles:
-            book_logs = reading_df[reading_df['dettaglio'] == title]
-            
-            # Calcolo Pagine Lette (Somma metriche)
-            read_so_far = book_logs['metrica'].sum()
-            
-            # Calcolo Pagine Totali (Prendi il massimo dichiarato)
-            total_pages = 0
-            if 'pagine_totali' in book_logs.columns:
-                total_pages = book_logs['pagine_totali'].max()
-                if pd.isna(total_pages): total_pages = 0
-            
-            # Logica di Smistamento
-            if total_pages > 0 and read_so_far >= total_pages:
-                finished_books.append(title)
-            else:
-                active_books[title] = {
-                    'letti': int(read_so_far),
-                    'totali': int(total_pages)
-                }
-        
         return active_books, finished_books
 
     def render_ui(self, df: pd.DataFrame):
@@ -149,6 +228,8 @@ class ReadingActivity(BaseActivity):
 # ...
 class SportActivity(BaseActivity):
     name = "💪 Sport"
+    unit = "minuti"
+    metric_range = (0, None)
     def render_ui(self, df):
         # Aggiungo anche qui la data per coerenza, se vuoi
         log_date = st.date_input("Data Sport", value=date.today())
@@ -159,6 +240,8 @@ class SportActivity(BaseActivity):
 
 class MovieActivity(BaseActivity):
     name = "🎬 Film/Serie"
+    unit = "voto"
+    metric_range = (1, 10)
     def render_ui(self, df):
         log_date = st.date_input("Data Visione", value=date.today())
         detail = st.text_input("Titolo")
@@ -167,11 +250,18 @@ class MovieActivity(BaseActivity):
 
 class GenericActivity(BaseActivity):
     name = "📝 Altro"
+    unit = "generic"
+    metric_required = False
     def render_ui(self, df):
         log_date = st.date_input("Data", value=date.today())
         detail = st.text_input("Attività")
         metric = st.number_input("Valore (opzionale)")
         return {"dettaglio": detail, "metrica": metric, "unita": "generic", "custom_date": log_date}
 
+# Le attività non hanno stato (la cache della libreria è in session_state):
+# le istanze si creano una volta per processo e sono condivise da tutte le sessioni
+ACTIVITIES = (ReadingActivity(), SportActivity(), MovieActivity(), GenericActivity())
+
+
 def get_all_activities():
-    return [ReadingActivity(), SportActivity(), MovieActivity(), GenericActivity()]
\ No newline at end of file
+    return ACTIVITIES
\ No newline at end of file
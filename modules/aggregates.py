@@ -0,0 +1,181 @@
+"""
+Aggregati materializzati per le statistiche.
+
+Per ogni attività e periodo (giorno, settimana, mese, anno) teniamo somma e
+numero di entry. Si aggiornano in O(1) a ogni append e le statistiche leggono
+direttamente i bucket, senza riscansionare tutta la storia.
+"""
+import calendar
+from datetime import date, datetime, timedelta
+import pandas as pd
+from modules.telemetry import timed
+
+FREQS = ("D", "W", "M", "Y")
+# Frequenze pandas equivalenti (etichette a fine periodo, come resample)
+PANDAS_FREQ = {"D": "D", "W": "W-SUN", "M": "ME", "Y": "YE"}
+AGGREGATES_VERSION = 1
+
+
+def bucket_label(day: date, freq: str) -> str:
+    """Etichetta del periodo che contiene `day` (data di fine periodo)."""
+    if freq == "D":
+        end = day
+    elif freq == "W":
+        end = day + timedelta(days=6 - day.weekday())
+    elif freq == "M":
+        end = day.replace(day=calendar.monthrange(day.year, day.month)[1])
+    else:
+        end = date(day.year, 12, 31)
+    return end.isoformat()
+
+
+def _to_date(value):
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _to_number(value) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if number != number else number  # NaN -> 0
+
+
+def entry_cells(entry: dict) -> list:
+    """Celle toccate da un'entry: (freq, attività, bucket, valore); nessuna se mancano data o attività."""
+    day = _to_date(entry.get("timestamp"))
+    activity = entry.get("activity_type")
+    if day is None or activity is None:
+        return []
+    value = _to_number(entry.get("metrica"))
+    return [(freq, activity, bucket_label(day, freq), value) for freq in FREQS]
+
+
+def cell_deltas(appended, removed=()) -> dict:
+    """
+    Variazioni per cella di una scrittura: (freq, attività, bucket) -> [somma, conteggio].
+    Per gli storage che salvano le celle una per una (vedi sqlite_backend).
+    """
+    deltas = {}
+    for entries, sign in ((appended, 1), (removed, -1)):
+        for entry in entries:
+            for freq, activity, label, value in entry_cells(entry):
+                cell = deltas.setdefault((freq, activity, label), [0.0, 0])
+                cell[0] += sign * value
+                cell[1] += sign
+    return deltas
+
+
+class AggregateStore:
+    def __init__(self, data: dict = None):
+        # rollups[freq][attività][bucket] = [somma, conteggio]
+        self.data = data or {
+            "version": AGGREGATES_VERSION,
+            "count": 0,
+            "rollups": {f: {} for f in FREQS},
+        }
+
+    @classmethod
+    def from_saved(cls, data: dict):
+        """Aggregati salvati, o None se mancano o sono di un'altra versione (vanno ricostruiti)."""
+        if not data or data.get("version") != AGGREGATES_VERSION:
+            return None
+        return cls(data)
+
+    @classmethod
+    def from_cells(cls, count: int, cells) -> "AggregateStore":
+        """Da celle salvate una per una: (freq, attività, bucket, somma, conteggio)."""
+        store = cls()
+        store.data["count"] = count
+        for freq, activity, label, total, n in cells:
+            store.data["rollups"][freq].setdefault(activity, {})[label] = [total, n]
+        return store
+
+    def cells(self):
+        """Inverso di from_cells: (freq, attività, bucket, somma, conteggio) per ogni cella."""
+        for freq, activities in self.data["rollups"].items():
+            for activity, buckets in activities.items():
+                for label, (total, n) in buckets.items():
+                    yield freq, activity, label, total, n
+
+    @property
+    def count(self) -> int:
+        """Numero di entry incluse negli aggregati."""
+        return self.data["count"]
+
+    def add(self, entry: dict):
+        for freq, activity, label, value in entry_cells(entry):
+            cell = self.data["rollups"][freq].setdefault(activity, {}).setdefault(label, [0.0, 0])
+            cell[0] += value
+            cell[1] += 1
+        self.data["count"] += 1
+
+    def remove(self, entry: dict):
+        """Inverso di add (entry eliminata o modificata)."""
+        self.data["count"] -= 1
+        for freq, activity, label, value in entry_cells(entry):
+            buckets = self.data["rollups"][freq].get(activity, {})
+            cell = buckets.get(label)
+            if cell is None:
+                continue
+            cell[0] -= value
+            cell[1] -= 1
+            if cell[1] <= 0:
+                del buckets[label]
+            if not buckets:
+                self.data["rollups"][freq].pop(activity, None)
+
+    def add_many(self, entries):
+        for entry in entries:
+            self.add(entry)
+
+    def apply(self, appended, removed=()):
+        """Aggiornamento incrementale dopo una scrittura: entry aggiunte e rimosse (o sostituite)."""
+        self.add_many(appended)
+        for entry in removed:
+            self.remove(entry)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "AggregateStore":
+        """Ricostruzione completa (una scansione): usata solo se gli aggregati mancano o non tornano."""
+        store = cls()
+        if df.empty:
+            return store
+        cols = [c for c in ("timestamp", "activity_type", "metrica") if c in df.columns]
+        store.add_many(df[cols].to_dict("records"))
+        return store
+
+    def activities(self) -> list:
+        return list(self.data["rollups"]["D"].keys())
+
+    @timed("aggregates.series")
+    def series(self, activity: str, freq: str, stat: str = "sum") -> pd.Series:
+        """Serie per periodo (buchi riempiti a 0), costo O(bucket)."""
+        buckets = self.data["rollups"][freq].get(activity, {})
+        if not buckets:
+            return pd.Series(dtype="float64")
+        labels = sorted(buckets)
+        if stat == "count":
+            values = [buckets[b][1] for b in labels]
+        elif stat == "mean":
+            values = [buckets[b][0] / buckets[b][1] if buckets[b][1] else 0.0 for b in labels]
+        else:
+            values = [buckets[b][0] for b in labels]
+        series = pd.Series(values, index=pd.to_datetime(labels))
+        full_range = pd.date_range(series.index[0], series.index[-1], freq=PANDAS_FREQ[freq])
+        return series.reindex(full_range, fill_value=0)
+
+    def total(self, activity: str) -> float:
+        return sum(cell[0] for cell in self.data["rollups"]["Y"].get(activity, {}).values())
+
+    def to_dict(self) -> dict:
+        return self.data
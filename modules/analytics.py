@@ -1,40 +1,39 @@
-import pandas as pd
-import plotly.express as px
 import streamlit as st
+from modules.telemetry import timed
 
 class AnalyticsEngine:
-    def __init__(self, df):
-        self.df = df.copy()
-        # Assicuriamoci che sia un DatetimeIndex
-        if not self.df.empty:
-            self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
-            self.df = self.df.set_index('timestamp')
+    """Statistiche lette dagli aggregati materializzati (vedi modules.aggregates)."""
 
+    def __init__(self, aggregates):
+        self.aggregates = aggregates
+
+    @timed("engine.analytics")
     def render_summary(self):
-        if self.df.empty:
+        all_activities = self.aggregates.activities()
+        if not all_activities:
             st.info("Nessun dato per le statistiche.")
             return
 
         timeframe = st.select_slider("Periodo", options=["D", "W", "M", "Y"], value="M", format_func=lambda x: {"D":"Giorni", "W":"Settimane", "M":"Mesi", "Y":"Anni"}[x])
         
         # Filtro per attività
-        all_activities = self.df['activity_type'].unique()
         selected_act = st.selectbox("Attività da analizzare", all_activities)
 
-        subset = self.df[self.df['activity_type'] == selected_act]
+        # Sum per pagine/minuti, Mean per voti
+        stat = st.radio("Valore", ["sum", "mean", "count"], horizontal=True,
+                        format_func=lambda x: {"sum": "Totale", "mean": "Media", "count": "Numero"}[x])
+
+        # Serie già aggregata: costo proporzionale ai periodi, non alle entry
+        resampled = self.aggregates.series(selected_act, timeframe, stat)
         
-        if subset.empty:
+        if resampled.empty:
             st.warning("Nessun dato per questa selezione.")
             return
 
-        # Resampling (Magia di Pandas)
-        # Sum per pagine/minuti, Mean per voti. Qui semplifichiamo con Sum
-        resampled = subset['metrica'].resample(timeframe).sum()
-        
         # Grafico
         st.subheader(f"Andamento: {selected_act}")
         st.bar_chart(resampled)
         
         # Statistica totale
-        total = subset['metrica'].sum()
-        st.metric("Totale nel periodo storico", f"{int(total)}")
\ No newline at end of file
+        total = self.aggregates.total(selected_act)
+        st.metric("Totale nel periodo storico", f"{int(total)}")
@@ -1,9 +1,59 @@
 import streamlit as st
 import yaml
 import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
-from github import Github
-from modules.crypto_utils import verify_password
+from modules.github_client import rate_limit_headroom
+from modules.storage import ConflictError, get_storage, get_write_queue
+from cryptography.fernet import InvalidToken
+from modules import keystore
+from modules.crypto_utils import verify_password, hash_password, KeyCache
+
+logger = logging.getLogger(__name__)
+
+USERS_FILE = "users.yaml"
+# Oltre questo tempo la cache di users.yaml viene rivalidata (lettura condizionale alla versione)
+USERS_TTL_SECONDS = 30
+MAX_UPDATE_RETRIES = 3
+# Lavori avviati prima della verifica della password (prefetch + keyring): al più
+# quelli di un login per utente, così tentativi ripetuti non riempiono il pool
+MAX_SPECULATIVE_PER_USER = 2
+
+# Cache di processo dell'indice utenti {username: hash bcrypt}
+_users_lock = threading.Lock()
+_users_cache = {"loaded": False, "users": {}, "version": None, "checked": 0.0}
+
+# Lavori speculativi in coda o in corso per username
+_speculative_lock = threading.Lock()
+_speculative = {}
+
+@st.cache_resource
+def get_login_pool() -> ThreadPoolExecutor:
+    """Thread per il login (keyring, KDF, prefetch dei dati), condivisi da tutte le sessioni."""
+    return ThreadPoolExecutor(int(st.secrets.get("LOGIN_WORKERS", 8)), thread_name_prefix="login")
+
+def _submit_speculative(username, fn, *args):
+    """
+    Mette fn nel pool di login prima che la password sia verificata. Ritorna il
+    future, o None se l'utente ha già MAX_SPECULATIVE_PER_USER lavori in sospeso
+    (il chiamante allora fa a meno del lavoro anticipato).
+    """
+    with _speculative_lock:
+        if _speculative.get(username, 0) >= MAX_SPECULATIVE_PER_USER:
+            return None
+        _speculative[username] = _speculative.get(username, 0) + 1
+    future = get_login_pool().submit(fn, *args)
+    # Chiamata anche per i future annullati
+    future.add_done_callback(lambda _: _release_speculative(username))
+    return future
+
+def _release_speculative(username):
+    with _speculative_lock:
+        _speculative[username] -= 1
+        if not _speculative[username]:
+            del _speculative[username]
 
 def check_password():
     """Gestisce Login e Registrazione. Ritorna username se loggato."""
@@ -41,30 +91,136 @@ def check_password():
 
     return None
 
+def get_cipher():
+    """Ritorna il cipher dell'utente loggato (derivato al login)."""
+    key_cache = st.session_state.get("key_cache")
+    key_id = st.session_state.get("key_id")
+    if key_cache is None or key_id is None:
+        return None
+    return key_cache.get(*key_id)
+
+def logout():
+    """
+    Chiude la sessione e dimentica le chiavi derivate. Le entry in coda vanno
+    scritte prima (write_queue.flush): qui la coda rilascia backend e cipher.
+    """
+    username = st.session_state.get("username")
+    if username:
+        get_write_queue().forget(username)
+    if "key_cache" in st.session_state:
+        st.session_state["key_cache"].clear()
+    for k in ["authenticated", "username", "key_id", "data_snapshot", "full_snapshot", "aggregates"]:
+        st.session_state.pop(k, None)
+
+# --- INDICE UTENTI ---
+def get_users_index(force=False):
+    """
+    Ritorna (utenti, versione) di users.yaml dalla cache di processo.
+    Scaduto il TTL (o con force=True) fa una lettura condizionale: se il file
+    non è cambiato (su GitHub: 304) non si riscarica né si riparsa nulla.
+    Il dict ritornato è condiviso: non va modificato.
+    """
+    with _users_lock:
+        now = time.monotonic()
+        if _users_cache["loaded"] and not force and now - _users_cache["checked"] < USERS_TTL_SECONDS:
+            return _users_cache["users"], _users_cache["version"]
+
+        storage = get_storage()
+        if _users_cache["loaded"]:
+            changed, content, version = storage.read_if_changed(USERS_FILE, _users_cache["version"])
+        else:
+            (content, version), changed = storage.read(USERS_FILE), True
+        if changed:
+            _users_cache["users"] = (yaml.safe_load(content.decode()) if content else None) or {}
+        _users_cache.update(loaded=True, version=version, checked=now)
+        return _users_cache["users"], version
+
+def invalidate_users_index():
+    with _users_lock:
+        _users_cache["loaded"] = False
+        _users_cache["users"] = {}
+
+def update_users_index(mutate, message):
+    """
+    Aggiorna users.yaml con scrittura condizionata alla versione: se un'altra
+    sessione ha scritto nel frattempo (ConflictError) rilegge e riapplica `mutate`.
+    `mutate(users)` modifica la copia ricevuta; se ritorna False si rinuncia.
+    """
+    for attempt in range(MAX_UPDATE_RETRIES + 1):
+        users, sha = get_users_index(force=True)
+        users = dict(users)
+        if mutate(users) is False:
+            return False
+        try:
+            get_storage().write(USERS_FILE, yaml.dump(users, default_flow_style=False).encode(), sha, message)
+        except ConflictError:
+            if attempt == MAX_UPDATE_RETRIES:
+                raise
+            continue
+        finally:
+            invalidate_users_index()
+        return True
+
 # --- LOGICA DI AUTHENTICAZIONE ---
 def authenticate_user(username, password):
+    """
+    Login in pipeline: mentre qui gira il bcrypt, nel pool si scaricano i blob
+    cifrati dell'utente e si apre il keyring (lettura + KDF, niente scritture).
+    Appena c'è il cipher si decodificano i dati e la sessione parte con lo
+    snapshot già pronto: il primo render della dashboard non ricarica niente.
+    """
     try:
-        g = Github(st.secrets["GITHUB_TOKEN"])
-        repo = g.get_repo(st.secrets["REPO_NAME"])
-        
-        # Scarica users.yaml
-        content = repo.get_contents("users.yaml")
-        users_db = yaml.safe_load(content.decoded_content.decode()) or {}
+        storage = get_storage()
+
+        # Indice utenti dalla cache: il costo del login è il bcrypt, non la rete
+        users_db, _ = get_users_index()
+        if username not in users_db:
+            # Magari si è appena registrato da un'altra istanza
+            users_db, _ = get_users_index(force=True)
         
         if username in users_db:
             stored_hash = users_db[username]
+            # I blob si possono scaricare senza chiave: il cipher arriva dopo la KDF
+            backend = storage.backend(username, None)
+            # Senza margine sulla quota API il prefetch si salta: il load scarica il necessario
+            prefetch = _submit_speculative(username, backend.prefetch) if storage.has_headroom() else None
+            opened = _submit_speculative(username, keystore.open_current, storage, username, password)
             if verify_password(password, stored_hash):
+                # KDF una sola volta: in sessione resta solo il cipher, non la password.
+                # Keyring assente o da aggiornare: unlock lo crea/riscrive (ora che la password è verificata)
+                cipher, salt = (opened and opened.result()) or keystore.unlock(storage, username, password)
+                key_cache = st.session_state.setdefault("key_cache", KeyCache())
+                key_cache.put(username, salt, cipher)
+                st.session_state["key_id"] = (username, salt)
+                try:
+                    if prefetch is not None:
+                        prefetch.result()
+                except Exception as e:
+                    # Solo un'ottimizzazione: il load qui sotto scarica quello che manca
+                    logger.warning("Prefetch dei dati di %s fallito: %s", username, e)
+                backend.cipher = cipher
+                # Import qui: session_data porta con sé pandas, che alla pagina di login non serve
+                from modules.session_data import load_session_data
+                try:
+                    load_session_data(backend, username)
+                except Exception as e:
+                    # Il login è valido lo stesso: ci riprova app.py al primo render
+                    logger.warning("Caricamento dei dati di %s fallito: %s", username, e)
                 st.session_state["authenticated"] = True
                 st.session_state["username"] = username
-                st.session_state["encryption_key"] = password
-                st.success("Login effettuato! 🔓")
-                time.sleep(0.5)
+                st.session_state["flash"] = "Login effettuato! 🔓"
                 st.rerun()
             else:
+                # Se non sono ancora partiti non servono più
+                for future in (prefetch, opened):
+                    if future is not None:
+                        future.cancel()
                 st.error("Password errata.")
         else:
             st.error("Utente non trovato.")
             
+    except InvalidToken:
+        st.error("Impossibile sbloccare la chiave dei dati con questa password.")
     except Exception as e:
         st.error(f"Errore di connessione: {e}")
 
@@ -81,36 +237,79 @@ def register_user(username, password, confirm, code):
         st.error("Codice invito non valido! Chiedi all'admin.")
         return
 
+    storage = get_storage()
+    if not storage.has_headroom():
+        _, _, reset_in = rate_limit_headroom()
+        st.warning(f"Troppe richieste a GitHub in questo momento. Riprova tra {reset_in // 60 + 1} minuti.")
+        return
+
     try:
-        with st.spinner("Creazione utente su GitHub..."):
-            g = Github(st.secrets["GITHUB_TOKEN"])
-            repo = g.get_repo(st.secrets["REPO_NAME"])
-            
-            # 2. Scarica DB attuale (per evitare sovrascritture accidentali)
-            contents = repo.get_contents("users.yaml")
-            users_db = yaml.safe_load(contents.decoded_content.decode()) or {}
-            
-            # 3. Controllo duplicati
-            if username in users_db:
+        with st.spinner("Creazione utente..."):
+            # 2. Genera Hash sicuro (una volta sola, fuori dai tentativi)
+            hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+
+            # 3. Controllo duplicati + aggiunta, sul DB appena riletto a ogni tentativo
+            def add_user(users_db):
+                if username in users_db:
+                    return False
+                users_db[username] = hashed
+
+            # 4. Scrittura condizionata alla versione letta (niente sovrascritture accidentali)
+            if not update_users_index(add_user, f"New User: {username}"):
                 st.error("Username già in uso. Scegline un altro.")
                 return
 
-            # 4. Genera Hash sicuro
-            hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-            
-            # 5. Aggiorna DB locale
-            users_db[username] = hashed
-            
-            # 6. Push su GitHub
-            new_yaml = yaml.dump(users_db, default_flow_style=False)
-            repo.update_file(
-                contents.path, 
-                f"New User: {username}", 
-                new_yaml, 
-                contents.sha
-            )
-            
+            # 5. Keyring con data key casuale e salt personale
+            keystore.initialize(storage, username, password)
+
             st.success(f"Benvenuto {username}! Account creato. Ora puoi accedere.")
             
     except Exception as e:
-        st.error(f"Errore durante la registrazione: {e}")
\ No newline at end of file
+        st.error(f"Errore durante la registrazione: {e}")
+
+# --- CAMBIO PASSWORD ---
+def change_password_form(username):
+    """Form (da mostrare nella sidebar) per cambiare password."""
+    with st.form("change_password_form", clear_on_submit=True):
+        old_pass = st.text_input("Password attuale", type="password")
+        new_pass = st.text_input("Nuova Password", type="password")
+        confirm_pass = st.text_input("Conferma Password", type="password")
+        submitted = st.form_submit_button("Cambia password")
+
+    if submitted:
+        change_password(username, old_pass, new_pass, confirm_pass)
+
+def change_password(username, old_password, new_password, confirm):
+    if not new_password:
+        st.warning("Compila tutti i campi.")
+        return
+    if new_password != confirm:
+        st.error("Le password non coincidono.")
+        return
+
+    try:
+        with st.spinner("Aggiornamento password..."):
+            storage = get_storage()
+            users_db, _ = get_users_index(force=True)
+            if username not in users_db or not verify_password(old_password, users_db[username]):
+                st.error("Password attuale errata.")
+                return
+
+            # 1. Ri-avvolge la data key: i dati non vengono toccati
+            cipher, salt, rollback = keystore.change_password(storage, username, old_password, new_password)
+
+            # 2. Aggiorna l'hash di login; se fallisce torniamo al keyring precedente
+            new_hash = hash_password(new_password)
+            try:
+                update_users_index(lambda users: users.update({username: new_hash}), f"Password Change: {username}")
+            except Exception:
+                rollback()
+                raise
+
+            key_cache = st.session_state.setdefault("key_cache", KeyCache())
+            key_cache.put(username, salt, cipher)
+            st.session_state["key_id"] = (username, salt)
+            st.success("Password aggiornata! 🔑")
+
+    except Exception as e:
+        st.error(f"Errore durante il cambio password: {e}")
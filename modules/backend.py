@@ -1,80 +1,775 @@
+import base64
+import copy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import msgpack
 import streamlit as st
 import yaml
 import pandas as pd
-from github import Github
-from modules.crypto_utils import encrypt_data, decrypt_data
-
-class GitHubBackend:
-    def __init__(self, username):
-        self.token = st.secrets["GITHUB_TOKEN"]
-        self.repo_name = st.secrets["REPO_NAME"]
-        # Nota l'estensione .enc per ricordarci che è criptato
-        self.file_path = f"data_{username}.enc" 
-        self.github = Github(self.token)
-        # Recuperiamo la password dalla sessione per usarla come chiave
-        self.user_password = st.session_state.get("encryption_key")
+from github import GithubException, UnknownObjectException
+from modules import entry_ids, schema, serializers
+from modules.aggregates import AggregateStore
+from modules.blob_cache import BlobCache
+from modules.snapshot_cache import SnapshotCache
+from modules.storage import ConflictError, DataBackend, Storage
+from modules.github_client import get_repo, has_headroom
+from modules.crypto_utils import encrypt_bytes, open_decrypted, set_dictionary
+from modules.telemetry import span, timed
+
+# Numero di entry per chunk: raggiunta la soglia il chunk viene "sigillato"
+# (non verrà più modificato) e le scritture successive aprono un nuovo chunk in coda.
+CHUNK_SIZE = 500
+MANIFEST_VERSION = 1
+# 2: id di contenuto normalizzati (entry_ids.content_id); un indice più vecchio si ricostruisce
+ID_INDEX_VERSION = 2
+# Conflitti di scrittura (SHA non aggiornato): 409 su update, 422 su create di un file esistente
+CONFLICT_STATUSES = (409, 422)
+MAX_CONFLICT_RETRIES = 3
+# Il listing di una cartella (contents API) riporta al massimo 1000 file: oltre,
+# i file che non compaiono si cercano per path
+LISTING_LIMIT = 1000
+# Prefetch al login: ultimi chunk (i più probabili nel working set) e download in parallelo
+PREFETCH_CHUNKS = 4
+PREFETCH_WORKERS = 4
+
+def chunk_stats(entries: list) -> dict:
+    """Statistiche di un chunk sigillato, salvate nel manifest per saltarlo nelle letture filtrate."""
+    stamps = [schema.ts_str(e["timestamp"]) for e in entries if e.get("timestamp") is not None]
+    return {
+        "min_ts": min(stamps, default=""),
+        "max_ts": max(stamps, default=""),
+        "activities": sorted({e["activity_type"] for e in entries if e.get("activity_type")}),
+    }
+
+
+@st.cache_resource
+def get_blob_cache() -> BlobCache:
+    """Cache su disco dei blob criptati, condivisa da tutte le sessioni del processo."""
+    return BlobCache(
+        st.secrets.get("CACHE_DIR", ".cache/blobs"),
+        int(st.secrets.get("CACHE_MAX_MB", 200)) * 1024 * 1024,
+    )
+
+
+@st.cache_resource
+def get_snapshot_cache() -> SnapshotCache:
+    """Chunk già decodificati (DataFrame), condivisi da tutte le sessioni del processo."""
+    return SnapshotCache(int(st.secrets.get("SNAPSHOT_CACHE_MB", 256)) * 1024 * 1024)
+
+
+@st.cache_resource
+def load_compression_dictionaries():
+    """
+    Dizionari zstd da ZSTD_DICTIONARY nei secrets (un path o una lista di path):
+    tutti servono a leggere, l'ultimo si usa per le nuove scritture.
+    """
+    paths = st.secrets.get("ZSTD_DICTIONARY") or []
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        with open(path, "rb") as f:
+            set_dictionary(f.read())
+    return len(paths)
+
+
+class GitHubBackend(DataBackend):
+    """
+    Storage segmentato su GitHub:
+    - data_{username}/manifest.enc: indice criptato dei chunk
+    - data_{username}/chunk_XXXXX.enc: blocchi di al massimo CHUNK_SIZE entry
+    - data_{username}/ids.enc: digest degli id dei chunk sigillati (deduplica e
+      ricerca per id), in binario e riscritto solo quando un chunk si sigilla
+
+    Una scrittura tocca solo il chunk di coda (più il manifest quando un chunk
+    viene sigillato). Il vecchio file data_{username}.enc viene letto finché
+    il primo salvataggio non lo migra nel nuovo formato.
+
+    I blob criptati sono in cache su disco per SHA: a ogni lettura si chiede a
+    GitHub solo il listing della cartella e si scaricano i file cambiati.
+    I chunk decodificati restano in memoria (get_snapshot_cache), condivisi
+    fra le sessioni dello stesso utente. Il payload si comprime prima della
+    cifratura (vedi crypto_utils.compress_payload): i blob scritti senza
+    compressione si leggono come prima e si comprimono alla prima riscrittura.
+    """
+
+    def __init__(self, username, cipher):
+        self.username = username
+        # Formato legacy: un unico file con tutta la storia
+        self.legacy_path = f"data_{username}.enc"
+        self.base_dir = f"data_{username}"
+        self.manifest_path = f"{self.base_dir}/manifest.enc"
+        # Indice id dei chunk sigillati: fuori dal manifest, che resta piccolo
+        self.ids_path = f"{self.base_dir}/ids.enc"
+        # Aggregati per le statistiche, aggiornati a ogni append
+        self.aggregates_path = f"{self.base_dir}/aggregates.enc"
+        # Cipher Fernet derivato al login (vedi auth.get_cipher)
+        self.cipher = cipher
         self._repo = None
+        self.blob_cache = get_blob_cache()
+        self.snapshot_cache = get_snapshot_cache()
+        load_compression_dictionaries()
+        # path -> sha dei file dell'utente, aggiornato a ogni load/append
+        self._shas = None
+        # False se il listing era troncato a LISTING_LIMIT (vedi _sha_of)
+        self._listing_complete = True
+        # Listing appena scaricato da prefetch: il load successivo non lo richiede
+        self._prefetched = False
+        # Entry totali dell'utente (anche quelle escluse dai filtri), calcolato a ogni load
+        self.total_count = None
 
     @property
     def repo(self):
         if self._repo is None:
-            self._repo = self.github.get_repo(self.repo_name)
+            # Handle condiviso da tutte le sessioni (vedi github_client)
+            self._repo = get_repo()
         return self._repo
 
-    def load_data(self) -> pd.DataFrame:
-        cols = ["timestamp", "activity_type", "note", "dettaglio", "metrica", "unita"]
+    # --- LETTURA / SCRITTURA DI BASSO LIVELLO ---
+    def _chunk_path(self, idx: int) -> str:
+        return f"{self.base_dir}/chunk_{idx:05d}.enc"
+
+    @timed("github.list")
+    def _refresh_shas(self):
+        """
+        Una sola chiamata API (listing della cartella, senza contenuti) per sapere
+        lo SHA attuale di manifest e chunk: i blob già in cache non si riscaricano.
+        Con più di LISTING_LIMIT file il listing è troncato (in ordine di nome,
+        quindi mancano manifest e coda): quei file li cerca _sha_of.
+        """
         try:
-            # 1. Scarica il blob criptato
-            contents = self.repo.get_contents(self.file_path)
-            encrypted_content = contents.decoded_content.decode("utf-8")
-            
-            # 2. DECRIPTA
-            yaml_str = decrypt_data(encrypted_content, self.user_password)
-            
-            # 3. Parsa
-            data = yaml.safe_load(yaml_str)
-            if not data: return pd.DataFrame(columns=cols)
-            
-            df = pd.DataFrame(data)
-            # (Codice pulizia dataframe uguale a prima...)
-            if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-            return df
-            
-        except Exception as e:
-            # Se errore è "Invalid Token" (password sbagliata) o file mancante
-            return pd.DataFrame(columns=cols)
-
-    def save_entry(self, entry: dict):
+            items = self.repo.get_contents(self.base_dir)
+        except UnknownObjectException:
+            items = []
+        self._shas = {item.path: item.sha for item in items}
+        self._listing_complete = len(items) < LISTING_LIMIT
+
+    def _sha_of(self, path):
+        """SHA attuale di un file dell'utente, o None se non esiste."""
+        if self._shas is None:
+            self._refresh_shas()
+        if path in self._shas or self._listing_complete:
+            return self._shas.get(path)
+        # Listing troncato: una chiamata per il file, ricordata fino al prossimo listing
         try:
-            # 1. Scarica e Decripta attuale (per appendere)
-            try:
-                contents = self.repo.get_contents(self.file_path)
-                encrypted_content = contents.decoded_content.decode("utf-8")
-                yaml_str = decrypt_data(encrypted_content, self.user_password)
-                current_data = yaml.safe_load(yaml_str) or []
-                sha = contents.sha
-                exists = True
-            except:
-                current_data = []
-                exists = False
-
-            # 2. Aggiungi
-            current_data.append(entry)
-            
-            # 3. Converti in YAML string
-            new_yaml_str = yaml.dump(current_data, sort_keys=False, allow_unicode=True)
-            
-            # 4. CRIPTA TUTTO
-            final_encrypted_blob = encrypt_data(new_yaml_str, self.user_password)
-            
-            # 5. Upload su GitHub
-            if exists:
-                self.repo.update_file(self.file_path, "Log Encrypted", final_encrypted_blob, sha)
+            with span("github.get"):
+                sha = self.repo.get_contents(path).sha
+        except UnknownObjectException:
+            sha = None
+        self._shas[path] = sha
+        return sha
+
+    def _get_blob(self, sha: str) -> bytes:
+        """Blob criptato per SHA: prima la cache su disco, poi GitHub."""
+        data = self.blob_cache.get(sha)
+        if data is None:
+            with span("github.blob"):
+                data = base64.b64decode(self.repo.get_git_blob(sha).content)
+            self.blob_cache.put(sha, data)
+        return data
+
+    @timed("backend.prefetch")
+    def prefetch(self):
+        """
+        Scarica nella cache su disco manifest, aggregati e gli ultimi
+        PREFETCH_CHUNKS chunk, ancora cifrati. Il listing vale anche per il
+        primo load, che così parte senza chiamate API per i blob già in cache.
+        """
+        self._refresh_shas()
+        chunks = sorted(p for p in self._shas if p.rsplit("/", 1)[-1].startswith("chunk_"))
+        # Un listing troncato ha solo i chunk più vecchi: senza cipher non si legge il manifest
+        recent = chunks[-PREFETCH_CHUNKS:] if self._listing_complete else []
+        paths = [self.manifest_path, self.aggregates_path, self.ids_path] + recent
+        missing = [sha for sha in map(self._sha_of, paths) if sha and self.blob_cache.get(sha) is None]
+        if missing:
+            with ThreadPoolExecutor(min(PREFETCH_WORKERS, len(missing))) as pool:
+                list(pool.map(self._get_blob, missing))
+        self._prefetched = True
+
+    def _fetch(self, path):
+        """Ritorna (blob criptato, sha) di un file dell'utente, o (None, None) se non esiste."""
+        if path.startswith(self.base_dir + "/"):
+            sha = self._sha_of(path)
+            return (self._get_blob(sha), sha) if sha else (None, None)
+        # File fuori dalla cartella utente (es. il legacy data_{username}.enc)
+        try:
+            with span("github.get"):
+                contents = self.repo.get_contents(path)
+        except UnknownObjectException:
+            return None, None
+        return contents.decoded_content, contents.sha
+
+    def _read_file(self, path):
+        """Scarica e decripta un file YAML. Ritorna (dati, sha) o (None, None) se non esiste."""
+        blob, sha = self._fetch(path)
+        if blob is None:
+            return None, None
+        # Il parsing YAML (es. manifest con l'indice id) si fa una volta per SHA;
+        # chi lo riceve può modificarlo, quindi si restituisce una copia
+        data = self.snapshot_cache.get_or_load((self.username, sha), lambda: self._parse_yaml(blob), size=len(blob))
+        return copy.deepcopy(data), sha
+
+    def _parse_yaml(self, blob: bytes):
+        # Decifratura e parsing procedono insieme, un frame alla volta
+        with span("parse.yaml"):
+            return yaml.safe_load(open_decrypted(blob, self.cipher))
+
+    def _write_file(self, path, data, sha, message) -> str:
+        """Cripta e carica un file YAML. Ritorna lo SHA del nuovo blob."""
+        yaml_str = yaml.dump(data, sort_keys=False, allow_unicode=True)
+        blob = encrypt_bytes(yaml_str.encode("utf-8"), self.cipher)
+        new_sha = self._upload(path, blob, sha, message)
+        if sha:
+            self.snapshot_cache.pop((self.username, sha))
+        self.snapshot_cache.put((self.username, new_sha), copy.deepcopy(data), size=len(blob))
+        return new_sha
+
+    @timed("github.write")
+    def _upload(self, path, blob: bytes, sha, message) -> str:
+        if sha:
+            result = self.repo.update_file(path, message, blob, sha)
+        else:
+            result = self.repo.create_file(path, message, blob)
+        new_sha = result["content"].sha
+        # Quello che scriviamo lo conosciamo già: finisce subito in cache
+        self.blob_cache.put(new_sha, blob)
+        if self._shas is not None:
+            self._shas[path] = new_sha
+        return new_sha
+
+    def _read_chunk(self, path):
+        """Ritorna (colonne, sha, serializer) di un chunk, o ({}, None, None) se non esiste."""
+        blob, sha = self._fetch(path)
+        if blob is None:
+            return {}, None, None
+        columns, serializer = serializers.read_columns(open_decrypted(blob, self.cipher))
+        return columns, sha, serializer
+
+    def _write_chunk(self, path, entries, sha, message, added=None) -> str:
+        """
+        Serializza (formato di default), cripta e carica un chunk. Le entry
+        storiche senza id ricevono qui il loro id di contenuto come id salvato.
+        Il DataFrame del nuovo SHA va subito in cache: se il chunk precedente
+        era in cache e `added` sono le sole righe nuove, basta accodarle.
+        """
+        missing_ids = any(not e.get("id") for e in entries)
+        if missing_ids:
+            entries = [e if e.get("id") else {**e, "id": entry_ids.entry_id(e)} for e in entries]
+        blob = encrypt_bytes(serializers.DEFAULT.dumps(entries), self.cipher)
+        new_sha = self._upload(path, blob, sha, message)
+        old = self.snapshot_cache.pop((self.username, sha)) if sha else None
+        if old is not None and added is not None and not missing_ids:
+            frame = schema.concat([old, schema.from_records(added)])
+        else:
+            frame = schema.from_records(entries)
+        self.snapshot_cache.put((self.username, new_sha), frame)
+        return new_sha
+
+    def _read_sealed(self, chunk: dict):
+        """Legge un chunk sigillato direttamente per SHA. Ritorna (colonne, serializer)."""
+        return serializers.read_columns(open_decrypted(self._get_blob(chunk["sha"]), self.cipher))
+
+    def _read_manifest(self):
+        return self._read_file(self.manifest_path)
+
+    def _read_id_index(self, manifest: dict):
+        """
+        Indice id dei chunk sigillati: ritorna (path -> set di digest, tutti i
+        digest in un solo set, sha, cambiato). Il set unico serve alla deduplica
+        (un test per entry invece di uno per chunk) e si calcola una volta per SHA.
+        I chunk che mancano (sigillati prima di ids.enc o indicizzati con una
+        versione precedente) si aggiungono qui leggendo il chunk; il vecchio
+        indice base64 nel manifest viene tolto.
+        Con `cambiato` l'indice va risalvato con _write_id_index.
+        """
+        blob, sha = self._fetch(self.ids_path)
+        index, merged = {}, frozenset()
+        if blob is not None:
+            # Decodifica una volta per SHA; la copia del dict si può modificare
+            cached, merged = self.snapshot_cache.get_or_load(
+                (self.username, sha), lambda: self._parse_id_index(blob), size=len(blob))
+            index = dict(cached)
+        added = []
+        for chunk in manifest["chunks"]:
+            if not chunk.get("sealed") or chunk["path"] in index:
+                continue
+            chunk.get("stats", {}).pop("ids", None)
+            columns, _ = self._read_sealed(chunk)
+            index[chunk["path"]] = entry_ids.entry_digests(serializers.columns_to_records(columns))
+            added.append(index[chunk["path"]])
+        if added:
+            merged = merged.union(*added)
+        return index, merged, sha, bool(added)
+
+    def _parse_id_index(self, blob: bytes):
+        """Ritorna (path -> set di digest, tutti i digest)."""
+        payload = msgpack.unpackb(open_decrypted(blob, self.cipher).read(), raw=False)
+        if payload.get("version") != ID_INDEX_VERSION:
+            return {}, frozenset()
+        index = {path: entry_ids.unpack_digests(raw) for path, raw in payload["chunks"].items()}
+        return index, frozenset().union(*index.values())
+
+    def _write_id_index(self, index: dict, sha) -> str:
+        """Cripta e carica l'indice id (digest grezzi in msgpack). Ritorna il nuovo SHA."""
+        payload = {"version": ID_INDEX_VERSION,
+                   "chunks": {path: entry_ids.pack_digests(d) for path, d in index.items()}}
+        blob = encrypt_bytes(msgpack.packb(payload, use_bin_type=True), self.cipher)
+        new_sha = self._upload(self.ids_path, blob, sha, "Update Id Index")
+        if sha:
+            self.snapshot_cache.pop((self.username, sha))
+        self.snapshot_cache.put((self.username, new_sha), (dict(index), frozenset().union(*index.values())),
+                                size=len(blob))
+        return new_sha
+
+    def _migrate_legacy(self):
+        """Converte il file unico legacy in manifest + chunk. Ritorna (manifest, sha)."""
+        legacy_data, _ = self._read_file(self.legacy_path)
+        legacy_data = legacy_data or []
+
+        manifest = {"version": MANIFEST_VERSION, "chunk_size": CHUNK_SIZE, "chunks": []}
+        index = {}
+        for start in range(0, len(legacy_data), CHUNK_SIZE):
+            part = legacy_data[start:start + CHUNK_SIZE]
+            idx = len(manifest["chunks"])
+            path = self._chunk_path(idx)
+            if len(part) < CHUNK_SIZE:
+                # Ultimo blocco incompleto: diventa la coda aperta
+                self._write_chunk(path, part, None, "Migrate Encrypted")
+                manifest["chunks"].append({"path": path, "sealed": False})
             else:
-                self.repo.create_file(self.file_path, "Init Encrypted", final_encrypted_blob)
+                sha = self._write_chunk(path, part, None, "Migrate Encrypted")
+                manifest["chunks"].append({"path": path, "sealed": True, "count": len(part), "sha": sha,
+                                           "stats": chunk_stats(part)})
+                index[path] = entry_ids.entry_digests(part)
+
+        if not manifest["chunks"] or manifest["chunks"][-1]["sealed"]:
+            idx = len(manifest["chunks"])
+            manifest["chunks"].append({"path": self._chunk_path(idx), "sealed": False})
+
+        if index:
+            _, ids_sha = self._fetch(self.ids_path)
+            self._write_id_index(index, ids_sha)
+        sha = self._write_file(self.manifest_path, manifest, None, "Init Manifest")
+        return manifest, sha
+
+    # --- API PUBBLICA ---
+    @timed("backend.load")
+    def load_data(self, since=None, until=None, activity=None) -> pd.DataFrame:
+        """
+        Carica le entry dell'utente, opzionalmente filtrate per intervallo di tempo
+        e attività (nome o lista di nomi). Grazie alle statistiche dei chunk nel
+        manifest si scaricano e decriptano solo i chunk che possono contenerle.
+        """
+        since, until = schema.ts_str(since), schema.ts_str(until)
+        activities = {activity} if isinstance(activity, str) else set(activity or ())
+
+        def chunk_needed(stats):
+            if since and stats["max_ts"] < since: return False
+            if until and stats["min_ts"] > until: return False
+            if activities and not activities.intersection(stats["activities"]): return False
             return True
-            
-        except Exception as e:
-            st.error(f"Errore Critico Salvataggio: {e}")
-            return False
\ No newline at end of file
+
+        def row_mask(df):
+            mask = pd.Series(True, index=df.index)
+            if since: mask &= df['timestamp'] >= pd.Timestamp(since)
+            if until: mask &= df['timestamp'] <= pd.Timestamp(until)
+            if activities: mask &= df['activity_type'].isin(activities)
+            return mask
+
+        return self._load(chunk_needed, row_mask)
+
+    @timed("backend.load")
+    def load_working_set(self, since, full_history=()) -> pd.DataFrame:
+        """
+        Dati per il Diario in un solo passaggio: le entry da `since` in poi più
+        l'intera storia delle attività in `full_history` (es. la lettura).
+        """
+        since = schema.ts_str(since)
+        full_history = set(full_history)
+
+        def chunk_needed(stats):
+            return stats["max_ts"] >= since or bool(full_history.intersection(stats["activities"]))
+
+        def row_mask(df):
+            return (df['timestamp'] >= pd.Timestamp(since)) | df['activity_type'].isin(full_history)
+
+        return self._load(chunk_needed, row_mask)
+
+    def _load(self, chunk_needed, row_mask) -> pd.DataFrame:
+        """
+        File mancanti = nessun dato. Gli errori di decifratura o decodifica
+        (chiave sbagliata, blob alterato, codec non disponibile) si propagano:
+        mostrare una storia vuota li nasconderebbe all'utente.
+        """
+        if not self._prefetched:
+            self._refresh_shas()
+        self._prefetched = False
+        manifest, manifest_sha = self._read_manifest()
+        if manifest is None:
+            # Nessun manifest: utente non ancora migrato
+            data, _ = self._read_file(self.legacy_path)
+            self.total_count = len(data or [])
+            if not data: return schema.empty()
+            frames = [schema.from_records(data)]
+        else:
+            frames = []
+            changed = []
+            self.total_count = 0
+            for chunk in manifest["chunks"]:
+                if chunk.get("sealed"):
+                    self.total_count += chunk.get("count", 0)
+                    # Chunk sigillato fuori dai filtri: non si scarica nemmeno
+                    if "stats" in chunk and not chunk_needed(chunk["stats"]):
+                        continue
+                    sha = chunk["sha"]
+                else:
+                    sha = self._sha_of(chunk["path"])
+                    if sha is None:
+                        continue
+                # Decodifica solo se nessuna sessione l'ha già fatto per questo SHA
+                frame = self.snapshot_cache.get_or_load(
+                    (self.username, sha), lambda: self._decode_chunk(chunk, sha, changed))
+                if not chunk.get("sealed"):
+                    self.total_count += len(frame)
+                frames.append(frame)
+            if changed and has_headroom():
+                try:
+                    self._write_file(self.manifest_path, manifest, manifest_sha, "Update Manifest")
+                except Exception:
+                    # Statistiche e migrazioni opportunistiche: si riprova alla prossima lettura
+                    pass
+
+        # (Codice pulizia dataframe uguale a prima...)
+        with span("dataframe"):
+            filtered = []
+            for frame in frames:
+                if frame.empty: continue
+                filtered.append(frame[row_mask(frame)])
+            return schema.concat(filtered)
+
+    def _decode_chunk(self, chunk: dict, sha: str, changed: list) -> pd.DataFrame:
+        """
+        Scarica e decodifica un chunk. Completa le statistiche dei chunk sigillati
+        che non le hanno e migra quelli ancora in YAML; in `changed` segnala che
+        il manifest va risalvato.
+        """
+        if chunk.get("sealed"):
+            columns, serializer = self._read_sealed(chunk)
+            if "stats" not in chunk:
+                # Chunk sigillato prima delle statistiche: le aggiungiamo ora
+                chunk["stats"] = chunk_stats(serializers.columns_to_records(columns))
+                changed.append(chunk["path"])
+        else:
+            columns, sha, serializer = self._read_chunk(chunk["path"])
+        # Migrazione trasparente: i chunk ancora in YAML vengono riscritti
+        # (solo se la quota API lo permette, altrimenti alla prossima lettura)
+        if sha and serializer is not serializers.DEFAULT and has_headroom():
+            new_sha = self._migrate_chunk(chunk["path"], columns, sha)
+            if new_sha and chunk.get("sealed"):
+                chunk["sha"] = new_sha
+                changed.append(chunk["path"])
+        return schema.from_columns(columns)
+
+    def iter_frames(self):
+        """
+        La storia un chunk alla volta (un DataFrame per chunk), per esportare
+        senza costruire un secondo DataFrame con tutti i dati.
+        """
+        self._refresh_shas()
+        manifest, _ = self._read_manifest()
+        if manifest is None:
+            data, _ = self._read_file(self.legacy_path)
+            if data:
+                yield schema.from_records(data)
+            return
+        for chunk in manifest["chunks"]:
+            sha = chunk["sha"] if chunk.get("sealed") else self._sha_of(chunk["path"])
+            if sha is None:
+                continue
+            # Solo lettura della cache: un export completo non deve sfrattare i dati recenti
+            frame = self.snapshot_cache.get((self.username, sha))
+            if frame is None:
+                if chunk.get("sealed"):
+                    columns, _ = self._read_sealed(chunk)
+                else:
+                    columns, _, _ = self._read_chunk(chunk["path"])
+                frame = schema.from_columns(columns)
+            if not frame.empty:
+                yield frame
+
+    def _migrate_chunk(self, path, columns, sha):
+        """Riscrive un chunk nel formato di default. Ritorna il nuovo SHA (None se fallisce)."""
+        try:
+            return self._write_chunk(path, serializers.columns_to_records(columns), sha, "Migrate Format")
+        except Exception:
+            # La migrazione è opportunistica: riproveremo alla prossima lettura
+            return None
+
+    def _with_conflict_retry(self, fn):
+        """
+        Ritorna fn(); su un conflitto di SHA (409/422) la ripete, fino a
+        MAX_CONFLICT_RETRIES volte con un'attesa crescente. fn deve rileggere
+        lo stato a ogni tentativo.
+        """
+        for attempt in range(MAX_CONFLICT_RETRIES + 1):
+            try:
+                return fn()
+            except GithubException as e:
+                if e.status not in CONFLICT_STATUSES or attempt == MAX_CONFLICT_RETRIES:
+                    raise
+                time.sleep(0.2 * (attempt + 1))
+
+    @timed("backend.append")
+    def append_entries(self, entries: list):
+        """
+        Appende le entry al chunk di coda, sigillandolo quando si riempie.
+        Se qualcun altro ha scritto nel frattempo (SHA non più valido) rilegge,
+        scarta le entry già presenti e riprova. Solleva l'eccezione se fallisce.
+        Ritorna le entry effettivamente aggiunte.
+        """
+        appended = self._with_conflict_retry(lambda: self._append_once(entries))
+        try:
+            self._update_aggregates(appended)
+        except Exception:
+            # I dati sono salvati: aggregati indietro vengono ricostruiti al prossimo load
+            pass
+        return appended
+
+    def _rewrite_entry(self, eid: str, change) -> bool:
+        result = self._with_conflict_retry(lambda: self._rewrite_entry_once(eid, change))
+        if result is None:
+            return False
+        old, new = result
+        try:
+            self._update_aggregates([new] if new else [], removed=[old])
+        except Exception:
+            pass
+        return True
+
+    def _rewrite_entry_once(self, eid: str, change):
+        """
+        Trova il chunk con l'entry grazie all'indice id (ids.enc) e riscrive
+        solo quello. Ritorna (vecchia entry, nuova entry o None) oppure None.
+        """
+        self._refresh_shas()
+        manifest, manifest_sha = self._read_manifest()
+        if manifest is None:
+            manifest, manifest_sha = self._migrate_legacy()
+
+        index, _, ids_sha, index_changed = self._read_id_index(manifest)
+        if index_changed:
+            ids_sha = self._write_id_index(index, ids_sha)
+
+        d = entry_ids.digest(eid)
+        # La coda prima (è lì che finiscono le correzioni più frequenti), poi i
+        # sigillati il cui indice contiene l'id
+        candidates = [manifest["chunks"][-1]] + [
+            c for c in manifest["chunks"][:-1] if d in index[c["path"]]
+        ]
+        for chunk in candidates:
+            if chunk.get("sealed"):
+                columns, _ = self._read_sealed(chunk)
+                sha = chunk["sha"]
+            else:
+                columns, sha, _ = self._read_chunk(chunk["path"])
+            records = serializers.columns_to_records(columns)
+            idx = next((i for i, e in enumerate(records) if entry_ids.entry_id(e) == eid), None)
+            if idx is None:
+                continue
+
+            old = records[idx]
+            new = change(old)
+            if new is None:
+                del records[idx]
+            else:
+                records[idx] = new
+            new_sha = self._write_chunk(chunk["path"], records, sha, "Edit Entry")
+            if chunk.get("sealed"):
+                if new is None:
+                    # Un'entry eliminata non deve più bloccare un futuro append con lo stesso id
+                    index[chunk["path"]] = index[chunk["path"]] - {d}
+                    self._write_id_index(index, ids_sha)
+                chunk.update({"sha": new_sha, "count": len(records), "stats": chunk_stats(records)})
+                self._write_file(self.manifest_path, manifest, manifest_sha, "Update Manifest")
+            return old, new
+        return None
+
+    def _update_aggregates(self, appended: list, removed=()):
+        """Aggiorna in modo incrementale gli aggregati salvati, se esistono."""
+        if not appended and not removed:
+            return
+
+        def update_once():
+            data, sha = self._read_file(self.aggregates_path)
+            store = AggregateStore.from_saved(data)
+            if store is None:
+                # Mancano: li costruirà load_aggregates con una scansione completa
+                return
+            store.apply(appended, removed)
+            try:
+                self._write_file(self.aggregates_path, store.to_dict(), sha, "Update Aggregates")
+            except GithubException as e:
+                if e.status in CONFLICT_STATUSES:
+                    # Il prossimo tentativo deve leggere lo SHA nuovo
+                    self._refresh_shas()
+                raise
+        self._with_conflict_retry(update_once)
+
+    def _append_once(self, entries: list):
+        self._refresh_shas()
+        manifest, manifest_sha = self._read_manifest()
+        if manifest is None:
+            manifest, manifest_sha = self._migrate_legacy()
+
+        chunk_size = manifest.get("chunk_size", CHUNK_SIZE)
+        tail = manifest["chunks"][-1]
+        tail_columns, tail_sha, _ = self._read_chunk(tail["path"])
+        tail_data = serializers.columns_to_records(tail_columns)
+        manifest_changed = False
+        index, sealed, ids_sha, index_changed = self._read_id_index(manifest)
+
+        # Idempotenza: un'entry con un id già presente (coda o indice dei sigillati)
+        # non viene riscritta. Vale per doppi invii, retry e merge dopo un conflitto.
+        present = {entry_ids.entry_id(e) for e in tail_data}
+        pending = []
+        for e in entries:
+            eid = entry_ids.entry_id(e)
+            if eid in present or entry_ids.digest(eid) in sealed:
+                continue
+            present.add(eid)
+            pending.append(e if e.get("id") else {**e, "id": eid})
+        appended = list(pending)
+        while pending:
+            # max(): una coda già piena (es. manifest non aggiornato) viene sigillata subito
+            room = max(chunk_size - len(tail_data), 0)
+            added = pending[:room]
+            tail_data.extend(added)
+            pending = pending[room:]
+
+            if len(tail_data) < chunk_size:
+                self._write_chunk(tail["path"], tail_data, tail_sha, "Log Encrypted", added=added)
+                break
+
+            # Chunk pieno: lo sigilliamo e apriamo una nuova coda
+            sha = self._write_chunk(tail["path"], tail_data, tail_sha, "Seal Chunk", added=added)
+            tail.update({"sealed": True, "count": len(tail_data), "sha": sha, "stats": chunk_stats(tail_data)})
+            index[tail["path"]] = entry_ids.entry_digests(tail_data)
+            index_changed = True
+            tail = {"path": self._chunk_path(len(manifest["chunks"])), "sealed": False}
+            manifest["chunks"].append(tail)
+            tail_data, tail_sha = [], None
+            manifest_changed = True
+
+        # Prima l'indice, poi il manifest che lo rende visibile
+        if index_changed:
+            self._write_id_index(index, ids_sha)
+        if manifest_changed:
+            self._write_file(self.manifest_path, manifest, manifest_sha, "Update Manifest")
+        return appended
+
+    def count_entries(self) -> int:
+        """`count` dei chunk sigillati (dal manifest) più le righe della coda aperta."""
+        manifest, _ = self._read_manifest()
+        if manifest is None:
+            data, _ = self._read_file(self.legacy_path)
+            self.total_count = len(data or [])
+            return self.total_count
+        total = 0
+        for chunk in manifest["chunks"]:
+            if chunk.get("sealed"):
+                total += chunk.get("count", 0)
+                continue
+            sha = self._sha_of(chunk["path"])
+            if sha:
+                # La coda è al massimo CHUNK_SIZE entry, di solito già nella cache dei chunk
+                total += len(self.snapshot_cache.get_or_load(
+                    (self.username, sha), lambda: self._decode_chunk(chunk, sha, [])))
+        self.total_count = total
+        return total
+
+    @timed("backend.aggregates")
+    def load_aggregates(self) -> AggregateStore:
+        """
+        Aggregati salvati accanto ai dati. Se mancano o non coprono tutte le
+        entry dell'utente vengono ricostruiti dalla storia completa e risalvati.
+        """
+        if self.total_count is None:
+            self.count_entries()
+        try:
+            data, sha = self._read_file(self.aggregates_path)
+        except Exception:
+            data, sha = None, None
+        store = AggregateStore.from_saved(data)
+        if store is not None and store.count == self.total_count:
+            return store
+
+        store = AggregateStore.from_frame(self.load_data())
+        if has_headroom():
+            try:
+                self._write_file(self.aggregates_path, store.to_dict(), sha, "Rebuild Aggregates")
+            except Exception:
+                pass
+        return store
+
+
+class GitHubStorage(Storage):
+    """
+    Storage sul repo GitHub: i documenti sono file del repo e la versione è lo
+    SHA del blob; i dati di ogni utente sono gestiti da GitHubBackend.
+    """
+
+    def __init__(self, repo=None):
+        self._repo = repo
+        # path -> ContentFile dell'ultima lettura, per i GET condizionali (ETag)
+        self._contents = {}
+        self._lock = threading.Lock()
+
+    @property
+    def repo(self):
+        if self._repo is None:
+            self._repo = get_repo()
+        return self._repo
+
+    def read(self, path):
+        try:
+            content = self.repo.get_contents(path)
+        except UnknownObjectException:
+            return None, None
+        with self._lock:
+            self._contents[path] = content
+        return content.decoded_content, content.sha
+
+    def read_if_changed(self, path, version):
+        with self._lock:
+            content = self._contents.get(path)
+        if content is None or content.sha != version:
+            return super().read_if_changed(path, version)
+        # GitHub risponde 304 se il file non è cambiato: niente download
+        if not content.update():
+            return False, None, content.sha
+        return True, content.decoded_content, content.sha
+
+    def write(self, path, content, version, message):
+        try:
+            if version:
+                result = self.repo.update_file(path, message, content, version)
+            else:
+                result = self.repo.create_file(path, message, content)
+        except GithubException as e:
+            if e.status in CONFLICT_STATUSES:
+                raise ConflictError(path) from e
+            raise
+        with self._lock:
+            self._contents.pop(path, None)
+        return result["content"].sha
+
+    def backend(self, username, cipher):
+        backend = GitHubBackend(username, cipher)
+        backend._repo = self._repo
+        return backend
+
+    def has_headroom(self) -> bool:
+        return has_headroom()
+
+    def cache_stats(self) -> dict:
+        return get_snapshot_cache().stats()
@@ -0,0 +1,80 @@
+"""
+Cache locale su disco dei blob criptati, indicizzata per SHA git.
+
+I blob vengono salvati così come arrivano da GitHub (quindi ancora criptati):
+un file con lo stesso SHA non ha bisogno di essere riscaricato.
+L'eviction è LRU sulla dimensione totale, condivisa fra tutti gli utenti.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+
+def git_blob_sha(data: bytes) -> str:
+    """SHA che GitHub assegna al blob (sha1 di 'blob <len>\\0' + contenuto)."""
+    h = hashlib.sha1(f"blob {len(data)}\0".encode())
+    h.update(data)
+    return h.hexdigest()
+
+
+class BlobCache:
+    def __init__(self, directory: str, max_bytes: int = 200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sha: str) -> str:
+        return os.path.join(self.directory, sha)
+
+    def get(self, sha: str):
+        """Ritorna il blob in cache o None. Un blob corrotto viene scartato."""
+        path = self._path(sha)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if git_blob_sha(data) != sha:
+            self._discard(path)
+            return None
+        # Aggiorna l'mtime: è il nostro "ultimo accesso" per l'LRU
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, sha: str, data: bytes):
+        # Scrittura atomica: un lettore concorrente vede il file intero o niente
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(sha))
+        self._evict()
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for e in os.scandir(self.directory):
+                if e.name.startswith(".tmp-") or not e.is_file():
+                    continue
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+            if total <= self.max_bytes:
+                return
+            # Rimuove i meno usati di recente finché si rientra nel budget
+            for _, size, path in sorted(entries):
+                self._discard(path)
+                total -= size
+                if total <= self.max_bytes:
+                    break
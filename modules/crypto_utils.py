@@ -1,40 +1,301 @@
 import base64
-from cryptography.fernet import Fernet
+import io
+import os
+import zlib
+from collections import OrderedDict
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 import bcrypt
+import zstandard
+from modules import stream_cipher
+from modules.telemetry import timed
 
-def derive_key(password: str, salt: bytes = b'static_salt_log_app') -> bytes:
+# Salt storico condiviso: usato solo per leggere i dati scritti prima del keyring
+DEFAULT_SALT = b'static_salt_log_app'
+
+# Parametri KDF versionati per la chiave che protegge la data key (KEK).
+# Per alzarli basta aggiungere una versione: al login successivo il keyring
+# viene ri-avvolto in O(1), senza toccare i dati.
+KDF_VERSIONS = {
+    1: {"name": "pbkdf2-sha256", "iterations": 100_000},
+    2: {"name": "scrypt", "n": 2 ** 15, "r": 8, "p": 1},
+}
+CURRENT_KDF_VERSION = 2
+KEYRING_VERSION = 1
+
+@timed("crypto.kdf")
+def derive_key(password: str, salt: bytes = DEFAULT_SALT, kdf_version: int = 1) -> bytes:
     """Trasforma la password umana in una chiave di crittografia a 32 byte URL-safe."""
-    # In produzione, il salt dovrebbe essere univoco per utente, ma per semplicità usiamo uno statico
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100_000,
-    )
+    params = KDF_VERSIONS[kdf_version]
+    if params["name"] == "scrypt":
+        kdf = Scrypt(salt=salt, length=32, n=params["n"], r=params["r"], p=params["p"])
+    else:
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=params["iterations"],
+        )
     key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
     return key
 
-def encrypt_data(data_str: str, password: str) -> str:
-    """Cripta una stringa usando la password."""
-    key = derive_key(password)
-    f = Fernet(key)
-    # Fernet vuole bytes, ritorna bytes. Noi lavoriamo con stringhe
-    encrypted_bytes = f.encrypt(data_str.encode())
-    return encrypted_bytes.decode('utf-8')
-
-def decrypt_data(encrypted_str: str, password: str) -> str:
-    """Decripta una stringa usando la password."""
-    key = derive_key(password)
-    f = Fernet(key)
-    decrypted_bytes = f.decrypt(encrypted_str.encode())
-    return decrypted_bytes.decode('utf-8')
+
+# --- KEYRING (ENVELOPE ENCRYPTION) ---
+# I dati sono cifrati con una data key casuale per utente; la password serve
+# solo ad avvolgere (wrap) quella chiave. Cambiare password = ri-avvolgere 32 byte.
+
+def _wrap(data_key: bytes, password: str, kdf_version: int) -> dict:
+    salt = os.urandom(16)
+    kek = Fernet(derive_key(password, salt, kdf_version))
+    return {
+        "kdf": kdf_version,
+        "salt": base64.b64encode(salt).decode(),
+        "wrapped_key": kek.encrypt(data_key).decode(),
+    }
+
+def _unwrap(keyring: dict, password: str) -> bytes:
+    """Ritorna la data key. Solleva InvalidToken se la password è sbagliata."""
+    kek = Fernet(derive_key(password, keyring_salt(keyring), keyring["kdf"]))
+    return kek.decrypt(keyring["wrapped_key"].encode())
+
+def keyring_salt(keyring: dict) -> bytes:
+    return base64.b64decode(keyring["salt"])
+
+def create_keyring(password: str, legacy_keys=()) -> dict:
+    """
+    Nuovo keyring con data key casuale. Le chiavi legacy (dati scritti prima
+    del keyring) vengono conservate cifrate con la data key.
+    """
+    data_key = Fernet.generate_key()
+    data_cipher = Fernet(data_key)
+    return {
+        "version": KEYRING_VERSION,
+        **_wrap(data_key, password, CURRENT_KDF_VERSION),
+        "legacy_keys": [data_cipher.encrypt(k).decode() for k in legacy_keys],
+    }
+
+class DataCipher(MultiFernet):
+    """
+    MultiFernet dei dati che conosce anche le chiavi per il formato a frame
+    (stream_cipher), derivate dalle stesse chiavi: la prima cifra, tutte decifrano.
+    """
+
+    def __init__(self, keys: list):
+        super().__init__([Fernet(k) for k in keys])
+        stream_keys = [stream_cipher.derive_stream_key(k) for k in keys]
+        self.stream_key = stream_keys[0]
+        self.stream_keys = {stream_cipher.key_id(k): k for k in stream_keys}
+
+
+def open_keyring(keyring: dict, password: str) -> DataCipher:
+    """Cipher dei dati: cripta con la data key, decripta anche con le chiavi legacy."""
+    data_key = _unwrap(keyring, password)
+    data_cipher = Fernet(data_key)
+    legacy = [data_cipher.decrypt(k.encode()) for k in keyring.get("legacy_keys", [])]
+    return DataCipher([data_key] + legacy)
+
+def rewrap_keyring(keyring: dict, old_password: str, new_password: str) -> dict:
+    """Ri-avvolge la data key (nuova password e/o KDF più recente). Nessun dato da ricifrare."""
+    data_key = _unwrap(keyring, old_password)
+    return {**keyring, **_wrap(data_key, new_password, CURRENT_KDF_VERSION)}
+
+
+class KeyCache:
+    """
+    Cache limitata dei cipher già sbloccati, indicizzata per (utente, salt).
+    La KDF gira una sola volta al login: dopo si passano in giro solo
+    gli oggetti Fernet/MultiFernet, mai la password.
+    """
+
+    def __init__(self, max_size: int = 4):
+        self.max_size = max_size
+        self._ciphers = OrderedDict()
+
+    def put(self, username: str, salt: bytes, cipher):
+        self._ciphers[(username, salt)] = cipher
+        self._ciphers.move_to_end((username, salt))
+        while len(self._ciphers) > self.max_size:
+            self._ciphers.popitem(last=False)
+        return cipher
+
+    def get(self, username: str, salt: bytes):
+        """Ritorna il cipher già sbloccato, o None se non è in cache."""
+        cipher = self._ciphers.get((username, salt))
+        if cipher is not None:
+            self._ciphers.move_to_end((username, salt))
+        return cipher
+
+    def clear(self):
+        self._ciphers.clear()
+
+
+# --- COMPRESSIONE (PRIMA DELLA CIFRATURA) ---
+# Il testo cifrato non si comprime più: si comprime il payload in chiaro e lo si
+# fa precedere da un header versionato. I blob scritti prima non hanno header
+# (YAML o colonnare "LLC1") e vengono restituiti così come sono.
+# Header: BLOB_MAGIC + versione + codec. Il byte NUL iniziale non può aprire
+# né un testo YAML né un chunk colonnare.
+BLOB_MAGIC = b"\x00LLB"
+BLOB_VERSION = 1
+CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD = 0, 1, 2
+ZSTD_LEVEL = 9
+# Sotto questa dimensione la compressione non ripaga l'header
+MIN_COMPRESS_SIZE = 64
+# Dimensione massima dei pezzi di testo in chiaro passati ai parser
+DECOMPRESS_PIECE = 64 * 1024
+# Primo byte di un token Fernet non codificato in base64
+FERNET_VERSION = b"\x80"
+
+# Dizionari zstd registrati (id -> dizionario); _dictionary è quello usato in scrittura
+_dictionaries = {}
+_dictionary = None
+
+
+def train_dictionary(samples: list, size: int = 16 * 1024) -> bytes:
+    """
+    Addestra un dizionario zstd su payload in chiaro tipici (chunk, manifest).
+    Aiuta sui blob piccoli, dove la compressione da sola ha poco contesto.
+    """
+    return zstandard.train_dictionary(size, samples).as_bytes()
+
+
+def set_dictionary(data: bytes = None):
+    """
+    Registra un dizionario zstd e lo usa per le nuove scritture (None = nessuno).
+    I blob scritti con un dizionario si leggono solo se quel dizionario è
+    registrato: l'id è nel frame zstd, i vecchi dizionari vanno tenuti.
+    """
+    global _dictionary
+    if data is None:
+        _dictionary = None
+        return
+    dictionary = zstandard.ZstdCompressionDict(data)
+    _dictionaries[dictionary.dict_id()] = dictionary
+    _dictionary = dictionary
+
+
+def compress_payload(data: bytes) -> bytes:
+    """Header + payload compresso con zstd (zlib resta solo in lettura, per i blob già scritti)."""
+    codec, body = CODEC_NONE, data
+    if len(data) >= MIN_COMPRESS_SIZE:
+        codec = CODEC_ZSTD
+        body = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=_dictionary).compress(data)
+        if len(body) >= len(data):
+            codec, body = CODEC_NONE, data
+    return BLOB_MAGIC + bytes((BLOB_VERSION, codec)) + body
+
+
+def decompress_payload(data: bytes) -> bytes:
+    """Inverso di compress_payload; i blob legacy senza header passano invariati."""
+    if not data.startswith(BLOB_MAGIC):
+        return data
+    header = len(BLOB_MAGIC)
+    version, codec = data[header], data[header + 1]
+    body = data[header + 2:]
+    if version != BLOB_VERSION:
+        raise ValueError(f"Versione del blob non supportata: {version}")
+    if codec == CODEC_NONE:
+        return body
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(body)
+    if codec == CODEC_ZSTD:
+        dict_id = zstandard.get_frame_parameters(body).dict_id
+        dictionary = _dictionaries.get(dict_id) if dict_id else None
+        if dict_id and dictionary is None:
+            raise RuntimeError(f"Blob compresso con il dizionario zstd {dict_id}, non registrato.")
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(body)
+    raise ValueError(f"Codec di compressione sconosciuto: {codec}")
+
+
+@timed("crypto.encrypt")
+def encrypt_bytes(data: bytes, cipher) -> bytes:
+    """
+    Comprime e cripta un payload con il cipher già derivato. Con un
+    DataCipher il blob è nel formato a frame (decifrabile a pezzi), altrimenti
+    è il token Fernet decodificato dal base64 (un quarto di byte in meno).
+    """
+    payload = compress_payload(data)
+    if getattr(cipher, "stream_key", None) is not None:
+        return stream_cipher.encrypt(payload, cipher.stream_key)
+    return base64.urlsafe_b64decode(cipher.encrypt(payload))
+
+def iter_decrypt(blob: bytes, cipher):
+    """
+    Testo in chiaro (già decompresso) di un blob, a pezzi. Il formato a frame
+    si decifra un frame alla volta; i token Fernet (binari o in base64, dei
+    blob scritti prima) tutti insieme.
+    """
+    if stream_cipher.is_stream(blob):
+        pieces = stream_cipher.decrypt(blob, getattr(cipher, "stream_keys", {}))
+    else:
+        # Un token binario inizia con il byte di versione di Fernet (0x80),
+        # quelli scritti prima sono ancora in base64 ("gAAAA...")
+        token = base64.urlsafe_b64encode(blob) if blob[:1] == FERNET_VERSION else blob
+        pieces = iter([cipher.decrypt(token)])
+    return _iter_decompress(pieces)
+
+def open_decrypted(blob: bytes, cipher) -> io.BufferedReader:
+    """File binario con il testo in chiaro di un blob, per i parser che leggono a pezzi."""
+    return io.BufferedReader(stream_cipher.IterReader(iter_decrypt(blob, cipher)), DECOMPRESS_PIECE)
+
+def _iter_decompress(pieces):
+    """Come decompress_payload, ma su un iteratore: mai più di DECOMPRESS_PIECE byte per pezzo in uscita."""
+    head = b""
+    for piece in pieces:
+        head += piece
+        if len(head) >= len(BLOB_MAGIC) + 2:
+            break
+    if not head.startswith(BLOB_MAGIC):
+        # Payload legacy senza header
+        if head:
+            yield head
+        yield from pieces
+        return
+    header = len(BLOB_MAGIC)
+    version, codec = head[header], head[header + 1]
+    if version != BLOB_VERSION:
+        raise ValueError(f"Versione del blob non supportata: {version}")
+    rest = head[header + 2:]
+    if codec == CODEC_NONE:
+        if rest:
+            yield rest
+        yield from pieces
+    elif codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj()
+        for piece in _chain(rest, pieces):
+            data = piece
+            while data:
+                out = decompressor.decompress(data, DECOMPRESS_PIECE)
+                data = decompressor.unconsumed_tail
+                if out:
+                    yield out
+        out = decompressor.flush()
+        if out:
+            yield out
+    elif codec == CODEC_ZSTD:
+        source = io.BufferedReader(stream_cipher.IterReader(_chain(rest, pieces)))
+        dict_id = zstandard.get_frame_parameters(source.peek(18)).dict_id
+        dictionary = _dictionaries.get(dict_id) if dict_id else None
+        if dict_id and dictionary is None:
+            raise RuntimeError(f"Blob compresso con il dizionario zstd {dict_id}, non registrato.")
+        decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        yield from decompressor.read_to_iter(source, write_size=DECOMPRESS_PIECE)
+    else:
+        raise ValueError(f"Codec di compressione sconosciuto: {codec}")
+
+def _chain(first: bytes, pieces):
+    if first:
+        yield first
+    yield from pieces
 
 # Funzioni per gestire gli Hash delle password (Login)
+@timed("crypto.bcrypt")
 def hash_password(password: str) -> str:
     # Genera un salt e fa l'hash
     return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
 
+@timed("crypto.bcrypt")
 def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
\ No newline at end of file
+    return bcrypt.checkpw(password.encode(), hashed.encode())
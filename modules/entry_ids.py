@@ -0,0 +1,99 @@
+"""
+Identità delle entry.
+
+Le nuove entry ricevono un ULID (ordinabile per tempo, generato dal form);
+quelle storiche senza id vengono identificate dall'hash del loro contenuto
+normalizzato, che ricevono come id salvato alla prima riscrittura del chunk.
+Nell'indice dei chunk sigillati (ids.enc, vedi backend) gli id sono salvati
+come digest da 8 byte ordinati e concatenati: compatto e, una volta caricato
+in un set, sufficiente per deduplicare in O(1).
+"""
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+DIGEST_SIZE = 8
+
+
+def new_id() -> str:
+    """ULID: 48 bit di millisecondi + 80 bit casuali, in base32 Crockford (26 caratteri)."""
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), "big")
+    chars = []
+    for _ in range(26):
+        chars.append(_CROCKFORD[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+# Campi esclusi dall'id di contenuto: flag del form, non dati dell'entry
+_NOT_CONTENT = {"id", "is_valid"}
+
+
+def _missing(value) -> bool:
+    if value is None or value == "":
+        return True
+    try:
+        # NaN e NaT sono diversi da se stessi; pd.NA non si converte in bool
+        return bool(value != value)
+    except TypeError:
+        return True
+
+
+def _canonical(key, value) -> str:
+    """
+    Valore normalizzato per content_id: uguale per un'entry letta dal YAML
+    storico e per la stessa riga passata dallo schema tipizzato (Float32,
+    Timestamp, interi nullable).
+    """
+    if key == "timestamp":
+        if not hasattr(value, "strftime"):
+            try:
+                value = datetime.fromisoformat(str(value).strip())
+            except ValueError:
+                return str(value).strip()
+        if not isinstance(value, datetime):
+            value = datetime(value.year, value.month, value.day)
+        return value.isoformat(sep=" ", timespec="seconds")
+    if type(value).__name__ in ("bool", "bool_"):
+        return "true" if value else "false"
+    if isinstance(value, str):
+        return value.strip()
+    try:
+        # 20, 20.0 e il Float32 20.1 (20.100000381...) diventano lo stesso testo
+        return format(float(value), ".6g")
+    except (TypeError, ValueError):
+        return str(value).strip()
+
+
+def content_id(entry: dict) -> str:
+    """Id deterministico per le entry che non ne hanno uno (dati storici, import)."""
+    payload = {k: _canonical(k, v) for k, v in entry.items() if k not in _NOT_CONTENT and not _missing(v)}
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return "h" + hashlib.sha256(canonical.encode()).hexdigest()[:25]
+
+
+def entry_id(entry: dict) -> str:
+    """Id salvato dell'entry o, se non ne ha uno, quello calcolato dal contenuto."""
+    eid = entry.get("id")
+    return eid if isinstance(eid, str) and eid else content_id(entry)
+
+
+def digest(eid: str) -> bytes:
+    return hashlib.blake2b(eid.encode(), digest_size=DIGEST_SIZE).digest()
+
+
+def pack_digests(digests) -> bytes:
+    """Indice compatto: digest ordinati e concatenati."""
+    return b"".join(sorted(digests))
+
+
+def unpack_digests(raw: bytes) -> set:
+    return {raw[i:i + DIGEST_SIZE] for i in range(0, len(raw), DIGEST_SIZE)}
+
+
+def entry_digests(entries) -> set:
+    """Digest degli id di una lista di entry."""
+    return {digest(entry_id(e)) for e in entries}
@@ -0,0 +1,61 @@
+"""
+Client GitHub condiviso da tutto il processo.
+
+Un solo oggetto Github (quindi una sola sessione requests con keep-alive e
+pool di connessioni) e un solo handle del repo, usati sia da auth che dal
+backend. Il repo è "lazy": nessuna chiamata GET /repos per ottenerlo.
+PyGithub si importa alla prima richiesta, non con il modulo (serve solo dopo il login).
+"""
+import time
+import streamlit as st
+
+DEFAULT_API_URL = "https://api.github.com"
+# Connessioni HTTP tenute aperte verso l'API (sessioni concorrenti del server)
+POOL_SIZE = 16
+# Sotto questa soglia di richieste residue le operazioni non essenziali si fermano
+MIN_HEADROOM = 100
+# PyGithub di default distanzia le richieste di ogni istanza (0.25 s, 1 s per le scritture):
+# con un client unico per il processo varrebbe per tutte le sessioni insieme. Le letture
+# non si distanziano (quota: has_headroom, 403/429: GithubRetry); le scritture poco.
+SECONDS_BETWEEN_REQUESTS = None
+SECONDS_BETWEEN_WRITES = 0.05
+
+
+@st.cache_resource
+def get_github():
+    from github import Auth, Github
+    return Github(
+        auth=Auth.Token(st.secrets["GITHUB_TOKEN"]),
+        base_url=st.secrets.get("GITHUB_API_URL", DEFAULT_API_URL),
+        pool_size=POOL_SIZE,
+        seconds_between_requests=SECONDS_BETWEEN_REQUESTS,
+        seconds_between_writes=SECONDS_BETWEEN_WRITES,
+        # Oggetti lazy: get_repo() non fa nessuna richiesta
+        lazy=True,
+    )
+
+
+@st.cache_resource
+def get_repo():
+    return get_github().get_repo(st.secrets["REPO_NAME"])
+
+
+def rate_limit_headroom():
+    """
+    Ritorna (richieste residue, limite, secondi al reset).
+    Usa gli header dell'ultima risposta: nessuna chiamata extra salvo la prima volta.
+    """
+    g = get_github()
+    remaining, limit = g.rate_limiting
+    reset_in = max(0, int(g.rate_limiting_resettime - time.time()))
+    return remaining, limit, reset_in
+
+
+def has_headroom(min_remaining: int = MIN_HEADROOM) -> bool:
+    """True se possiamo permetterci chiamate non indispensabili."""
+    try:
+        remaining, _, _ = rate_limit_headroom()
+    except Exception:
+        # Senza informazioni non blocchiamo nessuno
+        return True
+    return remaining >= min_remaining
@@ -1,41 +1,99 @@
 from datetime import datetime
 import pandas as pd
+from modules.telemetry import timed
+
+# --- REGISTRO ---
+# Le "slice" sono sottoinsiemi dei dati calcolati una volta sola per get_prompts;
+# ogni regola dichiara quelle che le servono e riceve solo quelle.
+SLICES = {}
+RULES = []
+
+def slice_builder(name):
+    def register(fn):
+        SLICES[name] = fn
+        return fn
+    return register
+
+def rule(*needs):
+    """Registra una regola: fn(slices) -> prompt (dict) oppure None."""
+    def register(fn):
+        RULES.append((fn, needs))
+        return fn
+    return register
+
+
+@slice_builder("today")
+def _today(df, ts, now):
+    start = pd.Timestamp(now.date())
+    return df[(ts >= start) & (ts < start + pd.Timedelta(days=1))]
+
+@slice_builder("last_7_days")
+def _last_7_days(df, ts, now):
+    return df[ts >= pd.Timestamp(now.date()) - pd.Timedelta(days=7)]
+
+@slice_builder("last_entry")
+def _last_entry(df, ts, now):
+    """Ultima entry per attività (indice = activity_type), senza ordinare tutta la tabella."""
+    valid = ts.notna()
+    if not valid.any():
+        return df.iloc[0:0].set_index('activity_type')
+    last_idx = ts[valid].groupby(df.loc[valid, 'activity_type'], observed=True).idxmax()
+    return df.loc[last_idx.values].set_index('activity_type')
+
+
+# --- REGOLE ---
+# SUGGERIMENTO 1: Non hai ancora letto?
+# Controlla l'ultimo libro letto e se oggi non è stato loggato
+@rule("today", "last_entry")
+def continue_reading(slices):
+    last = slices["last_entry"]
+    if "📚 Lettura" not in last.index:
+        return None
+    book_title = last.loc["📚 Lettura", 'dettaglio']
+    if pd.isna(book_title) or book_title in slices["today"]['dettaglio'].values:
+        return None
+    return {
+        "id": "read_cont",
+        "msg": f"Continui a leggere '{book_title}'?",
+        "activity": "📚 Lettura",
+        "dettaglio": book_title
+    }
+
+# SUGGERIMENTO 2: Non hai fatto sport?
+@rule("today")
+def sport_check(slices):
+    if "💪 Sport" in slices["today"]['activity_type'].values:
+        return None
+    return {
+        "id": "sport_check",
+        "msg": "Niente sport oggi? Inserisci sessione rapida.",
+        "activity": "💪 Sport",
+        "dettaglio": "Palestra" # Default
+    }
+
 
 class SuggestionEngine:
-    def __init__(self, df):
+    """Valuta tutte le regole registrate. Non modifica il DataFrame ricevuto."""
+
+    def __init__(self, df, now=None):
         self.df = df
-        self.today_str = datetime.now().strftime("%Y-%m-%d")
+        self.now = now or datetime.now()
 
+    @timed("engine.suggestions")
     def get_prompts(self):
         prompts = []
         if self.df.empty: return prompts
 
-        # Filtra dati di oggi
-        # Assicuriamoci che timestamp sia datetime o stringa gestibile
-        self.df['date_str'] = self.df['timestamp'].astype(str).str.slice(0, 10)
-        today_data = self.df[self.df['date_str'] == self.today_str]
-
-        # SUGGERIMENTO 1: Non hai ancora letto?
-        # Controlla se ieri hai letto un libro e oggi no
-        last_reading = self.df[self.df['activity_type'] == "📚 Lettura"].sort_values('timestamp').tail(1)
-        if not last_reading.empty:
-            book_title = last_reading.iloc[0]['dettaglio']
-            # Se quel libro non è stato loggato oggi
-            if book_title not in today_data['dettaglio'].values:
-                prompts.append({
-                    "id": "read_cont",
-                    "msg": f"Continui a leggere '{book_title}'?",
-                    "activity": "📚 Lettura",
-                    "dettaglio": book_title
-                })
-
-        # SUGGERIMENTO 2: Non hai fatto sport?
-        if "💪 Sport" not in today_data['activity_type'].values:
-            prompts.append({
-                "id": "sport_check",
-                "msg": "Niente sport oggi? Inserisci sessione rapida.",
-                "activity": "💪 Sport",
-                "dettaglio": "Palestra" # Default
-            })
-            
-        return prompts
\ No newline at end of file
+        # Timestamp come datetime (senza aggiungere colonne allo snapshot condiviso)
+        ts = self.df['timestamp']
+        if not pd.api.types.is_datetime64_any_dtype(ts):
+            ts = pd.to_datetime(ts, errors='coerce')
+
+        needed = {name for _, needs in RULES for name in needs}
+        slices = {name: SLICES[name](self.df, ts, self.now) for name in needed}
+
+        for fn, needs in RULES:
+            prompt = fn({name: slices[name] for name in needs})
+            if prompt:
+                prompts.append(prompt)
+        return prompts
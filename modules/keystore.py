@@ -0,0 +1,92 @@
+"""
+Keyring per utente: data_{username}/keyring.yaml.
+
+Contiene la data key avvolta dalla password (salt per utente, KDF versionata)
+e, cifrate con la data key, le chiavi legacy dei dati scritti prima del keyring.
+Il file non contiene segreti in chiaro, quindi è salvato in YAML semplice.
+"""
+import yaml
+from modules.crypto_utils import (
+    CURRENT_KDF_VERSION, DEFAULT_SALT, create_keyring, derive_key,
+    keyring_salt, open_keyring, rewrap_keyring,
+)
+from modules.telemetry import timed
+
+
+def keyring_path(username: str) -> str:
+    return f"data_{username}/keyring.yaml"
+
+
+def load_keyring(storage, username):
+    """Ritorna (keyring, versione) o (None, None) se l'utente non ne ha ancora uno."""
+    content, version = storage.read(keyring_path(username))
+    if content is None:
+        return None, None
+    return yaml.safe_load(content.decode()), version
+
+
+def save_keyring(storage, username, keyring, sha=None):
+    content = yaml.dump(keyring, sort_keys=False).encode()
+    storage.write(keyring_path(username), content, sha, "Update Keyring" if sha else "Init Keyring")
+
+
+def initialize(storage, username, password):
+    """Keyring per un utente appena registrato (nessun dato legacy)."""
+    save_keyring(storage, username, create_keyring(password))
+
+
+@timed("keystore.unlock")
+def unlock(storage, username, password):
+    """
+    Sblocca la data key dell'utente. Ritorna (cipher, salt).
+    - Utente senza keyring: lo crea, conservando la chiave legacy (salt statico)
+      così i dati esistenti restano leggibili senza ricifrarli.
+    - KDF più vecchia di quella attuale: ri-avvolge la chiave (O(1)).
+    """
+    keyring, sha = load_keyring(storage, username)
+    if keyring is None:
+        keyring = create_keyring(password, legacy_keys=[derive_key(password, DEFAULT_SALT)])
+        save_keyring(storage, username, keyring)
+    elif keyring["kdf"] < CURRENT_KDF_VERSION:
+        # Anche se il salvataggio fallisce il keyring attuale resta valido
+        try:
+            upgraded = rewrap_keyring(keyring, password, password)
+            save_keyring(storage, username, upgraded, sha)
+            keyring = upgraded
+        except Exception:
+            pass
+    return open_keyring(keyring, password), keyring_salt(keyring)
+
+
+@timed("keystore.open")
+def open_current(storage, username, password):
+    """
+    Solo lettura: se il keyring esiste ed è alla KDF attuale ritorna (cipher, salt),
+    altrimenti None (serve unlock, che può scrivere). Non salva niente, quindi
+    si può eseguire prima di aver verificato la password (vedi auth.authenticate_user).
+    """
+    keyring, _ = load_keyring(storage, username)
+    if keyring is None or keyring["kdf"] < CURRENT_KDF_VERSION:
+        return None
+    return open_keyring(keyring, password), keyring_salt(keyring)
+
+
+def change_password(storage, username, old_password, new_password):
+    """
+    Ri-avvolge la data key con la nuova password: nessun dato viene ricifrato.
+    Ritorna (cipher, salt, rollback) dove rollback() ripristina il keyring precedente.
+    """
+    keyring, sha = load_keyring(storage, username)
+    if keyring is None:
+        # Prima crea il keyring con la vecchia password, poi lo ruota
+        unlock(storage, username, old_password)
+        keyring, sha = load_keyring(storage, username)
+
+    rotated = rewrap_keyring(keyring, old_password, new_password)
+    save_keyring(storage, username, rotated, sha)
+
+    def rollback():
+        _, current_sha = load_keyring(storage, username)
+        save_keyring(storage, username, keyring, current_sha)
+
+    return open_keyring(rotated, new_password), keyring_salt(rotated), rollback
@@ -0,0 +1,114 @@
+"""
+Schema tipizzato dei DataFrame delle entry.
+
+Le colonne ripetute (attività, unità, dettaglio) sono categoriche, le metriche
+float32/int32 nullable e il timestamp datetime64 letto con un formato
+esplicito. I campi specifici delle attività (BaseActivity.extra_fields) si
+aggiungono qui in un solo punto, così backend, app e import usano gli stessi
+tipi. Le colonne non dichiarate restano come pandas le deduce.
+"""
+from functools import lru_cache
+import pandas as pd
+from modules import entry_ids
+
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Colonne comuni a tutte le entry (id e note restano stringhe)
+BASE_DTYPES = {
+    "activity_type": "category",
+    "dettaglio": "category",
+    "unita": "category",
+    "metrica": "Float32",
+    # Salvato dal form della lettura
+    "is_valid": "boolean",
+}
+# Tipo Python dichiarato in extra_fields -> dtype compatto
+PYTHON_DTYPES = {int: "Int32", float: "Float32", bool: "boolean", str: "category"}
+COLUMNS = ["timestamp", "activity_type", "note", "dettaglio", "metrica", "unita"]
+
+
+
+def ts_str(value):
+    """Timestamp nel formato salvato (TS_FORMAT), confrontabile come stringa; None se manca."""
+    if value is None:
+        return None
+    if hasattr(value, "strftime"):
+        return value.strftime(TS_FORMAT)
+    return str(value)[:19]
+
+
+@lru_cache(maxsize=1)
+def dtypes() -> dict:
+    """Dtype di tutte le colonne note: base più i campi registrati dalle attività."""
+    from modules.activities import get_all_activities
+    result = dict(BASE_DTYPES)
+    for activity in get_all_activities():
+        for field, kind in activity.extra_fields.items():
+            result.setdefault(field, PYTHON_DTYPES.get(kind, "object"))
+    return result
+
+
+def parse_timestamps(values) -> pd.Series:
+    """Formato esplicito (veloce); solo i valori in un altro formato passano dal parser generico."""
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    parsed = pd.to_datetime(values, format=TS_FORMAT, errors="coerce")
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry].astype(str), format="mixed", errors="coerce")
+    return parsed
+
+
+def apply(frame: pd.DataFrame) -> pd.DataFrame:
+    """Porta le colonne note ai dtype dello schema (in place) e ritorna il frame."""
+    if frame.empty:
+        return frame
+    if "timestamp" in frame.columns:
+        frame["timestamp"] = parse_timestamps(frame["timestamp"])
+    for column, dtype in dtypes().items():
+        if column in frame.columns and frame[column].dtype != dtype:
+            if dtype in ("Float32", "Int32"):
+                values = pd.to_numeric(frame[column], errors="coerce")
+                if dtype == "Int32":
+                    # Valori non interi (es. 350.5) non entrano in un intero: restano float
+                    whole = values.dropna()
+                    if not (whole == whole.round()).all():
+                        dtype = "Float32"
+                frame[column] = values.astype(dtype)
+            else:
+                frame[column] = frame[column].astype(dtype)
+    return frame
+
+
+def from_columns(columns: dict) -> pd.DataFrame:
+    """DataFrame tipizzato da un dict di colonne (formato dei chunk)."""
+    return apply(pd.DataFrame(columns))
+
+
+def from_records(records: list) -> pd.DataFrame:
+    return apply(pd.DataFrame(records))
+
+
+def empty() -> pd.DataFrame:
+    return pd.DataFrame(columns=COLUMNS)
+
+
+def concat(frames) -> pd.DataFrame:
+    """
+    Concatena frame tipizzati. pd.concat trasforma in testo le categoriche con
+    categorie diverse (es. titoli diversi in due chunk): si ricategorizzano alla fine.
+    """
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return empty()
+    out = pd.concat(frames, ignore_index=True)
+    for column, dtype in dtypes().items():
+        if dtype == "category" and column in out.columns and not isinstance(out[column].dtype, pd.CategoricalDtype):
+            out[column] = out[column].astype("category")
+    return out
+
+
+def row_ids(frame: pd.DataFrame) -> pd.Series:
+    """Id di ogni riga: quello salvato o, per le entry storiche che non ce l'hanno, quello di contenuto."""
+    return pd.Series([entry_ids.entry_id(r) for r in frame.to_dict("records")], index=frame.index, dtype=object)
@@ -0,0 +1,147 @@
+"""
+Serializzatori per i chunk di log.
+
+Ogni serializer trasforma una lista di entry (dict) in bytes e viceversa.
+Il formato viene riconosciuto dai primi byte, così i vecchi blob YAML
+continuano a essere letti e possono essere riscritti nel formato nuovo.
+"""
+import calendar
+from datetime import datetime, timezone
+import msgpack
+import yaml
+from modules.schema import TS_FORMAT
+from modules.telemetry import timed
+
+TS_COLUMNS = {"timestamp"}
+# Colonne a bassa cardinalità: salvate come dizionario + codici interi
+DICT_COLUMNS = {"activity_type", "unita", "dettaglio"}
+
+
+def _ts_to_epoch(value):
+    """
+    Epoch in secondi (None se mancante). Solleva ValueError se il valore non è
+    esattamente in TS_FORMAT: convertirlo perderebbe il formato originale.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        if value.microsecond or value.tzinfo is not None:
+            raise ValueError(f"timestamp non rappresentabile in secondi: {value!r}")
+    else:
+        text = str(value)
+        value = datetime.strptime(text, TS_FORMAT)
+        if value.strftime(TS_FORMAT) != text:
+            raise ValueError(f"timestamp non nel formato standard: {text!r}")
+    # Timestamp "naive": lo trattiamo come UTC solo per avere un intero stabile
+    return calendar.timegm(value.timetuple())
+
+
+def _epoch_to_ts(value):
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).strftime(TS_FORMAT)
+
+
+class YamlSerializer:
+    """Formato storico: lista di dict in YAML."""
+    name = "yaml"
+
+    def dumps(self, entries: list) -> bytes:
+        return yaml.dump(entries, sort_keys=False, allow_unicode=True).encode("utf-8")
+
+    def read_columns(self, stream) -> dict:
+        return records_to_columns(yaml.safe_load(stream) or [])
+
+
+class ColumnarSerializer:
+    """
+    Formato colonnare su msgpack:
+    {"n": righe, "columns": {nome: {"t": tipo, ...}}}
+    - "ts":   epoch in secondi (None se mancante), solo se tutti i valori sono in TS_FORMAT
+    - "dict": valori distinti + codici (-1 = mancante)
+    - "raw":  lista di valori così come sono
+    """
+    name = "columnar"
+    MAGIC = b"LLC1"
+
+    def dumps(self, entries: list) -> bytes:
+        columns = records_to_columns(entries)
+        encoded = {}
+        for col, values in columns.items():
+            if col in TS_COLUMNS:
+                try:
+                    encoded[col] = {"t": "ts", "v": [_ts_to_epoch(v) for v in values]}
+                except ValueError:
+                    # Qualche valore in un altro formato (es. ISO o solo data): la colonna
+                    # resta com'è e la interpreta schema.parse_timestamps alla lettura
+                    encoded[col] = {"t": "raw", "v": values}
+            elif col in DICT_COLUMNS:
+                lookup, codes = {}, []
+                for v in values:
+                    if v is None:
+                        codes.append(-1)
+                    else:
+                        codes.append(lookup.setdefault(v, len(lookup)))
+                encoded[col] = {"t": "dict", "d": list(lookup), "c": codes}
+            else:
+                encoded[col] = {"t": "raw", "v": values}
+        payload = {"n": len(entries), "columns": encoded}
+        return self.MAGIC + msgpack.packb(payload, use_bin_type=True, default=str)
+
+    def read_columns(self, stream) -> dict:
+        stream.read(len(self.MAGIC))
+        return self._decode(next(msgpack.Unpacker(stream, raw=False)))
+
+    def _decode(self, payload: dict) -> dict:
+        columns = {}
+        for col, spec in payload["columns"].items():
+            if spec["t"] == "ts":
+                columns[col] = [_epoch_to_ts(v) for v in spec["v"]]
+            elif spec["t"] == "dict":
+                values = spec["d"]
+                columns[col] = [values[c] if c >= 0 else None for c in spec["c"]]
+            else:
+                columns[col] = spec["v"]
+        return columns
+
+
+def records_to_columns(entries: list) -> dict:
+    """Lista di dict -> dict di liste (chiavi mancanti = None)."""
+    names = []
+    for e in entries:
+        for k in e:
+            if k not in names:
+                names.append(k)
+    return {k: [e.get(k) for e in entries] for k in names}
+
+
+def columns_to_records(columns: dict) -> list:
+    """Dict di liste -> lista di dict, omettendo i valori mancanti."""
+    if not columns:
+        return []
+    n = len(next(iter(columns.values())))
+    return [{k: v[i] for k, v in columns.items() if v[i] is not None} for i in range(n)]
+
+
+YAML = YamlSerializer()
+COLUMNAR = ColumnarSerializer()
+# Serializer usato per tutte le nuove scritture
+DEFAULT = COLUMNAR
+
+
+def detect(raw: bytes):
+    """Riconosce il formato di un blob decriptato."""
+    if raw.startswith(ColumnarSerializer.MAGIC):
+        return COLUMNAR
+    return YAML
+
+
+@timed("parse.chunk")
+def read_columns(stream):
+    """
+    Ritorna (colonne, serializer usato) leggendo un blob decriptato da un file
+    binario (es. crypto_utils.open_decrypted): il testo in chiaro arriva al
+    parser a pezzi, senza una copia intera in memoria.
+    """
+    serializer = detect(stream.peek(len(ColumnarSerializer.MAGIC)))
+    return serializer.read_columns(stream), serializer
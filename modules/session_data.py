@@ -0,0 +1,44 @@
+"""
+Dati in sessione per il primo render: working set del Diario e aggregati.
+
+Li carica il login (subito dopo la KDF, con i blob già scaricati dal prefetch)
+oppure app.py, se la sessione ne è rimasta senza (es. cache svuotata).
+"""
+from datetime import datetime, timedelta
+import streamlit as st
+from modules import schema
+from modules.activities import get_all_activities
+from modules.storage import get_write_queue
+from modules.telemetry import timed
+
+# Il Diario lavora sugli ultimi giorni (più la storia completa delle attività che la chiedono)
+RECENT_DAYS = 30
+
+
+def with_queued(snapshot, queued):
+    """Aggiunge allo snapshot le entry ancora in coda: per l'utente sono già salvate."""
+    if not queued:
+        return snapshot
+    return schema.concat([snapshot, schema.from_records(queued)])
+
+
+def set_snapshot(new_df):
+    """Sostituisce lo snapshot in sessione e ne incrementa la versione (invalida le analisi memorizzate)."""
+    st.session_state['data_snapshot'] = new_df
+    st.session_state['data_version'] = st.session_state.get('data_version', 0) + 1
+
+
+@timed("session.load")
+def load_session_data(backend, username):
+    """Working set degli ultimi RECENT_DAYS giorni e aggregati, con le entry ancora in coda."""
+    since = datetime.now() - timedelta(days=RECENT_DAYS)
+    full_history = [a.name for a in get_all_activities() if a.full_history]
+    snapshot = backend.load_working_set(since, full_history)
+    aggregates = backend.load_aggregates()
+    write_queue = get_write_queue()
+    # Entry rimaste in sospeso da un processo precedente (crash/riavvio)
+    write_queue.recover(username, backend.cipher)
+    queued = write_queue.pending_entries(username)
+    aggregates.add_many(queued)
+    st.session_state['aggregates'] = aggregates
+    set_snapshot(with_queued(snapshot, queued))
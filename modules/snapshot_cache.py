@@ -0,0 +1,119 @@
+"""
+Cache di processo dei blob già decriptati e decodificati: i chunk come
+DataFrame, manifest e aggregati come dict.
+
+La chiave è (utente, SHA del blob): un chunk sigillato non cambia mai, la coda
+cambia SHA a ogni scrittura. Così tutte le schede e le sessioni dello stesso
+utente condividono il lavoro di fetch + decrypt + parse, e dopo un salvataggio
+il backend mette in cache il nuovo chunk di coda (vecchio DataFrame + righe
+nuove) invece di ridecodificarlo.
+
+Eviction LRU sulla memoria stimata (DataFrame: memory_usage, altri valori:
+dimensione indicata da chi li inserisce). Un lock per chiave fa sì che letture
+concorrenti dello stesso blob lo decodifichino una volta sola.
+I valori in cache sono condivisi: chi li riceve non deve modificarli.
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def frame_bytes(frame) -> int:
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+class SnapshotCache:
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # chiave -> (frame, byte)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # chiave -> [lock, thread in attesa]: il lock sparisce quando nessuno lo usa più
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, frame, size: int = None):
+        size = frame_bytes(frame) if size is None else size
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                # Più grande dell'intera cache: non la teniamo
+                return
+            self._entries[key] = (frame, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            item = self._entries.pop(key, None)
+            if item is None:
+                return None
+            self._bytes -= item[1]
+            return item[0]
+
+    def get_or_load(self, key, loader, size: int = None):
+        """
+        Valore in cache oppure loader() (messo in cache). Con più thread sulla
+        stessa chiave solo il primo chiama loader, gli altri aspettano il risultato.
+        """
+        frame = self.get(key)
+        if frame is not None:
+            return frame
+        with self.lock(key):
+            with self._lock:
+                item = self._entries.get(key)
+            if item is not None:
+                return item[0]
+            frame = loader()
+            self.put(key, frame, size)
+            return frame
+
+    @contextmanager
+    def lock(self, key):
+        """Serializza il caricamento di una chiave (gli altri thread trovano poi il risultato in cache)."""
+        with self._lock:
+            slot = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    self._key_locks.pop(key, None)
+
+    def stats(self) -> dict:
+        """Contabilità della memoria, per il pannello admin."""
+        with self._lock:
+            users = {}
+            for (user, _), (_, size) in self._entries.items():
+                users[user] = users.get(user, 0) + size
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes_per_user": users,
+            }
@@ -0,0 +1,297 @@
+"""
+Storage locale su SQLite, per sviluppo e installazioni on-prem.
+
+Un solo file di database in modalità WAL (letture concorrenti alle scritture):
+- documents: documenti con versione intera (users.yaml, keyring, aggregati),
+  scritti con UPDATE ... WHERE version = ? (stessa semantica degli SHA GitHub);
+- entries: una riga per entry, payload criptato con il cipher dell'utente.
+  In chiaro restano solo id, timestamp e attività, indicizzati per
+  rispondere alle query per intervallo senza decriptare il resto.
+- rollups: gli aggregati, una riga per cella (utente, periodo, attività,
+  bucket); il conteggio in chiaro (ricavabile comunque da ts e attività),
+  la somma della metrica criptata. rollup_state dice fin dove coprono.
+
+Gli aggregati vengono aggiornati nella stessa transazione dell'append,
+toccando solo le celle delle entry scritte.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+import msgpack
+import pandas as pd
+from modules import entry_ids, schema
+from modules.aggregates import AggregateStore, AGGREGATES_VERSION, cell_deltas
+from modules.storage import ConflictError, DataBackend, Storage
+from modules.telemetry import span, timed
+
+# Entry per pagina in iter_frames (come un chunk del backend GitHub)
+PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    content BLOB NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    username TEXT NOT NULL,
+    id TEXT NOT NULL,
+    ts TEXT NOT NULL DEFAULT '',
+    activity TEXT NOT NULL DEFAULT '',
+    payload BLOB NOT NULL,
+    PRIMARY KEY (username, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_user_ts ON entries (username, ts);
+CREATE INDEX IF NOT EXISTS entries_user_activity_ts ON entries (username, activity, ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    username TEXT NOT NULL,
+    freq TEXT NOT NULL,
+    activity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    total BLOB NOT NULL,
+    PRIMARY KEY (username, freq, activity, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_state (
+    username TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    count INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path: str):
+        self.path = path
+        # Una connessione per thread (sessioni Streamlit, coda write-behind)
+        self._local = threading.local()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: autocommit, le transazioni le apriamo noi
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Transazione in scrittura (BEGIN IMMEDIATE: un solo scrittore alla volta)."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # --- DOCUMENTI ---
+    def read(self, path):
+        row = self.connection().execute(
+            "SELECT content, version FROM documents WHERE path = ?", (path,)).fetchone()
+        return (bytes(row[0]), row[1]) if row else (None, None)
+
+    def read_if_changed(self, path, version):
+        # Prima solo la versione: il contenuto si legge solo se è cambiato
+        row = self.connection().execute("SELECT version FROM documents WHERE path = ?", (path,)).fetchone()
+        current = row[0] if row else None
+        if current == version:
+            return False, None, current
+        content, current = self.read(path)
+        return True, content, current
+
+    def write(self, path, content, version, message):
+        if isinstance(content, str):
+            content = content.encode()
+        with self.transaction() as conn:
+            return self._write_document(conn, path, content, version)
+
+    def _write_document(self, conn, path, content, version):
+        if version is None:
+            try:
+                conn.execute("INSERT INTO documents (path, content, version) VALUES (?, ?, 1)", (path, content))
+            except sqlite3.IntegrityError:
+                raise ConflictError(path)
+            return 1
+        cur = conn.execute("UPDATE documents SET content = ?, version = version + 1 WHERE path = ? AND version = ?",
+                           (content, path, version))
+        if cur.rowcount == 0:
+            raise ConflictError(path)
+        return version + 1
+
+    def backend(self, username, cipher):
+        return SQLiteBackend(self, username, cipher)
+
+
+class SQLiteBackend(DataBackend):
+    def __init__(self, storage: SQLiteStorage, username, cipher):
+        self.storage = storage
+        self.username = username
+        self.cipher = cipher
+        # Documento degli aggregati del formato precedente (sostituito da rollups)
+        self.aggregates_path = f"data_{username}/aggregates.enc"
+        self.total_count = None
+
+    # --- LETTURA ---
+    def _query(self, where: str = "", params=()) -> pd.DataFrame:
+        conn = self.storage.connection()
+        self.total_count = conn.execute(
+            "SELECT COUNT(*) FROM entries WHERE username = ?", (self.username,)).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT payload FROM entries WHERE username = ? {where} ORDER BY ts",
+            (self.username, *params)).fetchall()
+        return self._frame(rows)
+
+    def _frame(self, rows) -> pd.DataFrame:
+        if not rows:
+            return schema.empty()
+        with span("crypto.decrypt"):
+            records = [msgpack.unpackb(self.cipher.decrypt(bytes(r[0]))) for r in rows]
+        with span("dataframe"):
+            return schema.from_records(records)
+
+    @timed("backend.load")
+    def load_data(self, since=None, until=None, activity=None) -> pd.DataFrame:
+        where, params = [], []
+        if since is not None:
+            where.append("AND ts >= ?")
+            params.append(schema.ts_str(since))
+        if until is not None:
+            where.append("AND ts <= ?")
+            params.append(schema.ts_str(until))
+        if activity:
+            activities = [activity] if isinstance(activity, str) else list(activity)
+            where.append(f"AND activity IN ({','.join('?' * len(activities))})")
+            params.extend(activities)
+        return self._query(" ".join(where), params)
+
+    @timed("backend.load")
+    def load_working_set(self, since, full_history=()) -> pd.DataFrame:
+        full_history = list(full_history)
+        where = "AND (ts >= ?"
+        if full_history:
+            where += f" OR activity IN ({','.join('?' * len(full_history))})"
+        return self._query(where + ")", [schema.ts_str(since), *full_history])
+
+    def iter_frames(self):
+        """Pagine da PAGE_SIZE entry in ordine di tempo (paginazione per chiave, senza OFFSET)."""
+        conn = self.storage.connection()
+        last = ("", "")
+        while True:
+            rows = conn.execute(
+                "SELECT payload, ts, id FROM entries WHERE username = ? AND (ts, id) > (?, ?) "
+                "ORDER BY ts, id LIMIT ?", (self.username, *last, PAGE_SIZE)).fetchall()
+            if not rows:
+                return
+            last = (rows[-1][1], rows[-1][2])
+            yield self._frame(rows)
+
+    # --- SCRITTURA ---
+    def _row(self, entry: dict):
+        return (self.username, entry["id"], schema.ts_str(entry.get("timestamp")) or "", entry.get("activity_type") or "",
+                self.cipher.encrypt(msgpack.packb(entry, default=str)))
+
+    @timed("backend.append")
+    def append_entries(self, entries: list):
+        entries = [e if e.get("id") else {**e, "id": entry_ids.entry_id(e)} for e in entries]
+        # Cifratura fuori dalla transazione: il lock di scrittura dura solo gli INSERT
+        with span("crypto.encrypt"):
+            rows = [self._row(e) for e in entries]
+        with self.storage.transaction() as conn:
+            appended = []
+            for entry, row in zip(entries, rows):
+                # Idempotenza: un id già presente viene ignorato
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO entries (username, id, ts, activity, payload) VALUES (?, ?, ?, ?, ?)", row)
+                if cur.rowcount:
+                    appended.append(entry)
+            self._update_aggregates(conn, appended)
+        return appended
+
+    def _rewrite_entry(self, eid, change) -> bool:
+        with self.storage.transaction() as conn:
+            row = conn.execute("SELECT payload FROM entries WHERE username = ? AND id = ?",
+                               (self.username, eid)).fetchone()
+            if row is None:
+                return False
+            old = msgpack.unpackb(self.cipher.decrypt(bytes(row[0])))
+            new = change(old)
+            if new is None:
+                conn.execute("DELETE FROM entries WHERE username = ? AND id = ?", (self.username, eid))
+            else:
+                conn.execute("UPDATE entries SET ts = ?, activity = ?, payload = ? WHERE username = ? AND id = ?",
+                             (*self._row(new)[2:], self.username, eid))
+            self._update_aggregates(conn, [new] if new else [], removed=[old])
+        return True
+
+    # --- AGGREGATI ---
+    def _update_aggregates(self, conn, appended, removed=()):
+        """
+        Nella transazione della scrittura (aggregati e entry non possono divergere):
+        legge e riscrive solo le celle toccate, in O(entry scritte).
+        """
+        if not appended and not removed:
+            return
+        state = conn.execute("SELECT version FROM rollup_state WHERE username = ?", (self.username,)).fetchone()
+        if state is None or state[0] != AGGREGATES_VERSION:
+            # Mancano: li costruirà load_aggregates con una scansione completa
+            return
+        for (freq, activity, bucket), (delta, dn) in cell_deltas(appended, removed).items():
+            key = (self.username, freq, activity, bucket)
+            row = conn.execute("SELECT n, total FROM rollups WHERE username = ? AND freq = ? AND activity = ? "
+                               "AND bucket = ?", key).fetchone()
+            n, total = (row[0], self._decrypt_total(row[1])) if row else (0, 0.0)
+            n, total = n + dn, total + delta
+            if n <= 0:
+                conn.execute("DELETE FROM rollups WHERE username = ? AND freq = ? AND activity = ? AND bucket = ?", key)
+            else:
+                conn.execute("INSERT INTO rollups (username, freq, activity, bucket, n, total) VALUES (?, ?, ?, ?, ?, ?) "
+                             "ON CONFLICT (username, freq, activity, bucket) DO UPDATE SET n = excluded.n, "
+                             "total = excluded.total", (*key, n, self._encrypt_total(total)))
+        conn.execute("UPDATE rollup_state SET count = count + ? WHERE username = ?",
+                     (len(appended) - len(removed), self.username))
+
+    def _encrypt_total(self, total: float) -> bytes:
+        return self.cipher.encrypt(msgpack.packb(float(total)))
+
+    def _decrypt_total(self, token) -> float:
+        return msgpack.unpackb(self.cipher.decrypt(bytes(token)))
+
+    def _write_rollups(self, conn, store: AggregateStore):
+        """Sostituisce tutte le celle dell'utente con quelle di `store`."""
+        conn.execute("DELETE FROM rollups WHERE username = ?", (self.username,))
+        conn.executemany("INSERT INTO rollups (username, freq, activity, bucket, n, total) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(self.username, freq, activity, bucket, n, self._encrypt_total(total))
+                          for freq, activity, bucket, total, n in store.cells()])
+        conn.execute("INSERT INTO rollup_state (username, version, count) VALUES (?, ?, ?) ON CONFLICT (username) "
+                     "DO UPDATE SET version = excluded.version, count = excluded.count",
+                     (self.username, AGGREGATES_VERSION, store.count))
+        # Formato precedente: un unico documento criptato con tutti gli aggregati
+        conn.execute("DELETE FROM documents WHERE path = ?", (self.aggregates_path,))
+
+    def count_entries(self) -> int:
+        self.total_count = self.storage.connection().execute(
+            "SELECT COUNT(*) FROM entries WHERE username = ?", (self.username,)).fetchone()[0]
+        return self.total_count
+
+    @timed("backend.aggregates")
+    def load_aggregates(self) -> AggregateStore:
+        self.count_entries()
+        conn = self.storage.connection()
+        state = conn.execute("SELECT version, count FROM rollup_state WHERE username = ?",
+                             (self.username,)).fetchone()
+        if state is not None and tuple(state) == (AGGREGATES_VERSION, self.total_count):
+            rows = conn.execute("SELECT freq, activity, bucket, total, n FROM rollups WHERE username = ?",
+                                (self.username,)).fetchall()
+            with span("crypto.decrypt"):
+                cells = [(f, a, b, self._decrypt_total(t), n) for f, a, b, t, n in rows]
+            return AggregateStore.from_cells(state[1], cells)
+
+        store = AggregateStore.from_frame(self.load_data())
+        with self.storage.transaction() as conn:
+            self._write_rollups(conn, store)
+        return store
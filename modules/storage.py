@@ -0,0 +1,139 @@
+"""
+Interfaccia dello storage, indipendente da dove finiscono i dati.
+
+Uno Storage (uno per processo, scelto con STORAGE nei secrets) offre:
+- documenti piccoli con versione (users.yaml, keyring): lettura, lettura
+  condizionale e scrittura condizionata alla versione letta;
+- un DataBackend per utente con le entry criptate: caricamento filtrato,
+  append idempotente, modifica/eliminazione e aggregati.
+
+Implementazioni: "github" (default, modules.backend) e "sqlite"
+(modules.sqlite_backend, per sviluppo e installazioni on-prem).
+"""
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
+import streamlit as st
+from modules import entry_ids
+from modules.write_queue import WriteBehindQueue
+
+if TYPE_CHECKING:
+    # Solo per le annotazioni: la pagina di login non deve importare pandas
+    import pandas as pd
+
+
+class ConflictError(Exception):
+    """La versione del documento non è più quella letta: rileggere e riprovare."""
+
+
+class DataBackend(ABC):
+    """Entry di un utente (cifrate con il suo cipher)."""
+
+    # Entry totali dell'utente, aggiornato a ogni load (anche con i filtri)
+    total_count = None
+
+    @abstractmethod
+    def load_data(self, since=None, until=None, activity=None) -> "pd.DataFrame": pass
+
+    @abstractmethod
+    def load_working_set(self, since, full_history=()) -> "pd.DataFrame": pass
+
+    @abstractmethod
+    def iter_frames(self):
+        """La storia a pezzi (un DataFrame alla volta), per l'export."""
+
+    @abstractmethod
+    def append_entries(self, entries: list):
+        """
+        Aggiunge le entry; quelle con un id già presente vengono ignorate.
+        Ritorna le entry aggiunte. Solleva in caso di errore.
+        """
+
+    def delete_entry(self, eid: str) -> bool:
+        """Elimina una singola entry per id. Ritorna False se non esiste."""
+        return self._rewrite_entry(eid, lambda entry: None)
+
+    def update_entry(self, eid: str, changes: dict) -> bool:
+        """Modifica una singola entry per id. Ritorna False se non esiste."""
+        return self._rewrite_entry(eid, lambda entry: {**entry, **changes, "id": entry_ids.entry_id(entry)})
+
+    @abstractmethod
+    def _rewrite_entry(self, eid: str, change) -> bool:
+        """
+        Sostituisce l'entry `eid` con change(entry) (None = eliminarla) e aggiorna
+        gli aggregati. Ritorna False se l'entry non esiste.
+        """
+
+    @abstractmethod
+    def count_entries(self) -> int:
+        """Entry totali dell'utente, senza caricarle (aggiorna total_count)."""
+
+    @abstractmethod
+    def load_aggregates(self): pass
+
+    def prefetch(self):
+        """
+        Porta in locale i dati cifrati del primo load, senza decifrarli: si può
+        chiamare su un backend creato con cipher None (al login, mentre la KDF
+        gira), purché il cipher venga impostato prima di leggere.
+        """
+
+    def save_entry(self, entry: dict) -> bool:
+        try:
+            self.append_entries([entry])
+            return True
+        except Exception as e:
+            st.error(f"Errore Critico Salvataggio: {e}")
+            return False
+
+
+class Storage(ABC):
+    @abstractmethod
+    def read(self, path: str):
+        """Ritorna (contenuto in bytes, versione) o (None, None) se il documento non esiste."""
+
+    def read_if_changed(self, path: str, version):
+        """
+        Ritorna (cambiato, contenuto, versione). Se il documento è ancora alla
+        `version` indicata il contenuto è None (le implementazioni possono
+        evitare di riscaricarlo).
+        """
+        content, current = self.read(path)
+        if current == version:
+            return False, None, current
+        return True, content, current
+
+    @abstractmethod
+    def write(self, path: str, content: bytes, version, message: str):
+        """
+        Scrive il documento solo se è ancora alla `version` letta (None = non
+        deve esistere). Ritorna la nuova versione; altrimenti ConflictError.
+        """
+
+    @abstractmethod
+    def backend(self, username: str, cipher) -> DataBackend: pass
+
+    def has_headroom(self) -> bool:
+        """False se conviene rimandare le operazioni non indispensabili (es. quota API)."""
+        return True
+
+    def cache_stats(self) -> dict:
+        """Memoria usata dalle cache in-process (vuoto se l'implementazione non ne ha)."""
+        return {}
+
+
+@st.cache_resource
+def get_storage() -> Storage:
+    kind = st.secrets.get("STORAGE", "github")
+    if kind == "sqlite":
+        from modules.sqlite_backend import SQLiteStorage
+        return SQLiteStorage(st.secrets.get("SQLITE_PATH", "life_logger.db"))
+    if kind == "github":
+        from modules.backend import GitHubStorage
+        return GitHubStorage()
+    raise ValueError(f"STORAGE non valido: {kind}")
+
+
+@st.cache_resource
+def get_write_queue() -> WriteBehindQueue:
+    """Coda write-behind unica per il processo (vedi write_queue)."""
+    return WriteBehindQueue(get_storage().backend, st.secrets.get("SPOOL_DIR", ".cache/spool"))
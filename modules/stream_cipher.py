@@ -0,0 +1,157 @@
+"""
+Formato cifrato a frame (streaming AEAD) per i blob dei dati.
+
+Un token Fernet si decifra solo tutto insieme: il blob intero, il testo in
+chiaro e la sua copia decodificata stanno in memoria nello stesso momento.
+Qui il payload è diviso in frame di FRAME_SIZE byte, ognuno autenticato per
+conto suo (costruzione STREAM, come lo streaming AEAD di Tink), così si può
+decifrare e passare al parser un frame alla volta:
+
+    header = MAGIC | versione | algoritmo | id chiave (4) | frame size (4) | salt (16) | prefisso nonce (7)
+    frame  = AEAD(chiave del blob, nonce, dati, aad=header)
+    nonce  = prefisso nonce | contatore del frame (4) | 1 se è l'ultimo frame, altrimenti 0
+
+La chiave del blob è derivata (HKDF) dalla chiave di stream dell'utente e dal
+salt casuale dell'header: niente riuso di nonce fra blob diversi. Il flag
+dell'ultimo frame e il contatore rendono evidenti troncamenti, frame
+aggiunti o riordinati; l'header è autenticato da ogni frame.
+"""
+import base64
+import hashlib
+import io
+import os
+import struct
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+MAGIC = b"\x00LLS"
+VERSION = 1
+ALGORITHMS = {1: AESGCM, 2: ChaCha20Poly1305}
+ALGORITHM_IDS = {"aes-gcm": 1, "chacha20-poly1305": 2}
+DEFAULT_ALGORITHM = "aes-gcm"
+FRAME_SIZE = 64 * 1024
+TAG_SIZE = 16
+_HEADER = struct.Struct(">4sBB4sI16s7s")
+HEADER_SIZE = _HEADER.size
+
+
+class StreamError(ValueError):
+    """Blob a frame non valido: chiave sbagliata, dati alterati o troncati."""
+
+
+def derive_stream_key(fernet_key: bytes) -> bytes:
+    """Chiave di stream (32 byte) da una chiave Fernet: separata da quella usata da Fernet."""
+    raw = base64.urlsafe_b64decode(fernet_key)
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"life-logger stream").derive(raw)
+
+
+def key_id(stream_key: bytes) -> bytes:
+    return hashlib.sha256(stream_key).digest()[:4]
+
+
+def _blob_key(stream_key: bytes, salt: bytes) -> bytes:
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b"life-logger blob").derive(stream_key)
+
+
+def _nonce(prefix: bytes, counter: int, final: bool) -> bytes:
+    return prefix + struct.pack(">I?", counter, final)
+
+
+def is_stream(blob: bytes) -> bool:
+    return blob[:len(MAGIC)] == MAGIC
+
+
+def encrypt(data: bytes, stream_key: bytes, algorithm: str = DEFAULT_ALGORITHM,
+            frame_size: int = FRAME_SIZE) -> bytes:
+    """Cifra `data` in frame. Anche un payload vuoto produce un (unico) frame finale."""
+    header = _HEADER.pack(MAGIC, VERSION, ALGORITHM_IDS[algorithm], key_id(stream_key), frame_size,
+                          os.urandom(16), os.urandom(7))
+    salt, prefix = header[-23:-7], header[-7:]
+    aead = ALGORITHMS[ALGORITHM_IDS[algorithm]](_blob_key(stream_key, salt))
+    parts = [header]
+    view = memoryview(data)
+    count = max(1, -(-len(data) // frame_size))
+    for i in range(count):
+        frame = view[i * frame_size:(i + 1) * frame_size]
+        parts.append(aead.encrypt(_nonce(prefix, i, i == count - 1), bytes(frame), header))
+    return b"".join(parts)
+
+
+def decrypt(source, stream_keys: dict):
+    """
+    Iteratore sul testo in chiaro, un frame alla volta. `source` è il blob
+    (bytes) o un iterabile di pezzi di bytes di dimensione qualsiasi;
+    `stream_keys` è {id chiave: chiave}. Solleva StreamError se il blob è
+    alterato, troncato o cifrato con una chiave che non abbiamo.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        # Il blob intero a fette: nel buffer non ci sono mai più di un paio di frame
+        view = memoryview(source)
+        source = (view[i:i + FRAME_SIZE] for i in range(0, len(view), FRAME_SIZE))
+    pieces = iter(source)
+    buffer = bytearray()
+
+    def fill(size):
+        # Legge finché nel buffer ci sono almeno `size` byte (o finisce l'input)
+        while len(buffer) < size:
+            piece = next(pieces, None)
+            if piece is None:
+                return False
+            buffer.extend(piece)
+        return True
+
+    if not fill(HEADER_SIZE):
+        raise StreamError("Header troncato")
+    header = bytes(buffer[:HEADER_SIZE])
+    del buffer[:HEADER_SIZE]
+    magic, version, algorithm, kid, frame_size, salt, prefix = _HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION or algorithm not in ALGORITHMS:
+        raise StreamError(f"Formato a frame non supportato (versione {version}, algoritmo {algorithm})")
+    stream_key = stream_keys.get(kid)
+    if stream_key is None:
+        raise StreamError("Blob cifrato con una chiave non disponibile")
+    aead = ALGORITHMS[algorithm](_blob_key(stream_key, salt))
+
+    frame_len = frame_size + TAG_SIZE
+    counter = 0
+    while True:
+        # Un frame è l'ultimo se dopo di lui non c'è più niente: serve un byte di anticipo
+        more = fill(frame_len + 1)
+        if not more and len(buffer) > frame_len:
+            raise StreamError("Frame più lungo del previsto")
+        frame = bytes(buffer[:frame_len]) if more else bytes(buffer)
+        del buffer[:len(frame)]
+        try:
+            yield aead.decrypt(_nonce(prefix, counter, not more), frame, header)
+        except InvalidTag:
+            raise StreamError(f"Frame {counter} non autentico (dati alterati o troncati)") from None
+        if not more:
+            return
+        counter += 1
+
+
+class IterReader(io.RawIOBase):
+    """File binario in sola lettura sopra un iteratore di bytes (per parser che leggono a pezzi)."""
+
+    def __init__(self, pieces):
+        self._pieces = iter(pieces)
+        self._current = b""
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self._offset >= len(self._current):
+            self._current = next(self._pieces, None)
+            self._offset = 0
+            if self._current is None:
+                self._current = b""
+                return 0
+        n = min(len(buffer), len(self._current) - self._offset)
+        buffer[:n] = self._current[self._offset:self._offset + n]
+        self._offset += n
+        return n
@@ -0,0 +1,187 @@
+"""
+Misura dei tempi sui percorsi caldi (fetch GitHub, KDF, parsing, DataFrame, motori).
+
+Le funzioni interessanti sono decorate con @timed("nome") o avvolte in
+`with span("nome")`. Gli span si registrano solo nei rerun in cui la misura
+è attiva (begin_run(True)): altrimenti il costo è un getattr su un
+threading.local. Ogni rerun di Streamlit gira nel suo thread, quindi gli span
+di sessioni diverse non si mescolano; i thread in background (es. la coda
+write-behind) non registrano nulla.
+
+A fine rerun gli span vanno all'exporter, se configurato nei secrets:
+- TELEMETRY_JSONL: un file JSON-lines, una riga per span
+- TELEMETRY_PROM: un textfile Prometheus con p50/p95 per span (per node_exporter)
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import streamlit as st
+
+# Campioni per span su cui si calcolano i quantili del textfile Prometheus
+WINDOW = 1024
+QUANTILES = (0.5, 0.95)
+RUN_SPAN = "rerun"
+
+_local = threading.local()
+
+
+class _Span:
+    __slots__ = ("name", "spans", "start", "depth")
+
+    def __init__(self, name, spans):
+        self.name = name
+        self.spans = spans
+
+    def __enter__(self):
+        self.depth = _local.depth
+        _local.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        _local.depth -= 1
+        self.spans.append((self.start - _local.started, self.depth, self.name, (end - self.start) * 1000))
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str):
+    """Context manager che misura il blocco (no-op se la misura è spenta)."""
+    spans = getattr(_local, "spans", None)
+    if spans is None:
+        return _NO_SPAN
+    return _Span(name, spans)
+
+
+def timed(name: str):
+    """Decoratore: come span() attorno a tutta la funzione."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            spans = getattr(_local, "spans", None)
+            if spans is None:
+                return fn(*args, **kwargs)
+            with _Span(name, spans):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# --- CICLO DEL RERUN ---
+def begin_run(enabled: bool, exporter=None):
+    """Da chiamare in cima allo script. Chiude anche un rerun interrotto (st.rerun/st.stop)."""
+    finish_run()
+    _local.spans = [] if enabled else None
+    _local.depth = 0
+    _local.started = time.perf_counter()
+    _local.exporter = exporter
+
+
+def finish_run():
+    """Chiude il rerun corrente e passa gli span all'exporter."""
+    spans = getattr(_local, "spans", None)
+    if spans is None:
+        return
+    total_ms = (time.perf_counter() - _local.started) * 1000
+    _local.spans = None
+    if _local.exporter is not None:
+        _local.exporter.record(spans, total_ms)
+
+
+def run_spans() -> list:
+    """Span del rerun corrente in ordine di inizio: (offset s, profondità, nome, ms)."""
+    return sorted(getattr(_local, "spans", None) or [])
+
+
+def elapsed_ms() -> float:
+    return (time.perf_counter() - _local.started) * 1000
+
+
+def breakdown() -> list:
+    """Riepilogo per nome: [(nome, chiamate, ms totali)], dal più costoso."""
+    totals = defaultdict(lambda: [0, 0.0])
+    for _, _, name, ms in run_spans():
+        totals[name][0] += 1
+        totals[name][1] += ms
+    return sorted(((name, calls, ms) for name, (calls, ms) in totals.items()), key=lambda r: -r[2])
+
+
+# --- EXPORT ---
+class Exporter:
+    """Raccoglie gli span di tutte le sessioni del processo e li scrive su file."""
+
+    def __init__(self, jsonl_path: str = None, prom_path: str = None, window: int = WINDOW):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._totals = defaultdict(lambda: [0, 0.0])  # nome -> [conteggio, somma secondi]
+        self._lock = threading.Lock()
+        for path in (jsonl_path, prom_path):
+            if path:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def record(self, spans: list, total_ms: float):
+        now = time.time()
+        samples = [(name, ms) for _, _, name, ms in spans] + [(RUN_SPAN, total_ms)]
+        with self._lock:
+            for name, ms in samples:
+                self._samples[name].append(ms / 1000)
+                self._totals[name][0] += 1
+                self._totals[name][1] += ms / 1000
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    for name, ms in samples:
+                        f.write(json.dumps({"ts": round(now, 3), "span": name, "ms": round(ms, 3)}) + "\n")
+            if self.prom_path:
+                self._write_prom()
+
+    def _write_prom(self):
+        lines = [
+            "# HELP life_logger_span_seconds Durata degli span per rerun (quantili sugli ultimi campioni).",
+            "# TYPE life_logger_span_seconds summary",
+        ]
+        for name in sorted(self._samples):
+            values = sorted(self._samples[name])
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            for q in QUANTILES:
+                value = values[min(int(q * len(values)), len(values) - 1)]
+                lines.append(f'life_logger_span_seconds{{span="{label}",quantile="{q}"}} {value:.6f}')
+            count, total = self._totals[name]
+            lines.append(f'life_logger_span_seconds_sum{{span="{label}"}} {total:.6f}')
+            lines.append(f'life_logger_span_seconds_count{{span="{label}"}} {count}')
+        # Scrittura atomica: node_exporter non deve mai leggere un file a metà
+        tmp = self.prom_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.prom_path)
+
+
+@st.cache_resource
+def get_exporter():
+    """Exporter di processo, solo se abilitato nei secrets (TELEMETRY_JSONL / TELEMETRY_PROM)."""
+    jsonl_path = st.secrets.get("TELEMETRY_JSONL")
+    prom_path = st.secrets.get("TELEMETRY_PROM")
+    if not jsonl_path and not prom_path:
+        return None
+    return Exporter(jsonl_path, prom_path)
+
+
+def is_admin(username) -> bool:
+    return bool(username) and username in st.secrets.get("ADMIN_USERS", [])
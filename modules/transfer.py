@@ -0,0 +1,125 @@
+"""
+Export e import in blocco.
+
+L'export legge la storia un chunk alla volta (backend.iter_frames) e la scrive
+subito nel file di destinazione: non esiste mai un secondo DataFrame completo.
+L'import legge il CSV a blocchi, valida ogni riga con lo schema della sua
+attività e scrive ogni blocco con un solo append (una scrittura per chunk).
+"""
+import tempfile
+import time
+import pandas as pd
+from modules.activities import get_all_activities
+from modules.schema import TS_FORMAT, row_ids
+
+# Righe per append: quante ne sta in un chunk del backend GitHub (backend.CHUNK_SIZE),
+# senza importarlo, che con STORAGE=sqlite non serve
+IMPORT_BATCH_SIZE = 500
+BASE_COLUMNS = ["id", "timestamp", "activity_type", "dettaglio", "metrica", "unita", "note"]
+# Errori riportati all'utente dopo un import (gli altri vengono solo contati)
+MAX_REPORTED_ERRORS = 20
+
+
+def export_columns() -> list:
+    extra = [f for a in get_all_activities() for f in a.extra_fields if f not in BASE_COLUMNS]
+    return BASE_COLUMNS + list(dict.fromkeys(extra))
+
+
+def _normalize(frame: pd.DataFrame, columns: list) -> pd.DataFrame:
+    # Anche le entry storiche senza id salvato escono con il loro id (di contenuto):
+    # reimportare il file le riconosce come già presenti
+    frame = frame.assign(id=row_ids(frame)).reindex(columns=columns)
+    frame['timestamp'] = pd.to_datetime(frame['timestamp'], errors='coerce', format='mixed').dt.strftime(TS_FORMAT)
+    return frame
+
+
+def iter_csv(frames, columns=None):
+    """Genera il CSV a pezzi: intestazione e poi un pezzo per chunk."""
+    columns = columns or export_columns()
+    yield ",".join(columns) + "\n"
+    for frame in frames:
+        yield _normalize(frame, columns).to_csv(index=False, header=False)
+
+
+def export_csv(frames) -> tempfile.SpooledTemporaryFile:
+    """CSV su file temporaneo (su disco oltre i 10 MB), pronto per st.download_button."""
+    out = tempfile.SpooledTemporaryFile(max_size=10 * 1024 * 1024)
+    for part in iter_csv(frames):
+        out.write(part.encode("utf-8"))
+    out.seek(0)
+    return out
+
+
+def export_parquet(frames) -> tempfile.SpooledTemporaryFile:
+    """Parquet con un row group per chunk. Richiede pyarrow (dipendenza opzionale)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = export_columns()
+    schema = pa.schema([(c, pa.float64() if c in ("metrica", "pagine_totali") else pa.string()) for c in columns])
+    out = tempfile.SpooledTemporaryFile(max_size=10 * 1024 * 1024)
+    with pq.ParquetWriter(out, schema) as writer:
+        for frame in frames:
+            frame = _normalize(frame, columns)
+            for c in columns:
+                if c in ("metrica", "pagine_totali"):
+                    frame[c] = pd.to_numeric(frame[c], errors='coerce')
+                else:
+                    frame[c] = frame[c].astype(object).map(lambda v: None if pd.isna(v) else str(v))
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+    out.seek(0)
+    return out
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def validate_rows(frame: pd.DataFrame, activities: dict, first_line: int = 2):
+    """Ritorna (entry valide, errori) per un blocco del CSV."""
+    frame = frame.copy()
+    if 'timestamp' in frame.columns:
+        frame['timestamp'] = pd.to_datetime(frame['timestamp'], errors='coerce', format='mixed').dt.strftime(TS_FORMAT)
+    entries, errors = [], []
+    for offset, row in enumerate(frame.to_dict("records")):
+        row = {k: v for k, v in row.items() if not (isinstance(v, float) and v != v)}
+        activity = activities.get(row.get("activity_type"))
+        if activity is None:
+            errors.append((first_line + offset, f"attività sconosciuta ({row.get('activity_type')})"))
+            continue
+        entry, row_errors = activity.coerce(row)
+        if row_errors:
+            errors.append((first_line + offset, "; ".join(row_errors)))
+        else:
+            entries.append(entry)
+    return entries, errors
+
+
+def import_csv(fileobj, backend, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    Import in streaming: blocchi da `batch_size` righe, ognuno validato e
+    scritto con un solo append_entries. Ritorna un report con il throughput;
+    le righe già presenti (stesso id) sono contate in `duplicates`.
+    """
+    activities = {a.name: a for a in get_all_activities()}
+    report = {"rows": 0, "imported": 0, "duplicates": 0, "rejected": 0, "errors": [], "seconds": 0.0}
+    start = time.perf_counter()
+    line = 2  # riga 1 = intestazione
+    for frame in pd.read_csv(fileobj, chunksize=batch_size, dtype=str, keep_default_na=True):
+        entries, errors = validate_rows(frame, activities, line)
+        line += len(frame)
+        report["rows"] += len(frame)
+        report["rejected"] += len(errors)
+        room = MAX_REPORTED_ERRORS - len(report["errors"])
+        report["errors"].extend(errors[:max(room, 0)])
+        if entries:
+            appended = backend.append_entries(entries)
+            report["imported"] += len(appended)
+            report["duplicates"] += len(entries) - len(appended)
+    report["seconds"] = time.perf_counter() - start
+    report["rows_per_second"] = report["rows"] / report["seconds"] if report["seconds"] else 0.0
+    return report
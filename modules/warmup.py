@@ -0,0 +1,40 @@
+"""
+Import pesanti dell'app in background, avviati dalla pagina di login.
+
+La pagina di login importa solo streamlit e auth. pandas, PyGithub e il resto
+servono dopo l'accesso: li carica un thread mentre l'utente scrive le
+credenziali, una volta per processo, così né il primo render né il login li pagano.
+"""
+import importlib
+import logging
+import threading
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# In ordine di costo: prima le dipendenze del login (backend, session_data), poi l'interfaccia
+MODULES = (
+    "pandas",
+    "github",
+    "modules.backend",
+    "modules.session_data",
+    "modules.intelligence",
+    "modules.analytics",
+    "modules.transfer",
+)
+
+
+def _import_all():
+    for name in MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            # Lo stesso import verrà ritentato (e segnalato) dove serve davvero
+            logger.warning("Warm-up di %s fallito: %s", name, e)
+
+
+@st.cache_resource
+def start() -> threading.Thread:
+    thread = threading.Thread(target=_import_all, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,181 @@
+"""
+Coda write-behind per le nuove entry.
+
+L'interfaccia mette in coda l'entry e risponde subito; un thread in
+background raccoglie le entry di ogni utente per WINDOW_SECONDS e le scrive
+con un solo commit (backend.append_entries gestisce i conflitti di SHA).
+Le entry in attesa sono anche salvate, criptate, in uno spool su disco:
+se il processo muore prima del flush vengono recuperate al login successivo.
+Backend e cipher di un utente restano in memoria solo finché ha entry in attesa.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = 2.0
+RETRY_SECONDS = 10.0
+
+
+class WriteBehindQueue:
+    def __init__(self, backend_factory, spool_dir: str, window: float = WINDOW_SECONDS):
+        self.backend_factory = backend_factory
+        self.spool_dir = spool_dir
+        self.window = window
+        # username -> {"backend", "cipher", "entries", "due", "error"}, solo per chi ha entry in attesa
+        self._pending = {}
+        self._cond = threading.Condition()
+        # Un solo flush alla volta (worker, logout e atexit possono sovrapporsi)
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        os.makedirs(spool_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # --- API PER L'INTERFACCIA ---
+    def enqueue(self, username: str, cipher, entry: dict):
+        with self._cond:
+            slot = self._slot(username, cipher)
+            slot["entries"].append(entry)
+            if slot["due"] is None:
+                slot["due"] = time.monotonic() + self.window
+            self._write_spool(username, slot)
+            self._cond.notify()
+
+    def pending_count(self, username: str) -> int:
+        with self._cond:
+            slot = self._pending.get(username)
+            return len(slot["entries"]) if slot else 0
+
+    def pending_entries(self, username: str) -> list:
+        """Copia delle entry non ancora scritte (da mostrare come già salvate)."""
+        with self._cond:
+            slot = self._pending.get(username)
+            return list(slot["entries"]) if slot else []
+
+    def last_error(self, username: str):
+        with self._cond:
+            slot = self._pending.get(username)
+            return slot["error"] if slot else None
+
+    def recover(self, username: str, cipher):
+        """Rimette in coda le entry rimaste nello spool da un processo precedente."""
+        path = self._spool_path(username)
+        if not os.path.exists(path):
+            return
+        with self._cond:
+            slot = self._slot(username, cipher)
+            if slot["entries"]:
+                # Lo spool è già quello di questo processo
+                return
+            try:
+                with open(path, "rb") as f:
+                    for line in f:
+                        if line.strip():
+                            slot["entries"].append(json.loads(cipher.decrypt(line.strip())))
+            except Exception as e:
+                # Spool illeggibile con questa chiave: lo lasciamo dov'è
+                logger.warning("Spool di %s non recuperabile: %s", username, e)
+                slot["entries"].clear()
+            if slot["entries"]:
+                slot["due"] = time.monotonic()
+                self._cond.notify()
+            else:
+                del self._pending[username]
+
+    def flush(self, username: str = None):
+        """Scrive subito (e in modo bloccante) le entry in attesa."""
+        with self._cond:
+            users = [username] if username else list(self._pending)
+        for user in users:
+            self._flush_user(user)
+
+    def forget(self, username: str):
+        """
+        Al logout, dopo il flush: libera backend e cipher dell'utente. Le entry
+        eventualmente non ancora scritte restano nello spool e tornano con recover.
+        """
+        with self._cond:
+            self._pending.pop(username, None)
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self.flush()
+
+    # --- INTERNI ---
+    def _slot(self, username, cipher):
+        slot = self._pending.get(username)
+        if slot is None:
+            slot = {"backend": None, "cipher": None, "entries": [], "due": None, "error": None}
+            self._pending[username] = slot
+        if slot["backend"] is None or slot["cipher"] is not cipher:
+            slot["backend"] = self.backend_factory(username, cipher)
+            slot["cipher"] = cipher
+        return slot
+
+    def _spool_path(self, username):
+        return os.path.join(self.spool_dir, f"spool_{username}.log")
+
+    def _write_spool(self, username, slot):
+        path = self._spool_path(username)
+        if not slot["entries"]:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            for e in slot["entries"]:
+                f.write(slot["cipher"].encrypt(json.dumps(e, default=str).encode()) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _flush_user(self, username):
+        with self._flush_lock:
+            self._flush_user_locked(username)
+
+    def _flush_user_locked(self, username):
+        with self._cond:
+            slot = self._pending.get(username)
+            if not slot or not slot["entries"]:
+                return
+            batch = list(slot["entries"])
+            backend = slot["backend"]
+        try:
+            backend.append_entries(batch)
+        except Exception as e:
+            logger.warning("Flush di %s fallito: %s", username, e)
+            with self._cond:
+                slot["error"] = str(e)
+                slot["due"] = time.monotonic() + RETRY_SECONDS
+            return
+        with self._cond:
+            # Nel frattempo possono essere arrivate altre entry: togliamo solo il batch scritto
+            del slot["entries"][:len(batch)]
+            slot["error"] = None
+            slot["due"] = time.monotonic() + self.window if slot["entries"] else None
+            self._write_spool(username, slot)
+            if not slot["entries"] and self._pending.get(username) is slot:
+                # Tutto scritto: backend e cipher non servono più
+                del self._pending[username]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                ready = [u for u, s in self._pending.items() if s["due"] is not None and s["due"] <= now]
+                if not ready:
+                    dues = [s["due"] for s in self._pending.values() if s["due"] is not None]
+                    self._cond.wait(timeout=(min(dues) - now) if dues else None)
+                    continue
+            for user in ready:
+                self._flush_user(user)
@@ -0,0 +1,50 @@
+"""
+Fixture comuni dei test: backend GitHub reali su un FakeRepo in memoria
+(vedi benchmarks.fake_github), con cache dei blob in una cartella temporanea.
+"""
+import os
+import sys
+from unittest import mock
+
+import pytest
+from cryptography.fernet import Fernet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import backend as backend_module  # noqa: E402
+from modules.blob_cache import BlobCache  # noqa: E402
+from modules.crypto_utils import DataCipher  # noqa: E402
+from modules.snapshot_cache import SnapshotCache  # noqa: E402
+from benchmarks.fake_github import FakeRepo  # noqa: E402
+
+USERNAME = "test"
+
+
+@pytest.fixture(autouse=True)
+def _offline():
+    # Nessuna chiamata a GitHub per il rate limit
+    with mock.patch.object(backend_module, "has_headroom", lambda *a, **k: True):
+        yield
+
+
+@pytest.fixture
+def repo():
+    return FakeRepo()
+
+
+@pytest.fixture
+def cipher():
+    return DataCipher([Fernet.generate_key()])
+
+
+@pytest.fixture
+def make_backend(repo, cipher, tmp_path):
+    """make_backend(): un GitHubBackend nuovo sullo stesso repo (come un'altra sessione o istanza)."""
+    def factory(username=USERNAME):
+        blobs = BlobCache(str(tmp_path / "blobs"))
+        with mock.patch.object(backend_module, "get_blob_cache", lambda: blobs), \
+                mock.patch.object(backend_module, "get_snapshot_cache", lambda: SnapshotCache()), \
+                mock.patch.object(backend_module, "load_compression_dictionaries", lambda: 0):
+            backend = backend_module.GitHubBackend(username, cipher)
+        backend._repo = repo
+        return backend
+    return factory
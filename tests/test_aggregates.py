@@ -0,0 +1,90 @@
+"""
+Aggregati: gli aggiornamenti incrementali (append, eliminazioni, modifiche)
+danno gli stessi bucket di una ricostruzione completa dalla storia.
+
+Uso:  python -m pytest tests
+"""
+import random
+
+from modules import entry_ids, schema
+from modules.aggregates import AggregateStore
+
+ACTIVITIES = ["💪 Sport", "📚 Lettura", "🧘 Meditazione"]
+
+
+def random_entries(rng, n):
+    entries = []
+    for _ in range(n):
+        e = {"id": entry_ids.new_id(),
+             "timestamp": f"2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00",
+             "activity_type": rng.choice(ACTIVITIES),
+             # Metà intere, metà con .5: esatte anche in Float32
+             "metrica": rng.randint(0, 200) / 2}
+        if rng.random() < 0.05:
+            del e["metrica"]
+        entries.append(e)
+    return entries
+
+
+def cells(store):
+    """Celle confrontabili: (freq, attività, bucket) -> (somma arrotondata, conteggio)."""
+    return {(f, a, b): (round(t, 6), n) for f, a, b, t, n in store.cells()}
+
+
+def assert_matches_recompute(store, entries):
+    full = AggregateStore.from_frame(schema.from_records(entries))
+    assert store.count == full.count == len(entries)
+    assert cells(store) == cells(full)
+
+
+def test_apply_matches_recompute():
+    rng = random.Random(42)
+    entries = random_entries(rng, 300)
+    store = AggregateStore()
+    store.apply(entries[:200])
+    store.apply(entries[200:])
+
+    removed = rng.sample(entries, 80)
+    store.apply([], removed)
+    kept = [e for e in entries if e not in removed]
+
+    # Modifiche: vecchia entry rimossa, nuova aggiunta (anche cambiando attività o giorno)
+    changed = rng.sample(kept, 40)
+    updated = [{**e, "metrica": e.get("metrica", 0) + 1, "activity_type": rng.choice(ACTIVITIES),
+                "timestamp": "2024-02-29 12:00:00"} for e in changed]
+    store.apply(updated, changed)
+    final = [e for e in kept if e not in changed] + updated
+    assert_matches_recompute(store, final)
+
+
+def test_removing_everything_leaves_no_cells():
+    entries = random_entries(random.Random(1), 50)
+    store = AggregateStore()
+    store.apply(entries)
+    store.apply([], entries)
+    assert store.count == 0
+    assert list(store.cells()) == []
+    assert store.activities() == []
+
+
+def test_backend_aggregates_follow_writes(make_backend):
+    rng = random.Random(7)
+    entries = random_entries(rng, 60)
+    make_backend().append_entries(entries[:40])
+    # Salvati una volta: da qui in poi si aggiornano a ogni scrittura
+    make_backend().load_aggregates()
+
+    backend = make_backend()
+    backend.append_entries(entries[40:])
+    for e in entries[:5]:
+        assert backend.delete_entry(e["id"])
+    assert backend.update_entry(entries[10]["id"], {"metrica": 99.0, "activity_type": "📚 Lettura"})
+
+    fresh = make_backend()
+    data, _ = fresh._read_file(fresh.aggregates_path)
+    saved = AggregateStore.from_saved(data)
+    assert saved is not None
+    final = [{**e, "metrica": 99.0, "activity_type": "📚 Lettura"} if e is entries[10] else e
+             for e in entries[5:]]
+    assert_matches_recompute(saved, final)
+    assert cells(fresh.load_aggregates()) == cells(saved)
@@ -0,0 +1,131 @@
+"""
+Append sul backend GitHub: doppi invii e retry non duplicano le entry, e una
+scrittura che trova lo SHA cambiato (409/422) rilegge e unisce le entry.
+
+Uso:  python -m pytest tests
+"""
+from unittest import mock
+
+import pytest
+
+from modules import backend as backend_module
+from modules import entry_ids
+
+
+@pytest.fixture(autouse=True)
+def _no_backoff():
+    with mock.patch.object(backend_module.time, "sleep", lambda s: None):
+        yield
+
+
+def entry(i, activity="💪 Sport"):
+    return {"id": entry_ids.new_id(), "timestamp": f"2024-01-{i % 28 + 1:02d} 10:00:00",
+            "activity_type": activity, "metrica": i}
+
+
+def metrics(backend):
+    return sorted(backend.load_data()["metrica"])
+
+
+def interleave(repo, method, other):
+    """Alla prima chiamata di repo.<method> scrive prima un'altra sessione (other())."""
+    real = getattr(repo, method)
+    state = {"done": False}
+
+    def wrapper(*args, **kwargs):
+        if not state["done"]:
+            state["done"] = True
+            other()
+        return real(*args, **kwargs)
+    return mock.patch.object(repo, method, wrapper)
+
+
+def test_duplicates_in_batch_and_across_sessions(make_backend):
+    first, second = entry(1), entry(2)
+    assert make_backend().append_entries([first, first, second]) == [first, second]
+    # Doppio invio da un'altra sessione: niente da scrivere
+    assert make_backend().append_entries([second, first]) == []
+    assert metrics(make_backend()) == [1, 2]
+
+
+def test_entries_without_id_are_deduplicated_by_content(make_backend):
+    plain = {"timestamp": "2024-01-01 10:00:00", "activity_type": "💪 Sport", "metrica": 7}
+    assert len(make_backend().append_entries([plain])) == 1
+    assert make_backend().append_entries([dict(plain)]) == []
+    assert make_backend().count_entries() == 1
+
+
+def test_retry_after_lost_response(repo, make_backend):
+    backend = make_backend()
+    backend.append_entries([entry(0)])
+    batch = [entry(1), entry(2)]
+    real = repo.update_file
+
+    def lost_response(*args, **kwargs):
+        # Il commit arriva a GitHub ma la risposta si perde
+        real(*args, **kwargs)
+        raise ConnectionError("timeout")
+    with mock.patch.object(repo, "update_file", lost_response), pytest.raises(ConnectionError):
+        backend.append_entries(batch)
+
+    # La coda di scrittura riprova lo stesso batch
+    assert make_backend().append_entries(batch) == []
+    assert metrics(make_backend()) == [0, 1, 2]
+
+
+def test_retry_against_sealed_chunks(make_backend):
+    with mock.patch.object(backend_module, "CHUNK_SIZE", 3):
+        batch = [entry(i) for i in range(7)]
+        make_backend().append_entries(batch)
+        # I primi sei sono in due chunk sigillati: li riconosce l'indice ids.enc
+        new = entry(7)
+        assert make_backend().append_entries(batch + [new]) == [new]
+        assert metrics(make_backend()) == list(range(8))
+
+
+def test_update_conflict_merges(repo, make_backend):
+    make_backend().append_entries([entry(0)])
+    ours, theirs = entry(1), entry(2)
+    with interleave(repo, "update_file", lambda: make_backend().append_entries([theirs])):
+        assert make_backend().append_entries([ours]) == [ours]
+    assert metrics(make_backend()) == [0, 1, 2]
+
+
+def test_update_conflict_with_same_entry(repo, make_backend):
+    make_backend().append_entries([entry(0)])
+    same = entry(1)
+    with interleave(repo, "update_file", lambda: make_backend().append_entries([same])):
+        # L'altra sessione l'ha già scritta: dopo il 409 non resta niente da aggiungere
+        assert make_backend().append_entries([same]) == []
+    assert metrics(make_backend()) == [0, 1]
+
+
+def test_create_conflict_merges(repo, make_backend):
+    ours, theirs = entry(1), entry(2)
+    # Storia vuota: entrambe le sessioni creano il manifest, la seconda riceve 422
+    with interleave(repo, "create_file", lambda: make_backend().append_entries([theirs])):
+        assert make_backend().append_entries([ours]) == [ours]
+    assert metrics(make_backend()) == [1, 2]
+
+
+def test_conflicts_give_up_after_max_retries(repo, make_backend):
+    backend = make_backend()
+    backend.append_entries([entry(0)])
+    conflict = backend_module.GithubException(409, {"message": "conflict"}, {})
+    with mock.patch.object(repo, "update_file", side_effect=conflict), \
+            pytest.raises(backend_module.GithubException):
+        backend.append_entries([entry(1)])
+    assert metrics(make_backend()) == [0]
+
+
+def test_sealed_digests_merged_once_per_index(make_backend):
+    with mock.patch.object(backend_module, "CHUNK_SIZE", 3):
+        batch = [entry(i) for i in range(10)]
+        make_backend().append_entries(batch)
+        backend = make_backend()
+        manifest, _ = backend._read_manifest()
+        index, sealed, _, changed = backend._read_id_index(manifest)
+        assert not changed and len(index) == 3
+        assert sealed == entry_ids.entry_digests(batch[:9])
+        # Stesso ids.enc: il set unico viene dalla cache, non si ricalcola
+        assert backend._read_id_index(manifest)[1] is sealed
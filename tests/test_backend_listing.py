@@ -0,0 +1,45 @@
+"""
+Cartelle oltre il limite del listing della contents API: manifest, coda e
+metadati escono dal listing e si leggono per path.
+
+Uso:  python -m pytest tests
+"""
+from unittest import mock
+
+import pytest
+
+from modules import backend as backend_module
+from conftest import USERNAME
+
+
+@pytest.fixture
+def small_limits(repo):
+    # 2 entry per chunk e listing di 3 file: bastano poche entry per superarlo
+    repo.listing_limit = 3
+    with mock.patch.object(backend_module, "CHUNK_SIZE", 2), \
+            mock.patch.object(backend_module, "LISTING_LIMIT", 3):
+        yield
+
+
+def entry(i):
+    return {"timestamp": f"2024-01-{i + 1:02d} 10:00:00", "activity_type": "💪 Sport", "metrica": i}
+
+
+def test_history_beyond_listing_limit(repo, make_backend, small_limits):
+    for i in range(0, 9, 3):
+        make_backend().append_entries([entry(i), entry(i + 1), entry(i + 2)])
+    listing = {item.path for item in repo.get_contents(f"data_{USERNAME}")}
+    # Il listing si ferma ai primi chunk: manifest, coda e ids.enc non ci sono
+    assert len(listing) == 3 and all("chunk_" in p for p in listing)
+
+    backend = make_backend()
+    backend.prefetch()
+    assert not backend._listing_complete
+    frame = backend.load_data()
+    assert sorted(frame["metrica"]) == list(range(9))
+    assert make_backend().count_entries() == 9
+
+    # Append sulla coda (fuori dal listing) e dedup sui chunk sigillati
+    extra = make_backend()
+    assert len(extra.append_entries([entry(9), *frame.head(2).to_dict("records")])) == 1
+    assert len(make_backend().load_data()) == 10
@@ -0,0 +1,46 @@
+"""
+Id delle entry: l'id di contenuto delle entry storiche resta lo stesso dopo
+lo schema tipizzato, e la migrazione lo salva come id vero.
+
+Uso:  python -m pytest tests
+"""
+from modules import entry_ids, schema
+
+LEGACY = [
+    {"timestamp": "2023-03-01 10:00:00", "activity_type": "📚 Lettura", "dettaglio": "Dune",
+     "metrica": 20, "unita": "pagine", "is_valid": True, "pagine_totali": 300},
+    {"timestamp": "2023-03-02", "activity_type": "💪 Sport", "dettaglio": "Corsa", "metrica": 5.1, "note": ""},
+    {"timestamp": "2023-03-03 07:30:00", "activity_type": "💪 Sport", "dettaglio": "Corsa", "metrica": 5.0},
+]
+
+
+def test_content_id_survives_typed_schema():
+    frame = schema.from_records(LEGACY)
+    assert list(schema.row_ids(frame)) == [entry_ids.entry_id(e) for e in LEGACY]
+
+
+def test_content_id_normalizes_values():
+    base = {"timestamp": "2023-03-01 10:00:00", "activity_type": "💪 Sport", "metrica": 20}
+    same = {**base, "metrica": 20.0, "note": "", "is_valid": False, "unita": None}
+    assert entry_ids.content_id(base) == entry_ids.content_id(same)
+    assert entry_ids.content_id(base) != entry_ids.content_id({**base, "metrica": 21})
+
+
+def test_stored_id_wins_and_nan_is_ignored():
+    assert entry_ids.entry_id({"id": "01ABC", "metrica": 1}) == "01ABC"
+    assert entry_ids.entry_id({"id": float("nan"), **LEGACY[2]}) == entry_ids.content_id(LEGACY[2])
+
+
+def test_legacy_history_gets_ids_and_can_be_deleted(make_backend):
+    backend = make_backend()
+    backend._write_file(backend.legacy_path, LEGACY, None, "Legacy")
+    # Il primo salvataggio migra il file unico: ogni entry riceve un id salvato
+    backend.append_entries([{"timestamp": "2023-03-04 09:00:00", "activity_type": "💪 Sport", "metrica": 3}])
+    frame = make_backend().load_data()
+    assert frame["id"].notna().all()
+    assert set(frame["id"]) >= {entry_ids.content_id(e) for e in LEGACY}
+
+    # Come il tab Dati: l'id viene dalla riga tipizzata
+    target = schema.row_ids(frame)[frame["dettaglio"] == "Dune"].iloc[0]
+    assert make_backend().delete_entry(target)
+    assert len(make_backend().load_data()) == len(LEGACY)
@@ -0,0 +1,43 @@
+"""
+Suggerimenti calcolati su snapshot tipizzati (activity_type categorico), come
+quelli che l'app ottiene dopo filtri, eliminazioni e schema.concat.
+
+Uso:  python -m pytest tests
+"""
+import os
+import sys
+import warnings
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import schema  # noqa: E402
+from modules.intelligence import SuggestionEngine  # noqa: E402
+
+NOW = datetime(2024, 5, 10, 21, 0)
+
+
+def snapshot():
+    frame = schema.from_records([
+        {"timestamp": "2024-05-09 20:00:00", "activity_type": "📚 Lettura", "dettaglio": "Dune", "metrica": 30},
+        {"timestamp": "2024-01-02 08:00:00", "activity_type": "💪 Sport", "dettaglio": "Corsa", "metrica": 5},
+        {"timestamp": "2023-06-01 08:00:00", "activity_type": "🧘 Meditazione", "metrica": 10},
+    ])
+    # Come row_mask: le categorie delle attività escluse restano nel dtype
+    return frame[frame["timestamp"] >= "2024-01-01"]
+
+
+def test_filtered_categorical_snapshot():
+    df = snapshot()
+    assert "🧘 Meditazione" in df["activity_type"].cat.categories
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        prompts = SuggestionEngine(df, now=NOW).get_prompts()
+    ids = {p["id"] for p in prompts}
+    assert ids == {"read_cont", "sport_check"}
+    assert next(p for p in prompts if p["id"] == "read_cont")["dettaglio"] == "Dune"
+
+
+def test_concat_of_filtered_snapshots():
+    df = schema.concat([snapshot(), snapshot().iloc[0:0]])
+    prompts = SuggestionEngine(df, now=NOW).get_prompts()
+    assert "read_cont" in {p["id"] for p in prompts}
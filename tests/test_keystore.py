@@ -0,0 +1,65 @@
+"""
+Keyring: cambiare password ri-avvolge la data key (i dati già cifrati restano
+leggibili) e la vecchia password non apre più il keyring.
+
+Uso:  python -m pytest tests
+"""
+import pytest
+from cryptography.fernet import InvalidToken
+
+from modules import keystore
+from modules.crypto_utils import CURRENT_KDF_VERSION, DEFAULT_SALT, DataCipher, derive_key
+from modules.sqlite_backend import SQLiteStorage
+
+USERNAME = "test"
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return SQLiteStorage(str(tmp_path / "data.db"))
+
+
+def test_change_password_rewraps_data_key(storage):
+    keystore.initialize(storage, USERNAME, "vecchia")
+    cipher, salt = keystore.unlock(storage, USERNAME, "vecchia")
+    token = cipher.encrypt(b"entry")
+
+    new_cipher, new_salt, _ = keystore.change_password(storage, USERNAME, "vecchia", "nuova")
+    assert new_salt != salt
+    # Stessa data key: niente da ricifrare
+    assert new_cipher.decrypt(token) == b"entry"
+    assert keystore.unlock(storage, USERNAME, "nuova")[0].decrypt(token) == b"entry"
+    with pytest.raises(InvalidToken):
+        keystore.unlock(storage, USERNAME, "vecchia")
+    with pytest.raises(InvalidToken):
+        keystore.open_current(storage, USERNAME, "vecchia")
+
+
+def test_change_password_with_wrong_old_password(storage):
+    keystore.initialize(storage, USERNAME, "vecchia")
+    keyring, version = keystore.load_keyring(storage, USERNAME)
+    with pytest.raises(InvalidToken):
+        keystore.change_password(storage, USERNAME, "sbagliata", "nuova")
+    # Il keyring non è stato toccato
+    assert keystore.load_keyring(storage, USERNAME) == (keyring, version)
+
+
+def test_rollback_restores_old_password(storage):
+    keystore.initialize(storage, USERNAME, "vecchia")
+    _, _, rollback = keystore.change_password(storage, USERNAME, "vecchia", "nuova")
+    rollback()
+    assert keystore.unlock(storage, USERNAME, "vecchia")
+    with pytest.raises(InvalidToken):
+        keystore.unlock(storage, USERNAME, "nuova")
+
+
+def test_legacy_user_keeps_reading_old_data(storage):
+    # Dati scritti prima del keyring: chiave derivata dalla password con il salt statico
+    token = DataCipher([derive_key("vecchia", DEFAULT_SALT)]).encrypt(b"storico")
+    cipher, _ = keystore.unlock(storage, USERNAME, "vecchia")
+    assert cipher.decrypt(token) == b"storico"
+
+    # La chiave legacy segue la data key anche dopo il cambio password
+    cipher, _, _ = keystore.change_password(storage, USERNAME, "vecchia", "nuova")
+    assert cipher.decrypt(token) == b"storico"
+    assert keystore.load_keyring(storage, USERNAME)[0]["kdf"] == CURRENT_KDF_VERSION
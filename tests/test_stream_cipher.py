@@ -0,0 +1,176 @@
+"""
+Formato a frame (stream_cipher): round trip e rilevamento di blob alterati,
+troncati o con frame riordinati.
+
+Uso:  python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+from cryptography.fernet import Fernet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import stream_cipher  # noqa: E402
+from modules.crypto_utils import DataCipher, encrypt_bytes, open_decrypted  # noqa: E402
+from modules.stream_cipher import HEADER_SIZE, TAG_SIZE, StreamError  # noqa: E402
+
+# Frame piccoli: bastano pochi byte per avere blob con molti frame
+FRAME = 16
+
+
+@pytest.fixture
+def key():
+    return stream_cipher.derive_stream_key(Fernet.generate_key())
+
+
+@pytest.fixture
+def keys(key):
+    return {stream_cipher.key_id(key): key}
+
+
+def decrypt(blob, keys, piece=None):
+    """Testo in chiaro di un blob; con `piece` l'input arriva a pezzi di quella dimensione."""
+    source = blob if piece is None else [blob[i:i + piece] for i in range(0, len(blob), piece)]
+    return b"".join(stream_cipher.decrypt(source, keys))
+
+
+def frames(blob, frame_size=FRAME):
+    """(header, lista dei frame cifrati) di un blob."""
+    size = frame_size + TAG_SIZE
+    body = blob[HEADER_SIZE:]
+    return blob[:HEADER_SIZE], [body[i:i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize("algorithm", sorted(stream_cipher.ALGORITHM_IDS))
+@pytest.mark.parametrize("length", [0, 1, FRAME - 1, FRAME, FRAME + 1, 3 * FRAME, 3 * FRAME + 5])
+def test_round_trip(key, keys, algorithm, length):
+    data = os.urandom(length)
+    blob = stream_cipher.encrypt(data, key, algorithm=algorithm, frame_size=FRAME)
+    assert stream_cipher.is_stream(blob)
+    # Anche un payload vuoto (o multiplo esatto del frame) ha un solo frame finale
+    assert len(frames(blob)[1]) == max(1, -(-length // FRAME))
+    assert decrypt(blob, keys) == data
+
+
+@pytest.mark.parametrize("piece", [1, 7, FRAME + TAG_SIZE, FRAME + TAG_SIZE + 1, 1000])
+def test_pieces_of_any_size(key, keys, piece):
+    data = os.urandom(5 * FRAME + 3)
+    blob = stream_cipher.encrypt(data, key, frame_size=FRAME)
+    assert decrypt(blob, keys, piece) == data
+
+
+def test_default_frame_size_boundaries(key, keys):
+    # Con FRAME_SIZE il blob intero viene letto a fette grandi quanto un frame
+    for length in (stream_cipher.FRAME_SIZE, 2 * stream_cipher.FRAME_SIZE, 2 * stream_cipher.FRAME_SIZE + 1):
+        data = os.urandom(length)
+        assert decrypt(stream_cipher.encrypt(data, key), keys) == data
+
+
+def test_same_payload_different_blobs(key):
+    data = b"x" * (2 * FRAME)
+    assert stream_cipher.encrypt(data, key, frame_size=FRAME) != stream_cipher.encrypt(data, key, frame_size=FRAME)
+
+
+def test_unknown_key(key):
+    blob = stream_cipher.encrypt(b"dati", key, frame_size=FRAME)
+    other = stream_cipher.derive_stream_key(Fernet.generate_key())
+    with pytest.raises(StreamError, match="chiave"):
+        decrypt(blob, {stream_cipher.key_id(other): other})
+
+
+def test_wrong_key_with_same_id(key):
+    blob = stream_cipher.encrypt(b"dati", key, frame_size=FRAME)
+    other = stream_cipher.derive_stream_key(Fernet.generate_key())
+    with pytest.raises(StreamError):
+        decrypt(blob, {stream_cipher.key_id(key): other})
+
+
+@pytest.mark.parametrize("position", [
+    0,                                  # magic
+    len(stream_cipher.MAGIC) + 3,       # id chiave
+    HEADER_SIZE - 20,                   # salt
+    HEADER_SIZE - 1,                    # prefisso nonce
+    HEADER_SIZE,                        # primo frame
+    HEADER_SIZE + FRAME + 3,            # tag del primo frame
+    -1,                                 # tag dell'ultimo frame
+])
+def test_tampered_byte(key, keys, position):
+    blob = bytearray(stream_cipher.encrypt(os.urandom(3 * FRAME), key, frame_size=FRAME))
+    blob[position] ^= 0x01
+    with pytest.raises(StreamError):
+        decrypt(bytes(blob), keys)
+
+
+def test_tampered_frame_size(key, keys):
+    blob = bytearray(stream_cipher.encrypt(os.urandom(3 * FRAME), key, frame_size=FRAME))
+    # Il frame size è nell'header: cambiarlo sposta i confini dei frame
+    blob[HEADER_SIZE - 24] += 1
+    with pytest.raises(StreamError):
+        decrypt(bytes(blob), keys)
+
+
+@pytest.mark.parametrize("cut", [1, TAG_SIZE, FRAME + TAG_SIZE, FRAME + TAG_SIZE + 1])
+def test_truncated(key, keys, cut):
+    blob = stream_cipher.encrypt(os.urandom(3 * FRAME), key, frame_size=FRAME)
+    with pytest.raises(StreamError):
+        decrypt(blob[:-cut], keys)
+
+
+def test_truncated_at_frame_boundary(key, keys):
+    # Togliere l'ultimo frame lascia frame interi: lo scopre il flag dell'ultimo frame
+    blob = stream_cipher.encrypt(os.urandom(3 * FRAME), key, frame_size=FRAME)
+    header, parts = frames(blob)
+    with pytest.raises(StreamError):
+        decrypt(header + b"".join(parts[:-1]), keys)
+
+
+@pytest.mark.parametrize("length", [0, HEADER_SIZE - 1, HEADER_SIZE])
+def test_truncated_header(key, keys, length):
+    blob = stream_cipher.encrypt(b"dati", key, frame_size=FRAME)
+    with pytest.raises(StreamError):
+        decrypt(blob[:length], keys)
+
+
+def test_reordered_frames(key, keys):
+    blob = stream_cipher.encrypt(os.urandom(3 * FRAME), key, frame_size=FRAME)
+    header, parts = frames(blob)
+    with pytest.raises(StreamError):
+        decrypt(header + parts[1] + parts[0] + parts[2], keys)
+
+
+def test_frame_appended_after_final(key, keys):
+    blob = stream_cipher.encrypt(os.urandom(2 * FRAME), key, frame_size=FRAME)
+    _, parts = frames(blob)
+    with pytest.raises(StreamError):
+        decrypt(blob + parts[-1], keys)
+
+
+def test_frame_from_another_blob(key, keys):
+    # Stessa chiave, salt diverso: il frame di un altro blob non si autentica
+    first = stream_cipher.encrypt(os.urandom(2 * FRAME), key, frame_size=FRAME)
+    second = stream_cipher.encrypt(os.urandom(2 * FRAME), key, frame_size=FRAME)
+    header, parts = frames(first)
+    with pytest.raises(StreamError):
+        decrypt(header + frames(second)[1][0] + parts[1], keys)
+
+
+def test_errors_are_raised_lazily_after_valid_frames(key, keys):
+    # I frame autentici prima di quello alterato arrivano al parser; l'errore arriva dopo
+    blob = bytearray(stream_cipher.encrypt(os.urandom(3 * FRAME), key, frame_size=FRAME))
+    blob[-1] ^= 0x01
+    pieces = stream_cipher.decrypt(bytes(blob), keys)
+    assert len(next(pieces)) == FRAME
+    with pytest.raises(StreamError):
+        list(pieces)
+
+
+def test_data_cipher_round_trip_and_rotation():
+    old, new = Fernet.generate_key(), Fernet.generate_key()
+    data = os.urandom(3 * stream_cipher.FRAME_SIZE + 11)
+    blob = encrypt_bytes(data, DataCipher([old]))
+    assert stream_cipher.is_stream(blob)
+    # Dopo una rotazione la chiave vecchia decifra ancora (è la seconda del DataCipher)
+    assert open_decrypted(blob, DataCipher([new, old])).read() == data
+    with pytest.raises(StreamError):
+        open_decrypted(blob, DataCipher([new])).read()
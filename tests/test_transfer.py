@@ -0,0 +1,57 @@
+"""
+Export e import: reimportare un export non duplica niente, anche per le
+entry storiche senza id salvato.
+
+Uso:  python -m pytest tests
+"""
+import io
+
+from modules import transfer
+
+LEGACY = [
+    {"timestamp": "2023-03-01 10:00:00", "activity_type": "📚 Lettura", "dettaglio": "Dune",
+     "metrica": 20, "unita": "pagine", "pagine_totali": 300},
+    {"timestamp": "2023-03-02 08:00:00", "activity_type": "💪 Sport", "dettaglio": "Corsa", "metrica": 5.5},
+    {"timestamp": "2023-03-03 07:30:00", "activity_type": "💪 Sport", "dettaglio": "Corsa", "metrica": 5},
+]
+
+
+def export_text(backend) -> str:
+    return transfer.export_csv(backend.iter_frames()).read().decode("utf-8")
+
+
+def test_round_trip_of_legacy_history_imports_nothing(make_backend):
+    backend = make_backend()
+    backend._write_file(backend.legacy_path, LEGACY, None, "Legacy")
+    # Export prima della migrazione (nessun id salvato) e dopo
+    before = export_text(make_backend())
+    make_backend().append_entries([{"timestamp": "2023-03-04 09:00:00", "activity_type": "💪 Sport", "metrica": 3}])
+    after = export_text(make_backend())
+
+    for text, rows in ((before, 3), (after, 4)):
+        report = transfer.import_csv(io.StringIO(text), make_backend())
+        assert report["rows"] == rows
+        assert report["rejected"] == 0
+        assert report["imported"] == 0
+        assert report["duplicates"] == rows
+    assert make_backend().count_entries() == 4
+
+
+def test_import_into_empty_history(make_backend):
+    source = make_backend("source")
+    source.append_entries(LEGACY)
+    report = transfer.import_csv(io.StringIO(export_text(source)), make_backend("copy"))
+    assert report["imported"] == len(LEGACY)
+    assert make_backend("copy").count_entries() == len(LEGACY)
+
+
+def test_integer_fields_are_not_truncated(make_backend):
+    text = ("timestamp,activity_type,dettaglio,metrica,pagine_totali\n"
+            "2023-03-01 10:00:00,📚 Lettura,Dune,20,300\n"
+            "2023-03-02 10:00:00,📚 Lettura,Dune,20,300.0\n"
+            "2023-03-03 10:00:00,📚 Lettura,Dune,20,300.5\n"
+            "2023-03-04 10:00:00,📚 Lettura,Dune,20,trecento\n")
+    report = transfer.import_csv(io.StringIO(text), make_backend())
+    assert (report["imported"], report["rejected"]) == (2, 2)
+    assert report["errors"] == [(4, "pagine_totali non intero (300.5)"), (5, "pagine_totali non valido (trecento)")]
+    assert list(make_backend().load_data()["pagine_totali"]) == [300, 300]
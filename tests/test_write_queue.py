@@ -0,0 +1,106 @@
+"""
+Coda write-behind: le entry in attesa sopravvivono a un crash nello spool e
+tornano con recover, senza duplicati anche se erano già state scritte.
+
+Uso:  python -m pytest tests
+"""
+import atexit
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+
+from modules import entry_ids
+from modules.crypto_utils import DataCipher
+from modules.write_queue import WriteBehindQueue
+from conftest import USERNAME
+
+
+@pytest.fixture
+def make_queue(make_backend, tmp_path):
+    """make_queue(): una coda (un processo) sullo stesso spool; la finestra lunga evita flush automatici."""
+    queues = []
+
+    def factory():
+        queue = WriteBehindQueue(lambda username, cipher: make_backend(username), str(tmp_path / "spool"),
+                                 window=3600)
+        queues.append(queue)
+        return queue
+    yield factory
+    for queue in queues:
+        crash(queue)
+
+
+def crash(queue):
+    """Ferma il worker senza flush, come un processo che muore."""
+    atexit.unregister(queue.close)
+    with queue._cond:
+        queue._stopped = True
+        queue._cond.notify()
+    queue._thread.join()
+
+
+def entry(i):
+    return {"id": entry_ids.new_id(), "timestamp": f"2024-01-{i + 1:02d} 10:00:00",
+            "activity_type": "💪 Sport", "metrica": i}
+
+
+def spool_path(queue):
+    return os.path.join(queue.spool_dir, f"spool_{USERNAME}.log")
+
+
+def test_flush_writes_batch_and_clears_spool(make_queue, make_backend, cipher):
+    queue = make_queue()
+    for i in range(3):
+        queue.enqueue(USERNAME, cipher, entry(i))
+    assert queue.pending_count(USERNAME) == 3
+    queue.flush(USERNAME)
+    assert queue.pending_count(USERNAME) == 0
+    assert not os.path.exists(spool_path(queue))
+    assert make_backend().count_entries() == 3
+
+
+def test_spool_replay_after_crash(make_queue, make_backend, cipher):
+    queue = make_queue()
+    batch = [entry(i) for i in range(3)]
+    for e in batch:
+        queue.enqueue(USERNAME, cipher, e)
+    crash(queue)
+    assert make_backend().count_entries() == 0
+
+    # Login successivo in un nuovo processo
+    restarted = make_queue()
+    restarted.recover(USERNAME, cipher)
+    assert restarted.pending_entries(USERNAME) == batch
+    restarted.flush(USERNAME)
+    assert sorted(make_backend().load_data()["id"]) == sorted(e["id"] for e in batch)
+    assert not os.path.exists(spool_path(restarted))
+
+
+def test_replay_of_already_written_batch(make_queue, make_backend, cipher):
+    queue = make_queue()
+    batch = [entry(i) for i in range(3)]
+    for e in batch:
+        queue.enqueue(USERNAME, cipher, e)
+    # Crash dopo il commit ma prima di svuotare lo spool
+    make_backend().append_entries(batch[:2])
+    crash(queue)
+
+    restarted = make_queue()
+    restarted.recover(USERNAME, cipher)
+    restarted.flush(USERNAME)
+    assert make_backend().count_entries() == 3
+
+
+def test_spool_unreadable_with_other_key(make_queue, cipher):
+    queue = make_queue()
+    queue.enqueue(USERNAME, cipher, entry(0))
+    crash(queue)
+
+    restarted = make_queue()
+    restarted.recover(USERNAME, DataCipher([Fernet.generate_key()]))
+    # Niente da rimettere in coda, ma lo spool resta per la chiave giusta
+    assert restarted.pending_count(USERNAME) == 0
+    assert os.path.exists(spool_path(restarted))
+    restarted.recover(USERNAME, cipher)
+    assert restarted.pending_count(USERNAME) == 1